@@ -0,0 +1,72 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Travis Test file:
+Test that the HTTP client keeps sessions and statistics for a limited number of hosts only.
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tools import httpclient
+
+
+class HttpClientTest(unittest.TestCase):
+    def setUp(self):
+        self.client = httpclient.HttpClient(max_hosts=2)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_least_recently_used_session_is_closed(self):
+        first = self.client._getSession("http://one.example")
+        second = self.client._getSession("http://two.example")
+        self.assertIs(self.client._getSession("http://one.example"), first)  # Now used more recently than two.
+
+        with mock.patch.object(second, "close") as close_second, mock.patch.object(first, "close") as close_first:
+            third = self.client._getSession("http://three.example")
+
+        close_second.assert_called_once_with()
+        close_first.assert_not_called()
+        self.assertEqual(list(self.client.sessions), ["http://one.example", "http://three.example"])
+        self.assertIs(self.client.sessions["http://three.example"], third)
+        self.assertIsNot(self.client._getSession("http://two.example"), second)
+
+    def test_least_recently_used_host_statistics_are_dropped(self):
+        self.client._measure("one.example", 0.5, False)
+        self.client._measure("two.example", 1.0, True)
+        self.client._measure("one.example", 0.25, False)
+        self.client._measure("three.example", 2.0, False)
+
+        stats = self.client.getStats()
+        self.assertEqual(sorted(stats), ["one.example", "three.example"])
+        self.assertEqual(stats["one.example"][httpclient.REQUESTS], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Travis Test file:
+Test that a user is told when the worker pool refuses their command.
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from core import module
+
+
+class FakeModule:
+    module_name = "fake"
+
+    def on_command(self, target, nick, command, commandtext, mod, admin):
+        return True
+
+
+class RefusedCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = mock.Mock(network_name="EsperNet")
+        self.conn.engine.workers.submit.return_value = False  # The worker pool is full.
+        self.handler = module.ModuleHandler(self.conn)
+        self.hook = FakeModule().on_command
+        self.args = ("#channel", "Nick", "weather", "London", False, False)
+
+    def test_refused_command_is_noticed(self):
+        self.handler._submitCommand(self.hook, "weather", self.args)
+
+        self.conn.notice.assert_called_once_with(
+            "Nick", "I am too busy to handle 'weather' right now, please try again later.")
+
+    def test_refused_fallback_is_noticed_once_every_module_refused(self):
+        self.handler._submitCommand(self.hook, "weather", self.args, [FakeModule().on_command])
+
+        self.assertEqual(self.conn.engine.workers.submit.call_count, 2)
+        self.assertEqual(self.conn.notice.call_count, 1)
+
+    def test_busy_notices_are_limited_per_nick(self):
+        self.handler._submitCommand(self.hook, "weather", self.args)
+        self.handler._submitCommand(self.hook, "weather", self.args)
+        self.handler._submitCommand(self.hook, "weather", ("#channel", "Other") + self.args[2:])
+
+        self.assertEqual([call[0][0] for call in self.conn.notice.call_args_list], ["Nick", "Other"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Travis Test file:
+Test that the ratelimiter waits for enough tokens to send all the lines of a batch.
+"""
+
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from core import ratelimit
+
+
+class FakeEngine:
+    def __init__(self, loop):
+        self.loop = loop
+
+
+class FakeConnection:
+    def __init__(self, loop):
+        self.engine = FakeEngine(loop)
+        self.ratelimiter = None
+        self.written = []  # ([lines], tokens left before they were written)
+
+    def getPrefix(self):
+        return ":Reconcile!reconcile@example.com"
+
+    def _write(self, lines):
+        # _send takes the tokens before it writes, add them back to see what the bucket held.
+        self.written.append((lines, self.ratelimiter.tokens + len(lines)))
+
+
+class RatelimitTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.conn = FakeConnection(self.loop)
+        self.conn.ratelimiter = self.ratelimiter = ratelimit.Ratelimit(self.conn, None, burstlimit=5, rate=20.0)
+
+    def tearDown(self):
+        self.ratelimiter.task.cancel()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+
+    def run_until_written(self, count, timeout=2.0):
+        async def wait():
+            deadline = time.monotonic() + timeout
+            while len(self.conn.written) < count and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+
+        self.loop.run_until_complete(wait())
+        self.assertEqual(len(self.conn.written), count)
+
+    def test_batch_waits_for_a_token_per_line(self):
+        self.ratelimiter.tokens = 0.5
+        self.ratelimiter.last_refill = time.monotonic()
+        self.ratelimiter.start()
+
+        self.ratelimiter.queue("PRIVMSG #channel :" + "word " * 150, ratelimit.PRIORITY_REPLY, "#channel")
+        self.run_until_written(1)
+
+        lines, tokens = self.conn.written[0]
+        self.assertGreater(len(lines), 1)
+        self.assertGreaterEqual(tokens, len(lines))
+        self.assertGreaterEqual(self.ratelimiter.tokens, 0)
+
+    def test_batch_larger_than_bucket_waits_for_a_full_bucket(self):
+        self.ratelimiter.tokens = 0.5
+        self.ratelimiter.last_refill = time.monotonic()
+        self.ratelimiter.start()
+
+        self.ratelimiter.queue("PRIVMSG #channel :" + "word " * 600, ratelimit.PRIORITY_REPLY, "#channel")
+        self.run_until_written(1)
+
+        lines, tokens = self.conn.written[0]
+        self.assertGreater(len(lines), self.ratelimiter.burstlimit)
+        self.assertGreaterEqual(tokens, self.ratelimiter.burstlimit)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Travis Test file:
+Test that a rehash applies changes to the authentication settings, including the values derived from them.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from core import config
+from core import engine
+from core import irc
+from core import module
+
+
+class RehashTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="reconcile-test-")
+        self.path = os.path.join(self.directory, "config.json")
+
+        with open(os.path.join(ROOT, "config.example.json")) as f:
+            self.settings = json.load(f)
+
+        self.settings["metadata"].update({"db_dir": os.path.join(self.directory, "db"), "log_to_file": False})
+        self.network = self.settings["irc"]["EsperNet"]
+        self.network.update({"nick": "Reconcile", "account": "Reconcile", "password": "old"})
+        self.write()
+
+        self.conf = config.Config(self.path)
+        self.engine = engine.Engine(self.conf)
+        self.engine.loop = asyncio.new_event_loop()
+        self.engine.thread_ident = threading.get_ident()
+
+        self.conn = irc.IrcConnection(self.conf.getNetwork("EsperNet"), self.conf, self.engine)
+        self.conn.loadNetworkVariables()
+        self.conn.ModuleHandler = module.ModuleHandler(self.conn)  # No modules, only the settings matter here.
+
+    def tearDown(self):
+        self.engine.loop.close()
+        shutil.rmtree(self.directory, True)
+
+    def write(self):
+        with open(self.path, "w") as f:
+            json.dump(self.settings, f)
+
+    def rehash(self):
+        self.write()
+        changes = self.conf.rehash()
+        self.assertIsNotNone(changes)
+        self.conn.applyConfig(changes)
+        return changes
+
+    def test_password_changes_auth_string(self):
+        self.assertIn("old", self.conn._auth_string)
+
+        self.network["password"] = "new"
+        self.assertEqual(self.rehash()["networks"]["EsperNet"], {"password"})
+
+        self.assertEqual(self.conn.password, "new")
+        self.assertEqual(self.conn._auth_string,
+                         "PRIVMSG NickServ@services.esper.net :IDENTIFY Reconcile new")
+
+    def test_removed_password_disables_sasl(self):
+        self.network["sasl"] = "PLAIN"
+        self.rehash()
+        self.assertEqual(self.conn.sasl, "PLAIN")
+
+        self.network["password"] = ""
+        self.assertEqual(self.rehash()["networks"]["EsperNet"], {"password"})
+
+        self.assertFalse(self.conn.sasl)
+        self.assertFalse(self.conn._auth_string)
+
+
+if __name__ == "__main__":
+    unittest.main()
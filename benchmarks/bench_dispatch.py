@@ -0,0 +1,134 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Benchmark: the cost of dispatching an event to the loaded modules, as modules are added.
+
+Usage: python benchmarks/bench_dispatch.py [iterations]
+
+Every tenth module overrides on_privmsg and every twentieth on_join, one module handles numerics; the rest only
+register commands, like most of the modules we ship. The broadcast approach calls every module's hook for every
+event, the ModuleHandler only calls the modules that override it.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import ircmessage
+from core import module
+from core import moduletemplate
+
+
+class FakeConnection:
+    logger = None
+    network_name = "Benchmark"
+
+    class config:
+        @staticmethod
+        def getDatabaseDir():
+            return "db"
+
+        @staticmethod
+        def getModuleData(name):
+            return None
+
+
+class CommandModule(moduletemplate.BotModule):
+    def on_command(self, target, nick, command, commandtext, mod, admin):
+        return False
+
+
+class PrivmsgModule(CommandModule):
+    def on_privmsg(self, target, nick, message):
+        pass
+
+
+class JoinModule(CommandModule):
+    def on_join(self, nick, channel):
+        pass
+
+
+class NumericModule(CommandModule):
+    def on_numeric(self, numeric, data):
+        pass
+
+
+def create_handler(count):
+    handler = module.ModuleHandler(FakeConnection)
+
+    for i in range(count):
+        if i == 0:
+            cls = NumericModule
+        elif i % 20 == 0:
+            cls = JoinModule
+        elif i % 10 == 0:
+            cls = PrivmsgModule
+        else:
+            cls = CommandModule
+
+        name = "module{}.py".format(i)
+        handler.modules[name] = cls(FakeConnection, None, name)
+
+    handler._rebuildSubscribers()
+    return handler
+
+
+def broadcast(handler, message):
+    """How ModuleHandler dispatched events before it indexed hooks."""
+    for name in handler.modules:
+        handler.modules[name].on_privmsg("#channel", "nick", "hello")
+    for name in handler.modules:
+        handler.modules[name].on_join("nick", "#channel")
+    for name in handler.modules:
+        handler.modules[name].on_numeric(354, message)
+
+
+def indexed(handler, message):
+    handler.sendPrivmsg("#channel", "nick", "hello")
+    handler.sendJoin("nick", "#channel")
+    handler.sendNumeric(354, message)
+
+
+def run(iterations, counts=(1, 5, 10, 20, 40, 80)):
+    message = ircmessage.parse(":irc.example.net 354 Reconcile 001 #channel ~user host nick H@ 0 :Real Name")
+
+    print("{:>8} {:>16} {:>16}".format("modules", "broadcast", "indexed"))
+
+    for count in counts:
+        handler = create_handler(count)
+        results = []
+
+        for func in (broadcast, indexed):
+            start = time.perf_counter()
+            for i in range(iterations):
+                func(handler, message)
+            # Three events per iteration.
+            results.append((time.perf_counter() - start) / (iterations * 3) * 1000000)
+
+        print("{:>8} {:>11.2f} usec {:>11.2f} usec".format(count, results[0], results[1]))
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,423 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Benchmark: the bot end to end, connected to an IRC server running in the same process (see fakeircd.py).
+
+Usage: python benchmarks/bench_e2e.py [scenario ...] [--save NAME] [--compare NAME]
+                                      [--network NAME] [--flood-burst N] [--flood-rate N] [--caps]
+
+Scenarios (all of them run if none are named):
+  join_storm     2,000 users join the channel of the bot at once.
+  who_5000       the bot is joined to a channel of 5,000 users and reads the WHO reply for it.
+  url_flood      200 messages with a URL each, the titles are fetched from a fake web server.
+  command_burst  500 users each send !ping at once.
+  netsplit       2,000 users of a channel quit in a netsplit and join again once it is over.
+
+For each scenario we report the lines per second the bot processed, the p50 and p99 latency of its replies
+(counted from the moment the burst was sent) and the peak memory use of the process. --save stores the results
+in benchmarks/baselines/NAME.json, --compare shows how the results differ from a saved baseline.
+
+The bot is set up from config.example.json, or the file given with --config (the first network in it unless --network
+is given), with the server replaced by the fake one, a nick of its own, #bench as its only channel and a temporary
+database directory. The ratelimiter lets everything through unless --flood-burst and --flood-rate say otherwise,
+which shows how replies queue up under a flood. With --caps the server offers the IRCv3 capabilities the bot asks
+for, instead of leaving it to fall back on WHO, and the bot identifies using SASL PLAIN.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import fakeircd
+from core import config
+from core import engine
+from core import irc
+from core import netsplit
+
+
+BASELINE_DIR = os.path.join(ROOT, "benchmarks", "baselines")
+CONFIG_TEMPLATE = "config.example.json"
+REPLY_TIMEOUT = 10  # Seconds we wait for a reply that has not arrived, after the last one that did.
+SETTLE_TIME = 0.2  # Seconds the bot has to be quiet before we consider it done with a scenario.
+UNLIMITED = 1000000
+
+METRICS = (("lines_per_sec", "lines/sec", True), ("p50_ms", "p50 ms", False), ("p99_ms", "p99 ms", False),
+           ("maxrss_kb", "peak KB", False))  # key, heading, whether more is better.
+
+
+RESULT_KEYS = ("lines", "seconds", "lines_per_sec", "replies", "p50_ms", "p99_ms", "maxrss_kb")
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+
+    values = sorted(values)
+    return values[int(round(percent / 100 * (len(values) - 1)))]
+
+
+def maxrss():
+    """The peak resident memory of the process in KB, None if we cannot tell."""
+    if not resource:
+        return None
+
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage // 1024 if sys.platform == "darwin" else usage  # macOS reports bytes.
+
+
+def result(lines, seconds, latencies=None, **extra):
+    data = {
+        "lines": lines,
+        "seconds": round(seconds, 4),
+        "lines_per_sec": round(lines / seconds, 1) if seconds else None,
+        "replies": len(latencies) if latencies is not None else None,
+        "p50_ms": None,
+        "p99_ms": None,
+        "maxrss_kb": maxrss()
+    }
+
+    if latencies:
+        data["p50_ms"] = round(percentile(latencies, 50) * 1000, 2)
+        data["p99_ms"] = round(percentile(latencies, 99) * 1000, 2)
+
+    data.update(extra)
+    return data
+
+
+async def settle(ircd):
+    """Wait until the bot stopped sending, and has processed everything we sent in reply."""
+    while True:
+        count = len(ircd.received)
+        await asyncio.sleep(SETTLE_TIME)
+        if len(ircd.received) == count:
+            break
+
+    await ircd.sync()
+
+
+async def collect(ircd, since, expected, pattern):
+    """
+    Wait for the replies matching pattern, returns the seconds each of them took since the burst was sent.
+
+    pattern: regex whose first group identifies the message that was replied to, only the first reply counts.
+    """
+
+    regex = re.compile(pattern)
+    seen = {}
+    index = 0
+    last = time.perf_counter()
+
+    while len(seen) < expected and time.perf_counter() - last < REPLY_TIMEOUT:
+        for received, command, target, text in ircd.replies(since)[index:]:
+            index += 1
+            match = regex.search(text)
+            if match and match.group(1) not in seen:
+                seen[match.group(1)] = received - since
+                last = time.perf_counter()
+
+        await asyncio.sleep(0.01)
+
+    return list(seen.values())
+
+
+async def joinStorm(ircd, conn, size=2000):
+    users = [ircd.addUser("joiner{}".format(i), ["#bench"]) for i in range(size)]
+    lines = [ircd.joinLine(user, "#bench") for user in users]
+    before = len(ircd.received)
+
+    start = time.perf_counter()
+    await ircd.sendLines(lines)
+    await ircd.sync()
+    seconds = time.perf_counter() - start
+
+    await settle(ircd)
+    who = sum(1 for received, line in ircd.received[before:] if line.startswith("WHO "))
+
+    return result(len(lines), seconds, who_sent=who, settled_seconds=round(time.perf_counter() - start, 4))
+
+
+async def who5000(ircd, conn, size=5000):
+    for i in range(size):
+        ircd.addUser("member{}".format(i), ["#big"], "@" if i % 100 == 0 else "+" if i % 10 == 0 else "")
+
+    start = time.perf_counter()
+    await ircd.forceJoin("#big")
+    await ircd.sync()
+    seconds = time.perf_counter() - start
+
+    if not conn.isOn("member{}".format(size - 1), "#big"):
+        raise Exception("The bot did not process the WHO reply of #big.")
+
+    await settle(ircd)
+    return result(size, seconds)
+
+
+async def urlFlood(ircd, conn, size=200, posters=20):
+    users = [ircd.addUser("poster{}".format(i), ["#bench"]) for i in range(posters)]
+    lines = [":{} PRIVMSG #bench :have a look at http://site{}.bench.example/page/{} please"
+             .format(users[i % posters].prefix(), i, i) for i in range(size)]
+
+    refused = conn.engine.workers.getStats()["refused"]
+
+    start = time.perf_counter()
+    await ircd.sendLines(lines)
+    await ircd.sync()
+    seconds = time.perf_counter() - start
+
+    # Messages the worker pool refuses (the module has too many lookups queued) go without a reply.
+    refused = conn.engine.workers.getStats()["refused"] - refused
+    latencies = await collect(ircd, start, size - refused, r"Page \S*/page/(\d+)")
+    await settle(ircd)
+    return result(len(lines), seconds, latencies, jobs_refused=refused)
+
+
+async def commandBurst(ircd, conn, size=500):
+    users = [ircd.addUser("caller{}".format(i), ["#bench"]) for i in range(size)]
+    lines = [":{} PRIVMSG #bench :{}ping".format(user.prefix(), conn.command_prefix) for user in users]
+
+    start = time.perf_counter()
+    await ircd.sendLines(lines)
+    await ircd.sync()
+    seconds = time.perf_counter() - start
+
+    latencies = await collect(ircd, start, size, r"^caller(\d+): ")
+    await settle(ircd)
+    return result(len(lines), seconds, latencies)
+
+
+async def netsplitStorm(ircd, conn, size=2000):
+    users = [ircd.addUser("splitter{}".format(i), ["#split"]) for i in range(size)]
+    await ircd.forceJoin("#split")
+    await settle(ircd)
+
+    lines = ircd.netsplitLines(users) + ircd.netjoinLines(users, "#split")
+    before = len(ircd.received)
+
+    start = time.perf_counter()
+    await ircd.sendLines(lines)
+    await ircd.sync()
+    seconds = time.perf_counter() - start
+
+    # Batches the server does not mark are only processed once they have been quiet for a moment.
+    await asyncio.sleep(netsplit.BATCH_DELAY)
+    await settle(ircd)
+
+    if not conn.isOn(users[-1].nick, "#split"):
+        raise Exception("The bot did not see the users of #split rejoin.")
+
+    who = sum(1 for received, line in ircd.received[before:] if line.startswith("WHO "))
+    return result(len(lines), seconds, who_sent=who)
+
+
+SCENARIOS = [
+    ("join_storm", joinStorm),
+    ("who_5000", who5000),
+    ("url_flood", urlFlood),
+    ("command_burst", commandBurst),
+    ("netsplit", netsplitStorm)
+]
+
+
+def configure(conf, network_name, port, database_dir, flood_burst, flood_rate):
+    """Point the network at the fake server, without touching the configuration file."""
+    network = conf.getNetwork(network_name)
+    if not network:
+        raise SystemExit("Network {} is not in {}.".format(network_name, conf.path))
+
+    network = dict(network)
+    network.update({
+        "nick": "Reconcile",
+        "altnick": "Reconcile_",
+        "user": "Reconcile",
+        "realname": "Reconcile benchmark",
+        "server": "127.0.0.1",
+        "port": port,
+        "ssl": False,
+        "ipv4": True,
+        "bindhost": None,
+        "znc": False,
+        "auth_string": False,
+        "sasl": False,
+        "ssl_cert": False,
+        "channels": ["#bench"],
+        "debug_chan": False,
+        "modes": None,
+        "perform": [],
+        "flood_burst": flood_burst,
+        "flood_rate": flood_rate,
+        "log_level": "notice",
+        "log_events": False
+    })
+
+    conf.networks[network_name] = network
+    conf.metadata["db_dir"] = database_dir
+    conf.metadata["log_to_file"] = False
+    return network
+
+
+async def benchmark(conf, bot_engine, network_name, scenarios, flood_burst, flood_rate, capabilities):
+    ircd = fakeircd.FakeIrcd(fakeircd.CAPABILITIES if capabilities else ())
+    httpd = fakeircd.FakeHttpd()
+    port = await ircd.start()
+    os.environ["http_proxy"] = "http://127.0.0.1:{}".format(await httpd.start())
+    os.environ.pop("no_proxy", None)
+
+    database_dir = tempfile.mkdtemp(prefix="reconcile-bench-")
+    network = configure(conf, network_name, port, database_dir, flood_burst, flood_rate)
+    if capabilities:
+        network.update({"account": "Reconcile", "password": "benchmark", "sasl": "PLAIN"})
+    bot_engine.events = asyncio.Queue()
+
+    conn = irc.IrcConnection(network, conf, bot_engine)
+    ircd.joined["#bench"] = asyncio.Event()
+    conn.start()
+
+    results = {}
+
+    try:
+        await asyncio.wait_for(ircd.joined["#bench"].wait(), 30)
+        await settle(ircd)
+
+        for name, func in scenarios:
+            results[name] = await func(ircd, conn)
+            print(format(name, results[name]))
+    finally:
+        if conn.connected:
+            conn.quit("Benchmark finished.")
+        await asyncio.wait([conn.task], timeout=10)
+        await ircd.stop()
+        await httpd.stop()
+        shutil.rmtree(database_dir, True)
+
+    return results
+
+
+def format(name, data):
+    text = "{:<14} {:>6} lines {:>8.3f} sec {:>10} lines/sec  replies {:>4}  p50 {:>8} ms  p99 {:>8} ms  peak {} KB" \
+        .format(name, data["lines"], data["seconds"], data["lines_per_sec"],
+                "-" if data["replies"] is None else data["replies"],
+                "-" if data["p50_ms"] is None else data["p50_ms"], "-" if data["p99_ms"] is None else data["p99_ms"],
+                "-" if data["maxrss_kb"] is None else data["maxrss_kb"])
+
+    extra = sorted(key for key in data if key not in RESULT_KEYS)
+    if extra:
+        text += "  ({})".format(", ".join("{}: {}".format(key, data[key]) for key in extra))
+
+    return text
+
+
+def save(name, results):
+    if not os.path.isdir(BASELINE_DIR):
+        os.mkdir(BASELINE_DIR)
+
+    path = os.path.join(BASELINE_DIR, name + ".json")
+    with open(path, "w") as f:
+        json.dump({"date": time.strftime("%Y-%m-%d %H:%M:%S"), "python": sys.version.split()[0],
+                   "results": results}, f, indent=2, sort_keys=True)
+
+    print("Saved baseline {}.".format(path))
+
+
+def compare(name, results):
+    path = os.path.join(BASELINE_DIR, name + ".json")
+    with open(path) as f:
+        baseline = json.load(f)
+
+    print("Compared to baseline {} ({}, Python {}):".format(name, baseline["date"], baseline["python"]))
+
+    for scenario, data in results.items():
+        if scenario not in baseline["results"]:
+            continue
+
+        for key, heading, higher_is_better in METRICS:
+            old = baseline["results"][scenario].get(key)
+            new = data.get(key)
+            if not old or new is None:
+                continue
+
+            change = (new - old) / old * 100
+            better = change > 0 if higher_is_better else change < 0
+            print("  {:<14} {:<10} {:>12} -> {:<12} {:>+7.1f}% {}".format(scenario, heading, old, new, change,
+                                                                          "better" if better else "worse"))
+
+
+def run(names=None, save_as=None, compare_to=None, network=None, flood_burst=UNLIMITED, flood_rate=UNLIMITED,
+        capabilities=False, config_path=CONFIG_TEMPLATE):
+    os.chdir(ROOT)  # The configuration and the modules are looked up relative to the working directory.
+
+    scenarios = [(name, func) for name, func in SCENARIOS if not names or name in names]
+    if not scenarios:
+        raise SystemExit("Unknown scenario, pick from: {}".format(", ".join(name for name, func in SCENARIOS)))
+
+    conf = config.Config(config_path)
+    bot_engine = engine.Engine(conf)
+    bot_engine.loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(bot_engine.loop)
+    bot_engine.thread_ident = threading.get_ident()
+
+    try:
+        results = bot_engine.loop.run_until_complete(
+            benchmark(conf, bot_engine, network or next(iter(conf.getNetworks())), scenarios, flood_burst,
+                      flood_rate, capabilities))
+    finally:
+        bot_engine.workers.shutdown(True)
+        bot_engine.loop.close()
+        conf.logger.flush(True)
+
+    if compare_to:
+        compare(compare_to, results)
+    if save_as:
+        save(save_as, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the bot against an in-process IRC server.")
+    parser.add_argument("scenarios", nargs="*", help="the scenarios to run, all of them by default")
+    parser.add_argument("--save", metavar="NAME", help="save the results as baseline NAME")
+    parser.add_argument("--compare", metavar="NAME", help="compare the results with baseline NAME")
+    parser.add_argument("--config", default=CONFIG_TEMPLATE, help="the configuration file to set the bot up from, "
+                        "{} by default".format(CONFIG_TEMPLATE))
+    parser.add_argument("--network", help="the network in the configuration to take the bot's settings from")
+    parser.add_argument("--flood-burst", type=int, default=UNLIMITED, help="lines the bot may send in one go")
+    parser.add_argument("--flood-rate", type=float, default=UNLIMITED, help="lines per second after the burst")
+    parser.add_argument("--caps", action="store_true", help="have the server offer the IRCv3 capabilities")
+    args = parser.parse_args()
+
+    run(args.scenarios, args.save, args.compare, args.network, args.flood_burst, args.flood_rate, args.caps,
+        args.config)
@@ -0,0 +1,110 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Benchmark: checking a hostmask against the administrator and moderator masks, as the amount of masks grows.
+
+Usage: python benchmarks/bench_hostmask.py [iterations]
+
+The legacy approach is what Config.isAdministrator() used to do for every command: validate and compile every
+configured mask on each call. The Matcher compiles all masks into one expression when the configuration is loaded,
+we time it both with its per-nick cache (the same user running commands) and without (a new user every time).
+A quarter of the masks are exact, the rest have wildcards. The hostmasks checked never match, the worst case.
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import hostmask
+from tools import validator
+
+
+def legacyMatch(address, mask):
+    """tools/hostmask.match() before it used a Matcher."""
+    valid = validator.Validator()
+
+    if valid.hostmask(address) and valid.hostmask(mask):
+        mh = re.escape(mask).replace(r"\*", ".*")
+
+        if re.match(mh, address):
+            return True
+
+    return False
+
+
+def legacy(masks, address):
+    for mask in masks:
+        if legacyMatch(address, mask):
+            return True
+    return False
+
+
+def createMasks(count):
+    masks = []
+
+    for i in range(count):
+        if i % 4 == 0:
+            masks.append("admin{}!~admin{}@staff{}.example.net".format(i, i, i))
+        elif i % 4 == 1:
+            masks.append("*!~user{}@*.isp{}.example.com".format(i, i))
+        elif i % 4 == 2:
+            masks.append("helper{}!*@*".format(i))
+        else:
+            masks.append("*!*@gateway/web/user{}-??".format(i))
+
+    return masks
+
+
+def timeIt(func, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter() - start) / iterations * 1000000
+
+
+def run(iterations, counts=(10, 100, 500, 1000)):
+    address = "somebody!~someone@host-{}.users.example.org"
+
+    print("{:>8} {:>16} {:>16} {:>16} {:>12}".format("masks", "legacy", "matcher", "cached", "compile"))
+
+    for count in counts:
+        masks = createMasks(count)
+
+        start = time.perf_counter()
+        matcher = hostmask.Matcher(masks)
+        compiled = (time.perf_counter() - start) * 1000
+
+        # The legacy approach is much slower, fewer iterations keep the run short.
+        results = [timeIt(lambda i: legacy(masks, address.format(i)), max(1, iterations // 100)),
+                   timeIt(lambda i: matcher.match(address.format(i)), iterations),
+                   timeIt(lambda i: matcher.match(address.format(0)), iterations)]
+
+        print("{:>8} {:>11.2f} usec {:>11.2f} usec {:>11.2f} usec {:>9.2f} ms".format(count, *(results + [compiled])))
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
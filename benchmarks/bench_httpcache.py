@@ -0,0 +1,128 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Benchmark: repeated module lookups against a slow HTTP API, with and without the HTTP cache.
+
+Usage: python benchmarks/bench_httpcache.py [lookups] [latency in ms]
+
+A local server answers every request after the given latency, like a remote API would. Lookups repeat a small set
+of popular queries (the same "weather london" or xkcd link, again and again) mixed with ones that are only asked once.
+The stale run expires every response right away, its lookups are answered from the cache while they are refreshed
+in the background. The last run saves the cache and loads it again, as happens across a restart.
+"""
+
+import http.server
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import httpcache
+
+
+class SlowHandler(http.server.BaseHTTPRequestHandler):
+    latency = 0.05
+    requests = 0
+
+    def do_GET(self):
+        SlowHandler.requests += 1
+        time.sleep(self.latency)
+
+        body = '{{"path": "{}"}}'.format(self.path).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SlowServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def startServer(latency):
+    SlowHandler.latency = latency
+    server = SlowServer(("127.0.0.1", 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:{}/".format(server.server_address[1])
+
+
+def queries(lookups):
+    """Two out of three lookups are for one of ten popular queries, the rest are all different."""
+    return ["popular{}".format(i % 10) if i % 3 else "once{}".format(i) for i in range(lookups)]
+
+
+def timeLookups(cache, url, lookups, ttl):
+    SlowHandler.requests = 0
+    start = time.perf_counter()
+
+    for query in queries(lookups):
+        response = cache.request("GET", url, ttl, params={"q": query}, source="Benchmark")
+        response.json()
+
+    return time.perf_counter() - start, SlowHandler.requests
+
+
+def run(lookups, latency):
+    server, url = startServer(latency)
+    path = os.path.join(tempfile.mkdtemp(), "httpcache.pickle")
+
+    print("{:>10} {:>12} {:>10} {:>8} {:>8} {:>8}".format("run", "total", "requests", "hits", "stale", "misses"))
+
+    runs = [("uncached", httpcache.HttpCache(), 0),
+            ("cached", httpcache.HttpCache(), 3600),
+            ("stale", httpcache.HttpCache(stale_time=3600), -1),
+            ("restarted", None, 3600)]
+
+    for name, cache, ttl in runs:
+        if name == "restarted":
+            saved = httpcache.HttpCache(file=path)
+            timeLookups(saved, url, lookups, ttl)
+            saved.save()
+            cache = httpcache.HttpCache(file=path)
+        elif ttl < 0:
+            # Fill the cache, then let every response expire so each hit is a stale one.
+            timeLookups(cache, url, lookups, 3600)
+            for entry in cache.entries.values():
+                entry[httpcache.EXPIRES] = 0
+            cache.hits = cache.misses = 0
+            ttl = 3600
+
+        elapsed, made = timeLookups(cache, url, lookups, ttl)
+        stats = cache.getStats()
+        print("{:>10} {:>9.1f} ms {:>10} {:>8} {:>8} {:>8}"
+              .format(name, elapsed * 1000, made, stats["hits"], stats["stale"], stats["misses"]))
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 300, (int(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000)
@@ -0,0 +1,116 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Benchmark: HTTP requests made with a new connection each time, and over the kept alive connections of HttpClient.
+
+Usage: python benchmarks/bench_httpclient.py [requests]
+
+A local HTTP/1.1 server answers every request right away and counts the connections it accepted. Bare requests.get
+(how modules and tools made their requests before) connects for every request; HttpClient reuses the connections
+of its pool. Against a remote API every connection also costs a DNS lookup, round trips and a TLS handshake, so
+the difference there is far larger than on localhost.
+"""
+
+import http.server
+import os
+import socketserver
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import httpclient
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep connections alive.
+    disable_nagle_algorithm = True  # Or the body waits for the ACK of the headers on a kept alive connection.
+    connections = 0
+    user_agents = set()
+
+    def setup(self):
+        Handler.connections += 1
+        super().setup()
+
+    def do_GET(self):
+        Handler.user_agents.add(self.headers.get("User-Agent"))
+        size = 10000 if self.path == "/large" else 100
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        self.wfile.write(b" " * size)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # The client drops the connection of a response that is too large.
+
+
+def timeRequests(get, url, count):
+    Handler.connections = 0
+    start = time.perf_counter()
+
+    for i in range(count):
+        get(url).raise_for_status()
+
+    return (time.perf_counter() - start) / count * 1000000, Handler.connections
+
+
+def run(count):
+    server = Server(("127.0.0.1", 0), Handler)
+    url = "http://127.0.0.1:{}/".format(server.server_address[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = httpclient.HttpClient(max_size=1000)
+
+    print("{:>12} {:>16} {:>12}".format("", "per request", "connections"))
+    for name, get in (("requests.get", requests.get), ("HttpClient", client.get)):
+        print("{:>12} {:>11.1f} usec {:>12}".format(name, *timeRequests(get, url, count)))
+
+    try:
+        client.get(url + "large")
+        print("A response over the maximum size was read.")
+    except httpclient.ResponseTooLarge:
+        pass
+
+    host, stats = next(iter(client.getStats().items()))
+    print("\n{}: {} requests, {} failed, {:.2f} ms on average, {:.2f} ms at most".format(host, *stats))
+    print("User agents seen: {}".format(", ".join(sorted(Handler.user_agents))))
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,102 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Benchmark: the ignore list check every incoming event goes through, as the list grows.
+
+Usage: python benchmarks/bench_ignorelist.py [iterations]
+
+The legacy IgnoreList compiled a regular expression for every wildcard entry on every check. The current one
+compiles the list once, we time it with a new hostmask every time and with the few hostmasks of a busy channel,
+which its LRU cache remembers. Half of the entries are exact, the rest have wildcards; nothing matches.
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import ignorelist
+
+
+class LegacyIgnoreList:
+    """IgnoreList.isIgnored() before the list was compiled."""
+
+    def __init__(self, entries):
+        self.ignorelist = entries
+
+    def isIgnored(self, target):
+        if target.lower() in self.ignorelist:
+            return True
+
+        for user in self.ignorelist:
+            if "*" in user:
+                if re.compile(re.escape(user).replace("\\*", ".*").replace("\\?", "."), re.I).match(target):
+                    return True
+
+        return False
+
+
+def createEntries(count):
+    entries = []
+
+    for i in range(count):
+        if i % 2 == 0:
+            entries.append("evader{}!~evader@host{}.example.net".format(i, i))
+        elif i % 4 == 1:
+            entries.append("*!*@*.proxy{}.example.com".format(i))
+        else:
+            entries.append("spam{}*!*@*".format(i))
+
+    return entries
+
+
+def timeIt(func, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter() - start) / iterations * 1000000
+
+
+def run(iterations, counts=(10, 100, 500, 1000)):
+    address = "chatter{}!~chatter@host-{}.users.example.org"
+
+    print("{:>8} {:>16} {:>16} {:>16}".format("entries", "legacy", "compiled", "cached"))
+
+    for count in counts:
+        entries = createEntries(count)
+        legacy = LegacyIgnoreList(entries)
+        compiled = ignorelist.IgnoreList(list(entries))
+
+        # The legacy list is much slower, fewer iterations keep the run short.
+        results = [timeIt(lambda i: legacy.isIgnored(address.format(i, i)), max(1, iterations // 100)),
+                   timeIt(lambda i: compiled.isIgnored(address.format(i, i)), iterations),
+                   timeIt(lambda i: compiled.isIgnored(address.format(i % 50, i % 50)), iterations)]
+
+        print("{:>8} {:>11.2f} usec {:>11.2f} usec {:>11.2f} usec".format(count, *results))
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,127 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Benchmark: replay a capture of raw IRC traffic through the LineBuffer.
+
+Usage: python benchmarks/bench_linebuffer.py [capture file] [chunk size]
+
+Without a capture file a synthetic burst is generated, resembling what the server sends after joining a large
+channel (NAMES, WHO replies, and chatter containing multibyte characters). The capture is cut into chunks the way
+recv(4096) would hand them to us, and replayed through both the old decode-and-split approach and the LineBuffer.
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import linebuffer
+
+
+def generate_capture(size=8 * 1024 * 1024):
+    """Generate roughly `size` bytes of server traffic."""
+    rand = random.Random(1459)
+    lines = []
+    length = 0
+
+    while length < size:
+        nick = "user{}".format(rand.randint(0, 50000))
+        kind = rand.randint(0, 9)
+
+        if kind < 4:
+            line = ":irc.example.net 354 Reconcile 001 #bigchannel ~{} host-{}.example.com {} H 0 :Real Name" \
+                   .format(nick, rand.randint(0, 9999), nick)
+        elif kind < 6:
+            names = " ".join("{}{}".format(rand.choice(["", "@", "+"]), "user{}".format(rand.randint(0, 50000)))
+                             for i in range(30))
+            line = ":irc.example.net 353 Reconcile = #bigchannel :{}".format(names)
+        elif kind < 9:
+            line = ":{}!~{}@host.example.com PRIVMSG #bigchannel :café naïve ☃ 日本 {}" \
+                   .format(nick, nick, rand.randint(0, 1 << 30))
+        else:
+            line = ":{}!~{}@host.example.com JOIN #bigchannel".format(nick, nick)
+
+        encoded = (line + "\r\n").encode("utf-8")
+        lines.append(encoded)
+        length += len(encoded)
+
+    return b"".join(lines)
+
+
+def chunk(capture, size):
+    return [capture[i:i + size] for i in range(0, len(capture), size)]
+
+
+def replay_legacy(chunks):
+    """The approach IrcConnection.readBuffer used to take, returns (lines, errors)."""
+    lines = 0
+    errors = 0
+
+    for buff in chunks:
+        try:
+            for data in buff.decode("utf-8").split("\n"):
+                if data.strip():
+                    lines += 1
+        except UnicodeDecodeError:
+            errors += 1
+
+    return lines, errors
+
+
+def replay_linebuffer(chunks):
+    buff = linebuffer.LineBuffer()
+    lines = 0
+
+    for data in chunks:
+        lines += len(buff.feedDecoded(data))
+
+    return lines, buff.getStats()["fallback_decoded"]
+
+
+def run(capture, chunk_size):
+    expected = capture.count(b"\n")
+    chunks = chunk(capture, chunk_size)
+
+    print("Capture: {:.2f} MB, {} lines, {} chunks of {} bytes."
+          .format(len(capture) / 1024 / 1024, expected, len(chunks), chunk_size))
+
+    for name, func in (("legacy", replay_legacy), ("linebuffer", replay_linebuffer)):
+        start = time.perf_counter()
+        lines, errors = func(chunks)
+        elapsed = time.perf_counter() - start
+
+        print("  {:<10} {:>10.0f} lines/sec, {:>8} lines seen ({} expected), {} decode errors"
+              .format(name, lines / elapsed, lines, expected, errors))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and os.path.isfile(sys.argv[1]):
+        with open(sys.argv[1], "rb") as f:
+            capture = f.read()
+    else:
+        capture = generate_capture()
+
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+    run(capture, chunk_size)
@@ -0,0 +1,135 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Benchmark: ircmessage.parse() against the split-and-regex approach IrcConnection used before.
+
+Usage: python benchmarks/bench_parser.py [iterations]
+
+Both paths extract the same information from each line: the nick, user and host of the sender, the command,
+the target and the message or parameters.
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import ircmessage
+from tools import validator
+
+
+LINES = [
+    ":nick!~user@host.example.com PRIVMSG #channel :Hello world, this is a fairly ordinary line of chatter.",
+    ":irc.example.net 354 Reconcile 001 #channel ~user host.example.com nick H@ account :Real Name",
+    ":irc.example.net 353 Reconcile = #channel :@op +voice user1 user2 user3 user4 user5 user6",
+    ":nick!~user@host.example.com JOIN #channel",
+    ":nick!~user@host.example.com QUIT :Quit: Leaving",
+    ":nick!~user@host.example.com MODE #channel +o othernick",
+    "@time=2015-03-01T12:00:00.000Z;account=nick :nick!~user@host.example.com PRIVMSG #channel :tagged line",
+    "PING :irc.example.net"
+]
+
+numeric_regex = re.compile(":.* [0-9]{3}")
+valid = validator.Validator()
+
+
+def legacy(data):
+    words = data.split()
+
+    if words[0] == "PING":
+        return words[1]
+
+    if numeric_regex.match(" ".join(words[:2])):
+        # on_numeric() split the line again to get at the parameters.
+        return int(words[1]), data.split()[3:]
+
+    if words[1] in ["PRIVMSG", "NOTICE", "MODE", "JOIN", "PART", "INVITE", "KICK", "QUIT"]:
+        uinfo = words[0][1:]
+        target = words[2]
+        params_list = words[3:] if len(words) > 3 else None
+
+        nick = uinfo.split("!")[0]
+        user = ""
+        host = ""
+        params = ""
+
+        if valid.hostmask(uinfo):
+            user = uinfo.split("@")[0][len(nick) + 1:]
+            host = uinfo.split("@")[1]
+
+        if params_list:
+            params = " ".join(params_list)
+            if params.startswith(":"):
+                params = params[1:]
+
+        if target.startswith(":"):
+            target = target[1:]
+
+        return nick, user, host, words[1], target, params
+
+
+def parsed(data):
+    message = ircmessage.parse(data)
+
+    if message.command == "PING":
+        return message.param(0)
+
+    if message.numeric is not None:
+        return message.numeric, message.params[1:]
+
+    return (message.nick, message.user, message.host, message.command, message.param(0),
+            " ".join(message.params[1:]))
+
+
+def run(iterations, repeat=200):
+    """
+    Report the best of `repeat` short runs, alternating between the two paths.
+
+    Long runs one after the other pick up whatever else the machine is doing, which easily swings the results
+    by more than the difference between the paths.
+    """
+    paths = (("legacy", legacy), ("ircmessage", parsed))
+    best = {}
+
+    for i in range(repeat):
+        for name, func in paths:
+            start = time.perf_counter()
+
+            for j in range(iterations):
+                for line in LINES:
+                    func(line)
+
+            elapsed = time.perf_counter() - start
+            if name not in best or elapsed < best[name]:
+                best[name] = elapsed
+
+    count = iterations * len(LINES)
+    for name, func in paths:
+        print("  {:<10} {:>10.0f} lines/sec ({:.2f} usec/line)"
+              .format(name, count / best[name], best[name] / count * 1000000))
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
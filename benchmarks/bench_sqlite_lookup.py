@@ -0,0 +1,101 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Benchmark: case insensitive lookups in the Tell, Seen and Factoid tables, before and after their indexes.
+
+Usage: python benchmarks/bench_sqlite_lookup.py [rows] [lookups]
+
+Fills each table with `rows` rows at the first schema version (no indexes), times the queries the modules used to
+run, migrates the database the way the modules do on load, and times the queries they run now. Half of the lookups
+are for nicks that are not in the table, like most has_tells checks when somebody joins a channel.
+The databases are created in a temporary directory and removed afterwards.
+"""
+
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import database
+from modules import factoid
+from modules import seen
+from modules import tell
+
+
+TABLES = [
+    # name, migrations, insert statement, row factory, legacy query, indexed query
+    ("tell", tell.MIGRATIONS,
+     "INSERT INTO tell VALUES (?, ?, ?, ?, ?)",
+     lambda i: ("Sender{}".format(i % 5000), "Nick{}".format(i), "message", "timestamp", "0"),
+     "SELECT timestamp FROM tell WHERE lower(recipient) = ?",
+     "SELECT timestamp FROM tell WHERE recipient = ? COLLATE NOCASE LIMIT 1"),
+    ("seen", seen.MIGRATIONS,
+     "INSERT INTO seen VALUES (?, ?, ?, ?, ?)",
+     lambda i: ("Nick{}".format(i), "user@host", "timestamp", str(i), "joining #channel"),
+     "SELECT * FROM seen WHERE lower(nick) = ?",
+     "SELECT * FROM seen WHERE nick = ? COLLATE NOCASE"),
+    ("factoids", factoid.MIGRATIONS,
+     "INSERT INTO factoids VALUES (?, ?, ?, ?, ?)",
+     lambda i: ("adder", "global", "timestamp", "nick{}".format(i), "response"),
+     "SELECT response FROM factoids WHERE factoid = ?",
+     "SELECT response FROM factoids WHERE factoid = ?")
+]
+
+
+def timeLookups(conn, query, keys):
+    start = time.perf_counter()
+    for key in keys:
+        conn.execute(query, [key]).fetchone()
+    return (time.perf_counter() - start) / len(keys) * 1000
+
+
+def run(rows, lookups):
+    directory = tempfile.mkdtemp()
+    print("{:>10} {:>10} {:>16} {:>16}".format("table", "rows", "before", "after"))
+
+    try:
+        for name, migrations, insert, row, legacy, indexed in TABLES:
+            conn = sqlite3.connect(os.path.join(directory, "{}.db".format(name)))
+            database.migrate(conn, migrations[:1])
+            conn.executemany(insert, (row(i) for i in range(rows)))
+            conn.commit()
+
+            keys = ["nick{}".format(random.randrange(rows * 2)) for i in range(lookups)]
+
+            before = timeLookups(conn, legacy, keys)
+            database.migrate(conn, migrations)
+            after = timeLookups(conn, indexed, keys)
+            conn.close()
+
+            print("{:>10} {:>10} {:>11.3f} msec {:>11.3f} msec".format(name, rows, before, after))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000, int(sys.argv[2]) if len(sys.argv) > 2 else 50)
@@ -0,0 +1,99 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Benchmark: database operations per second, with a connection per call against core.database.Database.
+
+Usage: python benchmarks/bench_sqlite_pool.py [operations]
+
+The workload looks like that of the Tell module: mostly lookups of a nick, every tenth operation stores a message.
+Before, every operation opened the database, ran its statement, committed when it wrote and closed it again.
+The Database keeps its connection (and the statements it prepared) open, in WAL mode.
+The databases are created in a temporary directory and removed afterwards.
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import database
+from modules import tell
+
+
+LOOKUP = "SELECT timestamp FROM tell WHERE recipient = ? COLLATE NOCASE LIMIT 1"
+STORE = "INSERT INTO tell (sender, recipient, message, timestamp, unix_timestamp) VALUES (?, ?, ?, ?, ?)"
+
+
+def connectPerCall(path, operations):
+    for i in range(operations):
+        conn = sqlite3.connect(path)
+        c = conn.cursor()
+
+        if i % 10 == 0:
+            c.execute(STORE, ["sender", "Nick{}".format(i), "message", "timestamp", "0"])
+            conn.commit()
+        else:
+            c.execute(LOOKUP, ["nick{}".format(i)]).fetchone()
+
+        conn.close()
+
+
+def pooled(path, operations):
+    db = database.Database(path)
+
+    for i in range(operations):
+        if i % 10 == 0:
+            with db.connection() as c:
+                c.execute(STORE, ["sender", "Nick{}".format(i), "message", "timestamp", "0"])
+        else:
+            db.execute(LOOKUP, ["nick{}".format(i)]).fetchone()
+
+    db.close()
+
+
+def run(operations):
+    directory = tempfile.mkdtemp()
+
+    try:
+        for name, func in (("connect per call", connectPerCall), ("Database", pooled)):
+            path = os.path.join(directory, "{}.db".format(func.__name__))
+
+            conn = sqlite3.connect(path)
+            database.migrate(conn, tell.MIGRATIONS)
+            conn.close()
+
+            start = time.perf_counter()
+            func(path, operations)
+            elapsed = time.perf_counter() - start
+
+            print("  {:<18} {:>10.0f} ops/sec".format(name, operations / elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,375 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+fakeircd.py
+A small IRC server to run the bot against in-process, for the end to end benchmarks (see bench_e2e.py).
+
+It implements just enough for the bot: registration, JOIN, NAMES, WHO (with the WHOX fields the bot asks for), PING
+and optionally the IRCv3 capabilities in CAPABILITIES, SASL PLAIN and EXTERNAL included (any credentials are accepted).
+Scenarios put users in channels and send the bot whatever lines they like, everything the bot sends is kept with
+the time it arrived so replies can be timed. FakeHttpd answers every request with a page whose title is the path
+that was asked for, run the bot with http_proxy pointing at it and modules that fetch titles never leave the machine.
+"""
+
+import asyncio
+import base64
+import itertools
+import time
+
+
+SERVER_NAME = "irc.bench.local"
+WRITE_CHUNK = 1000  # Lines to write before waiting for the bot to read them.
+NAMES_LENGTH = 400  # Bytes of names per RPL_NAMREPLY line.
+
+CAPABILITIES = ("multi-prefix", "extended-join", "account-notify", "account-tag", "away-notify", "chghost",
+                "userhost-in-names", "batch", "sasl")
+SASL_MECHANISMS = ("PLAIN", "EXTERNAL")
+
+# The order in which WHOX fields are sent, regardless of the order they were asked for in.
+WHOX_ORDER = "tcuihsnfdlaor"
+
+
+class User:
+    __slots__ = ("nick", "user", "host", "account", "realname")
+
+    def __init__(self, nick, user=None, host=None, account="0", realname="Benchmark user"):
+        self.nick = nick
+        self.user = user or "~" + nick[:9]
+        self.host = host or nick.lower() + ".users.bench.local"
+        self.account = account
+        self.realname = realname
+
+    def prefix(self):
+        return "{}!{}@{}".format(self.nick, self.user, self.host)
+
+
+class FakeIrcd:
+    def __init__(self, capabilities=()):
+        """capabilities: the IRCv3 capabilities to offer, of those in CAPABILITIES."""
+        self.offered = list(capabilities)
+        self.enabled = set()
+
+        self.server = None
+        self.port = None
+        self.reader = None
+        self.writer = None
+
+        self.bot = None  # The User of the bot once it has registered.
+        self.users = {}  # nick (lowercase): User
+        self.channels = {}  # channel (lowercase): {nick (lowercase): status prefix}
+
+        self.received = []  # (time.perf_counter(), line) of everything the bot sent.
+        self.registered = asyncio.Event()
+        self.joined = {}  # channel (lowercase): asyncio.Event, set once the bot has asked for its WHO.
+        self.pongs = {}  # token: asyncio.Future, resolved by the PONG of the bot.
+        self.tokens = itertools.count()
+        self.closed = asyncio.Event()
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Listen on host, a free port is picked unless port is given. Returns the port."""
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self.writer:
+            self.writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def addUser(self, nick, channels=(), status=""):
+        """Make a user known to the server and put them in channels, without telling the bot."""
+        user = self.users.get(nick.lower())
+        if not user:
+            user = self.users[nick.lower()] = User(nick)
+
+        for channel in channels:
+            self.channels.setdefault(channel.lower(), {})[nick.lower()] = status
+
+        return user
+
+    def send(self, line):
+        self.writer.write(line.encode("utf-8") + b"\r\n")
+
+    async def sendLines(self, lines):
+        """Send lines to the bot, waiting for it to read them every WRITE_CHUNK lines."""
+        for start in range(0, len(lines), WRITE_CHUNK):
+            self.writer.write("".join(line + "\r\n" for line in lines[start:start + WRITE_CHUNK]).encode("utf-8"))
+            await self.writer.drain()
+
+    async def sync(self, timeout=120):
+        """PING the bot and wait for its PONG, everything sent before it has been processed once this returns."""
+        token = "sync{}".format(next(self.tokens))
+        self.pongs[token] = asyncio.get_event_loop().create_future()
+        self.send("PING :" + token)
+        await self.writer.drain()
+        await asyncio.wait_for(self.pongs[token], timeout)
+
+    async def forceJoin(self, channel):
+        """
+        Join the bot to channel the way a server does on SAJOIN.
+
+        Returns once the bot requested the WHO of the channel, or right away if it reads NAMES instead.
+        """
+
+        self.join(channel)
+        await self.writer.drain()
+        await self.joined[channel.lower()].wait()
+
+    def joinLine(self, user, channel):
+        """The line that tells the bot user joined channel."""
+        if "extended-join" in self.enabled:
+            return ":{} JOIN {} {} :{}".format(user.prefix(), channel, user.account if user.account != "0" else "*",
+                                               user.realname)
+        return ":{} JOIN {}".format(user.prefix(), channel)
+
+    def netsplitLines(self, users, servers="hub.bench.local leaf.bench.local"):
+        """The lines that tell the bot users quit in a netsplit, in a BATCH if the bot enabled batch."""
+        lines = [":{} QUIT :{}".format(user.prefix(), servers) for user in users]
+        return self.batchLines("netsplit", servers, lines)
+
+    def netjoinLines(self, users, channel, servers="hub.bench.local leaf.bench.local"):
+        """The lines that tell the bot users rejoined channel after a netsplit."""
+        lines = [self.joinLine(user, channel) for user in users]
+        return self.batchLines("netjoin", servers, lines)
+
+    def batchLines(self, kind, servers, lines):
+        if "batch" not in self.enabled:
+            return lines
+
+        reference = "{}{}".format(kind, next(self.tokens))
+        return (["BATCH +{} {} {}".format(reference, kind, servers)] +
+                ["@batch={} {}".format(reference, line) for line in lines] +
+                ["BATCH -{}".format(reference)])
+
+    def join(self, channel):
+        """Join the bot to channel and send it the NAMES of it."""
+        self.joined.setdefault(channel.lower(), asyncio.Event())
+        members = self.channels.setdefault(channel.lower(), {})
+        members[self.bot.nick.lower()] = ""
+        self.send(self.joinLine(self.bot, channel))
+
+        names = []
+        for nick, status in members.items():
+            user = self.bot if nick == self.bot.nick.lower() else self.users[nick]
+            name = user.prefix() if "userhost-in-names" in self.enabled else user.nick
+            names.append((status if "multi-prefix" in self.enabled else status[:1]) + name)
+
+        line = []
+        for name in names:
+            line.append(name)
+            if sum(len(name) + 1 for name in line) > NAMES_LENGTH:
+                self.send(":{} 353 {} = {} :{}".format(SERVER_NAME, self.bot.nick, channel, " ".join(line)))
+                line = []
+        if line:
+            self.send(":{} 353 {} = {} :{}".format(SERVER_NAME, self.bot.nick, channel, " ".join(line)))
+        self.send(":{} 366 {} {} :End of /NAMES list.".format(SERVER_NAME, self.bot.nick, channel))
+
+        if "userhost-in-names" in self.enabled and "multi-prefix" in self.enabled:
+            self.joined[channel.lower()].set()  # The bot has all it needs, it will not WHO the channel.
+
+    def replies(self, since=0.0):
+        """Return (time, command, target, text) of every PRIVMSG and NOTICE the bot sent since the given time."""
+        found = []
+
+        for received, line in self.received:
+            if received < since:
+                continue
+
+            words = line.split(" ", 2)
+            if words[0] in ("PRIVMSG", "NOTICE") and len(words) == 3:
+                found.append((received, words[0], words[1], words[2][1:] if words[2][:1] == ":" else words[2]))
+
+        return found
+
+    async def handle(self, reader, writer):
+        if self.writer:  # One bot at a time.
+            writer.close()
+            return
+
+        self.reader = reader
+        self.writer = writer
+        nick = None
+        user = None
+        negotiating = False
+        mechanism = None  # The SASL mechanism the bot picked, while it is authenticating.
+
+        try:
+            while True:
+                data = await reader.readline()
+                if not data:
+                    break
+
+                line = data.decode("utf-8", "replace").rstrip("\r\n")
+                self.received.append((time.perf_counter(), line))
+
+                words = line.split(" ")
+                command = words[0].upper()
+
+                if command == "CAP":
+                    subcommand = words[1].upper() if len(words) > 1 else ""
+                    if subcommand == "LS":
+                        negotiating = True
+                        offered = [cap + "=" + ",".join(SASL_MECHANISMS) if cap == "sasl" else cap
+                                   for cap in self.offered]
+                        self.send(":{} CAP * LS :{}".format(SERVER_NAME, " ".join(offered)))
+                    elif subcommand == "REQ":
+                        requested = " ".join(words[2:]).lstrip(":").split()
+                        if all(cap in self.offered for cap in requested):
+                            self.enabled.update(requested)
+                            self.send(":{} CAP * ACK :{}".format(SERVER_NAME, " ".join(requested)))
+                        else:
+                            self.send(":{} CAP * NAK :{}".format(SERVER_NAME, " ".join(requested)))
+                    elif subcommand == "END":
+                        negotiating = False
+                        if nick and user:
+                            self.register(nick, user)
+                elif command == "AUTHENTICATE" and "sasl" in self.enabled:
+                    mechanism = self.authenticate(nick or "*", words[1], mechanism)
+                elif command == "NICK":
+                    nick = words[1].lstrip(":")
+                elif command == "USER" and nick:
+                    user = words[1]
+                    if not negotiating:
+                        self.register(nick, user)
+                elif command == "PING":
+                    self.send(":{} PONG {} {}".format(SERVER_NAME, SERVER_NAME, words[-1]))
+                elif command == "PONG":
+                    future = self.pongs.pop(words[-1].lstrip(":"), None)
+                    if future and not future.done():
+                        future.set_result(None)
+                elif command == "JOIN":
+                    for channel in words[1].lstrip(":").split(","):
+                        self.join(channel)
+                elif command == "WHO":
+                    self.who(words[1], words[2] if len(words) > 2 else "")
+                elif command == "QUIT":
+                    break
+        except (OSError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+            self.closed.set()
+
+    def authenticate(self, nick, argument, mechanism):
+        """Handle an AUTHENTICATE from the bot, returns the mechanism that is in progress (None once done)."""
+        if mechanism is None:
+            if argument.upper() not in SASL_MECHANISMS:
+                self.send(":{} 908 {} {} :are available SASL mechanisms".format(SERVER_NAME, nick,
+                                                                                ",".join(SASL_MECHANISMS)))
+                self.send(":{} 904 {} :SASL authentication failed".format(SERVER_NAME, nick))
+                return None
+
+            self.send("AUTHENTICATE +")
+            return argument.upper()
+
+        account = nick
+        if mechanism == "PLAIN":
+            try:
+                account = base64.b64decode(argument).split(b"\0")[1].decode("utf-8")
+            except (ValueError, IndexError):
+                self.send(":{} 904 {} :SASL authentication failed".format(SERVER_NAME, nick))
+                return None
+
+        self.send(":{0} 900 {1} {1}!*@* {2} :You are now logged in as {2}".format(SERVER_NAME, nick, account))
+        self.send(":{} 903 {} :SASL authentication successful".format(SERVER_NAME, nick))
+        return None
+
+    def register(self, nick, user):
+        self.bot = User(nick, "~" + user)
+
+        for numeric, text in (("001", ":Welcome to the benchmark network " + self.bot.nick),
+                              ("005", "WHOX NETWORK=Benchmark CHANTYPES=# PREFIX=(ov)@+ :are supported"),
+                              ("376", ":End of /MOTD command.")):
+            self.send(":{} {} {} {}".format(SERVER_NAME, numeric, self.bot.nick, text))
+
+        self.registered.set()
+
+    def who(self, mask, options):
+        """Answer a WHO, with 354 replies if WHOX fields were asked for and 352 replies otherwise."""
+        fields, sep, token = options.lstrip("%").partition(",")
+        channel = mask.lower() if mask.startswith("#") else None
+
+        if channel:
+            members = self.channels.get(channel, {})
+            lines = [self.whoLine(self.bot if nick == self.bot.nick.lower() else self.users[nick], mask, status,
+                                  fields, token) for nick, status in members.items()]
+        else:
+            user = self.users.get(mask.lower()) or (self.bot if mask.lower() == self.bot.nick.lower() else None)
+            lines = [self.whoLine(user, "*", "", fields, token)] if user else []
+
+        self.writer.write("".join(line + "\r\n" for line in lines).encode("utf-8"))
+        self.send(":{} 315 {} {} :End of /WHO list.".format(SERVER_NAME, self.bot.nick, mask))
+
+        if channel in self.joined:
+            self.joined[channel].set()
+
+    def whoLine(self, user, channel, status, fields, token):
+        if not fields:
+            return ":{} 352 {} {} {} {} {} {} H{} :0 {}".format(SERVER_NAME, self.bot.nick, channel, user.user,
+                                                                user.host, SERVER_NAME, user.nick, status,
+                                                                user.realname)
+
+        values = {"t": token, "c": channel, "u": user.user, "i": "255.255.255.255", "h": user.host,
+                  "s": SERVER_NAME, "n": user.nick, "f": "H" + status, "d": "0", "l": "0", "a": user.account,
+                  "o": "0", "r": ":" + user.realname}
+        params = [values[field] for field in WHOX_ORDER if field in fields]
+
+        return ":{} 354 {} {}".format(SERVER_NAME, self.bot.nick, " ".join(params))
+
+
+class FakeHttpd:
+    """Answers every request with a small HTML page titled after the requested URL, also when used as a proxy."""
+
+    def __init__(self):
+        self.server = None
+        self.port = None
+        self.requests = 0
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            request = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()).strip():
+                pass  # Headers
+
+            self.requests += 1
+            path = request[1] if len(request) > 1 else "/"
+            body = "<html><head><title>Page {}</title></head><body></body></html>".format(path).encode("utf-8")
+
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\nContent-Length: " +
+                         str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+        except OSError:
+            pass
+        finally:
+            writer.close()
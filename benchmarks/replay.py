@@ -0,0 +1,251 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+Replay a structured event log through IrcConnection.processEvent() and the modules that are loaded.
+
+Usage: python benchmarks/replay.py events.jsonl [--network NAME] [--speed N] [--profile]
+
+Event logs are written by the logger with log_events enabled (see Logger.record()). The connection is set up from
+config.json the way the bot sets it up, modules included, but it never connects: what the bot sends is counted by
+a fake socket, and the ratelimiter lets everything through at once. Blocking module hooks still run on the worker
+pool, so modules that look up things on the web will do so; disable them in the configuration for an offline run.
+
+--speed 0 (the default) replays as fast as possible, 1 in real time and 10 at ten times the original pace.
+--profile runs the replay under cProfile and prints the functions the most time was spent in.
+"""
+
+import argparse
+import asyncio
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from core import config
+from core import engine
+from core import irc
+from core import ircmessage
+from core import ratelimit
+
+
+YIELD_EVERY = 100  # Events to process before the ratelimiter and writer tasks get a turn.
+UNLIMITED = float("inf")
+
+
+class FakeSocket:
+    """Takes the place of the StreamWriter of the connection, it counts what would have been sent."""
+
+    def __init__(self):
+        self.lines = 0
+        self.bytes = 0
+
+    def write(self, data):
+        self.lines += data.count(b"\r\n")
+        self.bytes += len(data)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def escapeTagValue(value):
+    return (value.replace("\\", "\\\\").replace(";", "\\:").replace(" ", "\\s")
+            .replace("\r", "\\r").replace("\n", "\\n"))
+
+
+def toLine(record):
+    """Turn a recorded event back into the line the server sent."""
+    prefix = record["nick"]
+    if record.get("user") and record.get("host"):
+        prefix = "{}!{}@{}".format(prefix, record["user"], record["host"])
+
+    params = [record["target"]] + record["params"]
+    line = ":{} {} {}:{}".format(prefix, record["event"], "".join(param + " " for param in params[:-1]), params[-1])
+
+    if record.get("tags"):
+        line = "@{} {}".format(";".join(key if value is None or value is True else
+                                        "{}={}".format(key, escapeTagValue(str(value)))
+                                        for key, value in record["tags"].items()), line)
+
+    return line
+
+
+def readRecords(path, network=None):
+    records = []
+
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+
+            record = json.loads(line)
+            if network is None or record["network"] == network:
+                records.append(record)
+
+    return records
+
+
+def createConnection(conf, network_name, bot_engine):
+    network = conf.getNetwork(network_name)
+    if not network:
+        raise SystemExit("Network {} is not in config.json.".format(network_name))
+
+    conn = irc.IrcConnection(network, conf, bot_engine)
+    conn.loadNetworkVariables()
+    conn.logger.events = False  # Do not record the replay itself.
+    conn._loadModules()
+
+    conn.outqueue = asyncio.Queue()
+    conn.writer = FakeSocket()
+    conn.ratelimiter = ratelimit.Ratelimit(conn, conn.logger, UNLIMITED, UNLIMITED)
+    conn.ratelimiter.start()
+    conn.currentnick = conn.mnick
+    conn.connected = True
+
+    return conn
+
+
+async def drain(conn, bot_engine):
+    """Wait until the worker pool is idle and everything queued has been written."""
+    while True:
+        if bot_engine.workers.getStats()["queued"]:
+            await asyncio.sleep(0.01)
+        elif conn.ratelimiter.queued or not conn.outqueue.empty():
+            await asyncio.sleep(0)
+        else:
+            return
+
+
+async def replay(conn, bot_engine, records, speed, profiler):
+    timings = {}  # event: [count, total seconds, max seconds]
+    errors = 0
+    writer = bot_engine.loop.create_task(conn.writeBuffer())
+
+    first = records[0]["timestamp"]
+    start = time.perf_counter()
+
+    for index, record in enumerate(records):
+        if speed:
+            delay = (record["timestamp"] - first) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif index % YIELD_EVERY == 0:
+            await asyncio.sleep(0)
+
+        message = ircmessage.parse(toLine(record))
+
+        if profiler:
+            profiler.enable()
+        began = time.perf_counter()
+
+        try:
+            conn.processEvent(message)
+        except Exception:
+            errors += 1
+            if errors == 1:
+                traceback.print_exc()
+
+        took = time.perf_counter() - began
+        if profiler:
+            profiler.disable()
+
+        timing = timings.setdefault(record["event"], [0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += took
+        if took > timing[2]:
+            timing[2] = took
+
+    processed = time.perf_counter() - start
+    await drain(conn, bot_engine)
+    elapsed = time.perf_counter() - start
+
+    conn.ModuleHandler.unloadAll()
+    conn.ratelimiter.stop()
+    writer.cancel()
+
+    return timings, errors, processed, elapsed
+
+
+def report(records, timings, errors, processed, elapsed, conn, bot_engine):
+    print("Replayed {} events in {:.2f} seconds ({:.0f} events/sec), {:.2f} seconds including the replies."
+          .format(len(records), processed, len(records) / processed if processed else 0, elapsed))
+    print("{:>10} {:>10} {:>14} {:>14}".format("event", "count", "avg", "max"))
+
+    for event, (count, total, most) in sorted(timings.items(), key=lambda item: -item[1][1]):
+        average = total / count * 1000000
+        print("{:>10} {:>10} {:>9.1f} usec {:>9.1f} usec".format(event, count, average, most * 1000000))
+
+    stats = bot_engine.workers.getStats()
+    print("Sent {} lines ({} bytes), {} worker jobs ({} refused, {} failed), {} events raised an exception."
+          .format(conn.writer.lines, conn.writer.bytes, stats["jobs"], stats["refused"], stats["failed"], errors))
+
+
+def run(path, network=None, speed=0, profile=False):
+    os.chdir(ROOT)  # config.json, the modules and the databases are looked up relative to the working directory.
+
+    records = readRecords(path, network)
+    if not records:
+        raise SystemExit("No events to replay in {}.".format(path))
+
+    conf = config.Config()
+    bot_engine = engine.Engine(conf)
+    bot_engine.loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(bot_engine.loop)
+    bot_engine.thread_ident = threading.get_ident()
+    bot_engine.events = asyncio.Queue()
+
+    profiler = cProfile.Profile() if profile else None
+
+    try:
+        conn = createConnection(conf, network or records[0]["network"], bot_engine)
+        results = bot_engine.loop.run_until_complete(replay(conn, bot_engine, records, speed, profiler))
+    finally:
+        bot_engine.workers.shutdown(True)
+        bot_engine.loop.close()
+        conf.logger.flush(True)
+
+    report(records, *results, conn=conn, bot_engine=bot_engine)
+
+    if profiler:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a structured event log through the bot, offline.")
+    parser.add_argument("path", help="the .jsonl event log to replay")
+    parser.add_argument("--network", help="only replay the events of this network")
+    parser.add_argument("--speed", type=float, default=0, help="pace relative to the original, 0 for no pauses")
+    parser.add_argument("--profile", action="store_true", help="profile the event handling with cProfile")
+    args = parser.parse_args()
+
+    run(args.path, args.network, args.speed, args.profile)
@@ -28,16 +28,15 @@ Once your bot is configured, running this file will start it up.
 import sys
 
 
-if sys.version_info.major < 3:  # We will fail to import core if we're not on python 3, check this first.
-    print("Error: You require python 3 or higher, currently on python {}.{}"
+if sys.version_info < (3, 5):  # We will fail to import core if we're not on python 3.5, check this first.
+    print("Error: You require python 3.5 or higher, currently on python {}.{}"
           .format(sys.version_info.major, sys.version_info.minor))
     sys.exit(1)
 
 
 from core import config
-from core import irc
+from core import engine
 
-import time
 import os
 
 
@@ -59,37 +58,7 @@ f = open("ircbot.pid", "w")
 f.write(str(os.getpid()))
 f.close()
 
-irc_connections = {}
-running = True
-
-for network in conf.getNetworks().items():
-    irc_connections[network[0]] = irc.IrcConnection(network[1], conf)
-
 try:
-    while running:
-        time.sleep(1)
-        runningThreads = 0
-        shutdownRequested = False
-
-        for connection in irc_connections.items():
-            running = connection[1].isRunning()
-            shutdownRequested = shutdownRequested or connection[1].shutdownRequested
-            if running:
-                runningThreads += 1
-
-        if runningThreads == 0:
-            conf.logger.log("No more connections remain, stopping script.")
-            running = False
-        if shutdownRequested:
-            conf.logger.log("Shutdown requested.")
-            for connection in irc_connections.items():
-                if connection[1].connected:
-                    connection[1].quit("Shutting down...")
-                    connection[1].shutdownRequested = False  # to prevent this from running twice.
-except KeyboardInterrupt:
-    conf.logger.log("Shutdown requested by console.")
-    for connection in irc_connections.items():
-        if connection[1].connected:
-            connection[1].quit("Shutting down...")
-
-os.remove("ircbot.pid")  # Remove pid file as it is no longer running.
+    engine.Engine(conf).run()
+finally:
+    os.remove("ircbot.pid")  # Remove pid file as it is no longer running.
@@ -25,8 +25,15 @@ ChannelManager.py
 Manage which channels to join for each network.
 """
 
-import sqlite3
+from core import database
+
 import os
+import sqlite3
+
+
+MIGRATIONS = [
+    ["CREATE TABLE IF NOT EXISTS channels (channel TEXT UNIQUE PRIMARY KEY)"]
+]
 
 
 class ChannelManager:
@@ -46,6 +53,7 @@ class ChannelManager:
 
         self.db_dir = db_dir
         self.network_name = network_name
+        self.databases = {}  # network name: Database
 
         if self.network_name:
             self.makeNetworkDB()
@@ -57,15 +65,10 @@ class ChannelManager:
         channels = []
 
         try:
-            conn = sqlite3.connect(self.formatDBFileName(network_name))
-            c = conn.cursor()
-            c.execute("CREATE TABLE IF NOT EXISTS channels (channel TEXT UNIQUE PRIMARY KEY)")
-            result = c.execute("SELECT * FROM channels")
+            result = self.getDatabase(network_name).execute("SELECT * FROM channels")
 
             for row in result.fetchall():
                 channels.append(row[0])
-
-            conn.close()
         except sqlite3.Error as e:
             self.logger.error("Failed to retrieve channels for {}:\n{}".format(network_name, str(e)))
 
@@ -80,13 +83,8 @@ class ChannelManager:
                             .format(channel, network_name))
 
         try:
-            conn = sqlite3.connect(self.formatDBFileName(network_name))
-            c = conn.cursor()
-            c.execute("CREATE TABLE IF NOT EXISTS channels (channel TEXT UNIQUE PRIMARY KEY)")
-            c.execute("INSERT OR REPLACE INTO channels (channel) VALUES (?)", [channel]).rowcount
-            conn.commit()
-            conn.close()
-
+            with self.getDatabase(network_name).connection() as c:
+                c.execute("INSERT OR REPLACE INTO channels (channel) VALUES (?)", [channel])
         except sqlite3.Error as e:
             self.logger.error("Failed to insert channel '{}' to {}.db: {}".format(channel, network_name, str(e)))
         self.logger.log_verbose("Added channel {} to {}.db".format(channel, network_name))
@@ -100,12 +98,8 @@ class ChannelManager:
                             .format(channel, network_name))
 
         try:
-            conn = sqlite3.connect(self.formatDBFileName(network_name))
-            c = conn.cursor()
-            c.execute("DELETE FROM channels WHERE channel = ?", [channel]).rowcount
-            conn.commit()
-            conn.close()
-
+            with self.getDatabase(network_name).connection() as c:
+                c.execute("DELETE FROM channels WHERE channel = ?", [channel])
         except sqlite3.Error as e:
             self.logger.error("Failed to delete channel '{}' from {}.db: {}".format(channel, network_name, str(e)))
         self.logger.log_verbose("Deleted channel {} from {}.db".format(channel, network_name))
@@ -116,13 +110,23 @@ class ChannelManager:
             return False
 
         try:
-            conn = sqlite3.connect(self.formatDBFileName(self.network_name))
-            c = conn.cursor()
-            c.execute("CREATE TABLE IF NOT EXISTS channels (channel TEXT UNIQUE PRIMARY KEY)")
-            conn.commit()
-            conn.close()
+            self.getDatabase(self.network_name)
         except sqlite3.Error as e:
             self.logger.error("Failed to create channel database {}.db: {}".format(self.network_name, str(e)))
 
+    def getDatabase(self, network_name):
+        """Return the Database of network_name, the schema is set up the first time it is requested."""
+        if network_name not in self.databases:
+            db = database.Database(self.formatDBFileName(network_name))
+            db.migrate(MIGRATIONS)
+            self.databases[network_name] = db
+
+        return self.databases[network_name]
+
+    def close(self):
+        for db in self.databases.values():
+            db.close()
+        self.databases = {}
+
     def formatDBFileName(self, db_name):
         return os.path.join(self.db_dir, "{}_{}.db".format(db_name, db_name))
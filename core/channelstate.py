@@ -0,0 +1,201 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+channelstate.py
+Keep track of who is in the channels we are in, and the status they have there.
+
+Every channel maps the (lowercase) nicks in it to an integer with a bit set for each prefix mode they have, the bit
+of a mode is its position in PREFIX from RPL_ISUPPORT: with (qaohv)~&@%+ ops (o) have bit 4 and voices (v) bit 16.
+A reverse index of the channels each nick is in keeps QUIT and NICK from having to look through every channel.
+"""
+
+
+class ChannelState:
+
+    def __init__(self, prefix_modes="ov", prefix_symbols="@+"):
+        self.channels = {}  # channel: {nick: prefix bits}
+        self.nicks = {}  # nick: set of channels they are in
+        self.setPrefixes(prefix_modes, prefix_symbols)
+
+    def setPrefixes(self, modes, symbols):
+        """
+        Use the prefix modes the server told us about, highest first (like "ov" and "@+").
+
+        Anyone with a prefix from @ up counts as op, anyone with a prefix from + up as voice.
+        """
+
+        self.prefix_modes = modes
+        self.prefix_symbols = symbols
+        self.op_mask = self._maskUpTo("@")
+        self.voice_mask = self._maskUpTo("+")
+
+    def _maskUpTo(self, symbol):
+        if symbol not in self.prefix_symbols:
+            return 0
+        return (1 << (self.prefix_symbols.index(symbol) + 1)) - 1
+
+    def bitsOf(self, prefixes):
+        """Return the bits for a string of prefixes (like @+), symbols the server does not use are ignored."""
+        bits = 0
+        for prefix in prefixes:
+            index = self.prefix_symbols.find(prefix)
+            if index != -1:
+                bits |= 1 << index
+        return bits
+
+    def modeBit(self, mode):
+        """Return the bit of a prefix mode (like o), 0 if it is not one."""
+        index = self.prefix_modes.find(mode)
+        return 1 << index if index != -1 else 0
+
+    def prefixesOf(self, bits):
+        """Return the prefixes (like @+) for bits, highest first."""
+        return "".join(symbol for index, symbol in enumerate(self.prefix_symbols) if bits & (1 << index))
+
+    def has(self, channel):
+        return channel.lower() in self.channels
+
+    def reset(self, channel):
+        """Start channel over with no members, as we are about to be told who is in it."""
+        channel = channel.lower()
+        self.remove(channel)
+        self.channels[channel] = {}
+
+    def remove(self, channel):
+        """Forget channel and everyone in it, because we left it."""
+        members = self.channels.pop(channel.lower(), None)
+        if not members:
+            return
+
+        for nick in members:
+            self._unindex(nick, channel.lower())
+
+    def set(self, channel, nick, bits=0):
+        """Add nick to channel, or change their status in it."""
+        channel = channel.lower()
+        nick = nick.lower()
+
+        self.channels.setdefault(channel, {})[nick] = bits
+        self.nicks.setdefault(nick, set()).add(channel)
+
+    def setMode(self, channel, nick, bit, adding):
+        """Give or take a prefix mode bit, returns False if nick is not known to be in channel."""
+        members = self.channels.get(channel.lower())
+        nick = nick.lower()
+
+        if members is None or nick not in members:
+            return False
+
+        if adding:
+            members[nick] |= bit
+        else:
+            members[nick] &= ~bit
+        return True
+
+    def part(self, channel, nick):
+        """Remove nick from channel, returns False if they were not in it."""
+        channel = channel.lower()
+        nick = nick.lower()
+        members = self.channels.get(channel)
+
+        if members is None or nick not in members:
+            return False
+
+        del members[nick]
+        self._unindex(nick, channel)
+        return True
+
+    def quit(self, nick):
+        """Remove nick from every channel, returns the channels they were in."""
+        nick = nick.lower()
+        channels = self.nicks.pop(nick, ())
+
+        for channel in channels:
+            self.channels[channel].pop(nick, None)
+
+        return list(channels)
+
+    def rename(self, nick, newnick):
+        """Follow a nick change in every channel nick is in."""
+        nick = nick.lower()
+        newnick = newnick.lower()
+
+        channels = self.nicks.pop(nick, None)
+        if not channels:
+            return
+
+        for channel in channels:
+            members = self.channels[channel]
+            members[newnick] = members.pop(nick)
+
+        self.nicks.setdefault(newnick, set()).update(channels)
+
+    def _unindex(self, nick, channel):
+        channels = self.nicks.get(nick)
+        if channels is not None:
+            channels.discard(channel)
+            if not channels:
+                del self.nicks[nick]
+
+    def bits(self, channel, nick):
+        """Return the bits of nick in channel, None if they are not in it."""
+        members = self.channels.get(channel.lower())
+        if members is None:
+            return None
+        return members.get(nick.lower())
+
+    def isOn(self, channel, nick):
+        members = self.channels.get(channel.lower())
+        return members is not None and nick.lower() in members
+
+    def isOp(self, channel, nick):
+        bits = self.bits(channel, nick)
+        return bool(bits and bits & self.op_mask)
+
+    def isVoice(self, channel, nick):
+        """Voice or anything above it, like op."""
+        bits = self.bits(channel, nick)
+        return bool(bits and bits & self.voice_mask)
+
+    def channelsOf(self, nick):
+        return list(self.nicks.get(nick.lower(), ()))
+
+    def count(self, channel):
+        return len(self.channels.get(channel.lower(), ()))
+
+    def getChannelData(self, channel):
+        """Return the members of channel as {"op": [nicks], "voice": [nicks], "regular": [nicks]}, None if unknown."""
+        members = self.channels.get(channel.lower())
+        if members is None:
+            return None
+
+        data = {"op": [], "voice": [], "regular": []}
+        for nick, bits in members.items():
+            if bits & self.op_mask:
+                data["op"].append(nick)
+            elif bits & self.voice_mask:
+                data["voice"].append(nick)
+            else:
+                data["regular"].append(nick)
+        return data
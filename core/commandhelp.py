@@ -23,6 +23,9 @@ THE SOFTWARE.
 
 commandhelp.py
 Register and unregister commands to make CommandHelp generate a nice list of which commands are available.
+
+CommandHelp also routes commands: it knows which module registered a command (or one of its aliases), so the
+ModuleHandler can call that module's on_command directly instead of asking every module in turn.
 """
 
 from tools import paste
@@ -37,30 +40,58 @@ class CommandHelp:
     def __init__(self, logger, command_prefix):
         self.command_prefix = command_prefix
         self.commands = {}
+        self.routes = {}  # command or alias: name of the command it routes to
+        self.hits = {}  # command: times it was handled successfully
         self.logger = logger
 
         self.commands_gist_md = None
         self.commands_gist_txt = None
 
-    def register(self, command, params, help, priv, aliases=None, module=None):
+    def register(self, command, params, help, priv, aliases=None, module=None, handler=None):
+        """handler: the on_command method of the module that registers the command, to route the command to."""
         command = command.lower()
 
         if command in self.commands:
-            self.logger.error("Attempted to register command '{}' from {}, but it was already registered."
-                              .format(command, module if module else "unknown"))
+            self.logger.error("Attempted to register command '{}' from {}, but it was already registered.",
+                              command, module if module else "unknown")
         self.commands[command] = {"name": command, "params": params, "help": help, "priv": priv, "aliases": aliases,
-                                  "module": module}
+                                  "module": module, "handler": handler}
+
+        self.routes[command] = command
+        if aliases:
+            for alias in aliases:
+                self.routes[alias.lower()] = command
 
     def unregister(self, command):
         command = command.lower()
 
         if command in self.commands:
-            self.logger.log("Unregistering command '{}'".format(command))
-            self.commands = self.commands.pop(command)
+            self.logger.log("Unregistering command '{}'", command)
+            self.commands.pop(command)
+
+            for name in [name for name, target in self.routes.items() if target == command]:
+                del self.routes[name]
         else:
             self.logger.notice_verbose("Attempted to unregister command '{}' but it was not registered.".
                                        format(command))
 
+    def getHandler(self, command):
+        """Return the on_command method of the module owning command (or the alias command), None if unregistered."""
+        name = self.routes.get(command)
+
+        if name is None:
+            return None
+        return self.commands[name]["handler"]
+
+    def countHit(self, command):
+        """Count a successfully handled command, aliases are counted towards the command they belong to."""
+        command = self.routes.get(command, command)
+        self.hits[command] = self.hits.get(command, 0) + 1
+
+    def getHits(self, command):
+        command = command.lower()
+        return self.hits.get(self.routes.get(command, command), 0)
+
     def isCommand(self, command):
         command = command.lower()
 
@@ -175,8 +206,11 @@ class CommandHelp:
         else:
             aliasstring = "with aliases {}".format(aliasstring)
 
-        return ("The command '{}' originates from the module '{}', {} and requires {} to use."
-                .format(command, self.commands[command]["module"], aliasstring, privstring))
+        hits = self.getHits(command)
+
+        return ("The command '{}' originates from the module '{}', {} and requires {} to use. It has been used {} {}."
+                .format(command, self.commands[command]["module"], aliasstring, privstring, hits,
+                        "time" if hits == 1 else "times"))
 
     def getCommandPaste(self, command, mod, admin, markdown=False, force_refresh=False):
         if not force_refresh:
@@ -223,13 +257,10 @@ class CommandHelp:
         if command in self.commands:
             return False
 
-        for cmd, cmdinfo in self.commands.items():
-            if cmdinfo["aliases"] and command in cmdinfo["aliases"]:
-                return True
-        return False
+        return command in self.routes
 
     def isAliasOf(self, command):
-        for cmd, cmdinfo in self.commands.items():
-            if cmdinfo["aliases"] and command in cmdinfo["aliases"]:
-                return cmdinfo["name"]
-        return None
+        if command in self.commands:
+            return None
+
+        return self.routes.get(command)
@@ -25,6 +25,7 @@ Zarthus <zarthus@zarth.us>
 13 July, 2014.
 """
 
+import copy
 import json
 import os
 import sys
@@ -34,6 +35,10 @@ from tools import hostmask
 from tools import logger
 
 
+CONFIG_FILE = "config.json"
+SECTIONS = ("irc", "api_keys", "metadata", "modules")
+
+
 class Config:
     """
     Parse the config in the root directory (config.json)
@@ -45,37 +50,40 @@ class Config:
     metadata = {}
     modules = {}
 
-    def __init__(self):
+    def __init__(self, path=CONFIG_FILE):
         self.logger = logger.Logger("Configuration")
+        self.path = path
+        self.hostmasks = {}
+        self.raw = {}  # config.json as it was read, before validation filled in the defaults.
+        self.mtime = None  # When config.json was last modified, as it was when we read it.
         self.load()
 
     def rehash(self):
+        """
+        Load config.json again, returns what changed since it was loaded before (see diff()).
+
+        If the file cannot be loaded the configuration stays as it was and None is returned.
+        """
+
         self.logger.log("Rehashing configuration.")
 
-        self.networks = {}
-        self.api_keys = {}
-        self.metadata = {}
-        self.modules = {}
+        old = (self.networks, self.api_keys, self.metadata, self.modules, self.hostmasks, self.raw)
 
-        self.load()
+        try:
+            self._apply(self._read())
+        except Exception as e:
+            self.logger.error("Keeping the current configuration, an error occured while loading config.json:\n{}"
+                              .format(str(e)))
+            self.networks, self.api_keys, self.metadata, self.modules, self.hostmasks, self.raw = old
+            return None
+
+        return diff(old[5], self.raw)
 
     def load(self):
         """Load the configuration -- called upon creation of the class"""
-        file = "config.json"
-
-        if os.path.isfile(file):
+        if os.path.isfile(self.path):
             try:
-                config = json.load(open(file))
-
-                self.networks = config["irc"]
-                self.api_keys = config["api_keys"]
-                self.metadata = config["metadata"]
-                self.modules = config["modules"]
-
-                self.logger.setTimestamp(self.getTimestampFormat())
-                val = self._validate()
-                self.logger.log("Configuration successfully loaded. Networks: {}, Warnings: {}.\n"
-                                .format(val[0], val[1]))
+                self._apply(self._read())
             except Exception as e:
                 self.logger.error("An error occured while loading config.json:\n{}".format(str(e)))
                 sys.exit(1)
@@ -83,6 +91,32 @@ class Config:
             self.logger.error("Could not find configuration file config.json, did you configure the bot?")
             sys.exit(1)
 
+    def _read(self):
+        # Set before parsing, so a broken file is not read again until it is modified.
+        self.mtime = os.path.getmtime(self.path)
+        with open(self.path) as file:
+            return json.load(file)
+
+    def _apply(self, config):
+        raw = copy.deepcopy({section: config[section] for section in SECTIONS})
+
+        self.networks = config["irc"]
+        self.api_keys = config["api_keys"]
+        self.metadata = config["metadata"]
+        self.modules = config["modules"]
+
+        self.logger.setTimestamp(self.getTimestampFormat())
+        val = self._validate()
+        self.raw = raw
+        self.logger.log("Configuration successfully loaded. Networks: {}, Warnings: {}.\n".format(val[0], val[1]))
+
+    def hasChanged(self):
+        """Whether config.json was modified since we last read it."""
+        try:
+            return os.path.getmtime(self.path) != self.mtime
+        except OSError:
+            return False
+
     def getNetworks(self):
         return self.networks
 
@@ -103,20 +137,22 @@ class Config:
         return self.networks[network]["command_prefix"] if network in self.networks else "!"
 
     def isAdministrator(self, network, address):
-        if network in self.networks:
-            for addr in self.networks[network]["administrators"]:
-                if hostmask.match(address, addr):
-                    return True
+        if network in self.hostmasks:
+            return self.hostmasks[network][0].match(address)
 
         return False
 
     def isModerator(self, network, address):
-        if network in self.networks:
-            for addr in self.networks[network]["moderators"]:
-                if hostmask.match(address, addr):
-                    return True
+        """Administrators are moderators as well."""
+        if network in self.hostmasks:
+            return self.hostmasks[network][1].match(address)
 
-        return self.isAdministrator(network, address)
+        return False
+
+    def forgetHostmask(self, network, nick):
+        """Forget whether nick is an administrator or moderator, because their nick or host changed."""
+        for matcher in self.hostmasks.get(network, ()):
+            matcher.forget(nick)
 
     def getApiKey(self, api_name):
         return self.api_keys[api_name] if api_name in self.api_keys else None
@@ -142,6 +178,74 @@ class Config:
     def getLogTimestampFormat(self):
         return self.metadata["log_timestamp"] if "log_timestamp" in self.metadata else "%Y-%m-%d %H:%M:%S"
 
+    def getLogLevel(self, network_name=None):
+        """The name of the level to log from, the network's own if it has one. None if it was not configured."""
+        if network_name in self.networks and "log_level" in self.networks[network_name]:
+            return self.networks[network_name]["log_level"]
+        return self.metadata["log_level"] if "log_level" in self.metadata else None
+
+    def getLogEvents(self, network_name=None):
+        """Whether to record IRC events as JSON lines, the network's own setting if it has one."""
+        if network_name in self.networks and "log_events" in self.networks[network_name]:
+            return self.networks[network_name]["log_events"]
+        return self.metadata["log_events"] if "log_events" in self.metadata else False
+
+    def getLogMaxSize(self):
+        return self.metadata["log_max_size"] if "log_max_size" in self.metadata else 0
+
+    def getLogCompress(self):
+        return self.metadata["log_compress"] if "log_compress" in self.metadata else False
+
+    def getHookStats(self):
+        """Whether to time module hooks and commands from the start, see core/hookstats.py."""
+        return self.metadata["hook_stats"] if "hook_stats" in self.metadata else False
+
+    def getHookStatsSlowThreshold(self):
+        """Milliseconds after which a hook or command is logged as slow, 0 to not log them."""
+        return self.metadata["hook_stats_slow_ms"] if "hook_stats_slow_ms" in self.metadata else 250
+
+    def getHookStatsInterval(self):
+        """Seconds between logging the hook statistics, 0 to not log them."""
+        return self.metadata["hook_stats_interval"] if "hook_stats_interval" in self.metadata else 3600
+
+    def getConfigWatchInterval(self):
+        """Seconds between checking whether config.json was modified to rehash it, 0 to not check."""
+        return self.metadata["config_watch_interval"] if "config_watch_interval" in self.metadata else 0
+
+    def getWorkerThreads(self):
+        return self.metadata["worker_threads"] if "worker_threads" in self.metadata else 8
+
+    def getWorkerQueueSize(self):
+        return self.metadata["worker_queue_size"] if "worker_queue_size" in self.metadata else 100
+
+    def getHttpTimeout(self):
+        """The connect and read timeout of HTTP requests in seconds, see tools/httpclient.py."""
+        return (self.metadata["http_connect_timeout"] if "http_connect_timeout" in self.metadata else 5,
+                self.metadata["http_read_timeout"] if "http_read_timeout" in self.metadata else 15)
+
+    def getHttpMaxSize(self):
+        """The size in bytes HTTP responses may be, larger ones are not read."""
+        return self.metadata["http_max_size"] if "http_max_size" in self.metadata else 2097152
+
+    def getHttpUserAgent(self):
+        if "http_user_agent" in self.metadata and self.metadata["http_user_agent"]:
+            return self.metadata["http_user_agent"]
+        return "Reconcile/{} (+{})".format(self.getVersion(), self.getGithubURL())
+
+    def getHttpCacheSize(self):
+        """The amount of HTTP responses modules may have cached, see core/httpcache.py."""
+        return self.metadata["http_cache_size"] if "http_cache_size" in self.metadata else 512
+
+    def getHttpCacheStaleTime(self):
+        """Seconds an expired HTTP response may still be served while it is refreshed in the background."""
+        return self.metadata["http_cache_stale"] if "http_cache_stale" in self.metadata else 300
+
+    def getHttpCacheFile(self):
+        """File to keep the HTTP cache in across restarts, None to only keep it in memory."""
+        if "http_cache_file" in self.metadata and self.metadata["http_cache_file"]:
+            return self.metadata["http_cache_file"]
+        return None
+
     def getDatabaseDir(self):
         if "db_dir" in self.metadata:
             self.metadata["db_dir"] = os.path.join(self.metadata["db_dir"])
@@ -252,6 +356,7 @@ class Config:
     def _validate(self, verbose=None):
         count = 0
         warnings = 0
+        hostmasks = {}  # network: (administrator Matcher, moderator Matcher)
         cm = channel.ChannelManager(self.getDatabaseDir(), self.logger)
 
         if not verbose:
@@ -348,6 +453,33 @@ class Config:
             if "password" not in self.networks[network_name]:
                 self.networks[network_name]["password"] = ""
 
+            # SASL identifies us while registering, before we join any channels (PLAIN or EXTERNAL).
+            if "ssl_cert" not in self.networks[network_name]:
+                self.networks[network_name]["ssl_cert"] = False
+
+            if "sasl" not in self.networks[network_name] or not self.networks[network_name]["sasl"]:
+                self.networks[network_name]["sasl"] = False
+            else:
+                mechanism = str(self.networks[network_name]["sasl"]).upper()
+
+                if mechanism not in ["PLAIN", "EXTERNAL"]:
+                    self.logger.log_verbose("'sasl' in {} is not PLAIN or EXTERNAL - SASL disabled."
+                                            .format(network_name))
+                    mechanism = False
+                    warnings += 1
+                elif mechanism == "PLAIN" and not self.networks[network_name]["password"]:
+                    self.logger.log_verbose("'sasl' is PLAIN but no 'password' was configured in {} - SASL disabled."
+                                            .format(network_name))
+                    mechanism = False
+                    warnings += 1
+                elif mechanism == "EXTERNAL" and not self.networks[network_name]["ssl_cert"]:
+                    self.logger.log_verbose("'sasl' is EXTERNAL but no 'ssl_cert' was configured in {} - "
+                                            "SASL disabled.".format(network_name))
+                    mechanism = False
+                    warnings += 1
+
+                self.networks[network_name]["sasl"] = mechanism
+
             if "znc" not in self.networks[network_name]:
                 self.networks[network_name]["znc"] = False
 
@@ -370,7 +502,7 @@ class Config:
             if "perform" not in self.networks[network_name]:
                 self.networks[network_name]["perform"] = []
 
-            if "moderators" not in self.networks[network_name]:
+            if "administrators" not in self.networks[network_name]:
                 self.networks[network_name]["administrators"] = []
 
             if "moderators" not in self.networks[network_name]:
@@ -385,7 +517,56 @@ class Config:
             if "ignorelist" not in self.networks[network_name]:
                 self.networks[network_name]["ignorelist"] = []
 
+            # Most ircds allow a burst of lines, after which they expect lines at a fixed rate (lines per second).
+            if "flood_burst" not in self.networks[network_name]:
+                self.networks[network_name]["flood_burst"] = 10
+
+            if "flood_rate" not in self.networks[network_name]:
+                self.networks[network_name]["flood_rate"] = 1.0
+
+            # All masks are compiled into one matcher, moderators includes the administrators.
+            administrators = hostmask.Matcher(self.networks[network_name]["administrators"])
+            moderators = hostmask.Matcher(self.networks[network_name]["administrators"] +
+                                          self.networks[network_name]["moderators"])
+            hostmasks[network_name] = (administrators, moderators)
+
+            if moderators.invalid:
+                self.logger.log_verbose("Ignoring administrator or moderator masks without a @ in {}: {}"
+                                        .format(network_name, ", ".join(moderators.invalid)))
+                warnings += 1
+
             self.parseAuthString(network_name)
             count += 1
 
+        self.hostmasks = hostmasks
+
+        cm.close()
         return [count, warnings]
+
+
+def diff(old, new):
+    """
+    Compare two configurations as read from config.json, returns what changed:
+
+    {"networks": {network name: set of changed keys}, "api_keys": set of changed API keys,
+     "metadata": set of changed keys, "modules": set of the names of modules whose settings changed}
+
+    Networks that were added or removed have all their keys listed.
+    """
+
+    changes = {"networks": {}}
+
+    for section in ("api_keys", "metadata", "modules"):
+        changes[section] = _changedKeys(old.get(section, {}), new.get(section, {}))
+
+    networks = old.get("irc", {}), new.get("irc", {})
+    for name in set(networks[0]) | set(networks[1]):
+        changed = _changedKeys(networks[0].get(name, {}), networks[1].get(name, {}))
+        if changed:
+            changes["networks"][name] = changed
+
+    return changes
+
+
+def _changedKeys(old, new):
+    return set(key for key in set(old) | set(new) if key not in old or key not in new or old[key] != new[key])
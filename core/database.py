@@ -0,0 +1,136 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+database.py
+Helpers for the SQLite databases modules keep in the db directory.
+
+Schemas are versioned with SQLite's user_version pragma. A module describes its schema as a list of migrations,
+the first one creates the tables and every further one upgrades the previous version (adding indexes, for example).
+Existing database files are upgraded in place the first time they are opened by a newer version of the module.
+
+A Database keeps a long-lived connection to its file for every thread that uses it (hooks may run on the event loop
+as well as on the worker pool), so statements are prepared once per connection instead of on every call.
+"""
+
+import sqlite3
+import threading
+
+
+# Applied to every connection. In WAL mode readers do not block the writer and the other way around, and with
+# synchronous=NORMAL a commit no longer waits for the disk (a power loss may lose the last transactions, but will
+# not corrupt the database).
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY"
+]
+BUSY_TIMEOUT = 10  # Seconds to wait for another connection to release its lock on the database.
+STATEMENT_CACHE = 128  # The amount of prepared statements sqlite3 caches per connection, keyed by their SQL.
+
+
+class Database:
+    def __init__(self, path):
+        """path: string, the database file, it is created if it does not exist."""
+        self.path = path
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.connections = []
+
+    def connection(self):
+        """
+        Return the connection of the calling thread, opening it if there is none yet.
+
+        The connection is also a context manager that commits on success and rolls back on an exception,
+        write through it as follows:
+
+        with self.db.connection() as conn:
+            conn.execute("INSERT INTO ...", [...])
+        """
+
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # Connections are only used by the thread that opened them, but close() may be called from any thread.
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE,
+                                   check_same_thread=False)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+
+        return conn
+
+    def execute(self, sql, parameters=()):
+        """Execute a statement on the connection of the calling thread, returns the cursor. Use it to read."""
+        return self.connection().execute(sql, parameters)
+
+    def migrate(self, migrations):
+        """Set up or upgrade the schema, see migrate()."""
+        return migrate(self.connection(), migrations)
+
+    def close(self):
+        """Close the connections of every thread, threads that use the Database afterwards open a new one."""
+        with self.lock:
+            connections = self.connections
+            self.connections = []
+            self.local = threading.local()
+
+        for conn in connections:
+            conn.close()
+
+
+def migrate(conn, migrations):
+    """
+    Bring the schema of the database up to date, returns the version it is at afterwards.
+
+    conn: sqlite3.Connection to the database.
+    migrations: list of migrations, each a list of SQL statements. The statements of migration N (counting from
+                zero) take the database from version N to N + 1, every migration runs in a transaction of its own.
+                Never change a migration that was released, append a new one instead.
+    """
+
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= len(migrations):
+        return version
+
+    # Without this sqlite3 would commit before every statement that is not DML, we want a transaction around each
+    # migration so a failure halfway leaves the database at the previous version.
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+
+    try:
+        for number in range(version, len(migrations)):
+            conn.execute("BEGIN")
+            try:
+                for statement in migrations[number]:
+                    conn.execute(statement)
+                conn.execute("PRAGMA user_version = {}".format(number + 1))
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+    finally:
+        conn.isolation_level = isolation_level
+
+    return len(migrations)
@@ -0,0 +1,206 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+engine.py
+Run every IrcConnection on a single asyncio event loop.
+
+Each connection is a task on the loop, with a reader and a writer task of its own while it is connected.
+Connections report state changes to the Engine as events, the supervisor reacts to them instead of polling.
+The Engine also rehashes the configuration for all connections at once, optionally whenever config.json is modified.
+"""
+
+import asyncio
+import signal
+import threading
+
+from core import httpcache
+from core import irc
+from core import workerpool
+from tools import httpclient
+
+
+SHUTDOWN_TIMEOUT = 10  # Seconds we give connections to send their QUIT when the console interrupts us.
+
+
+class Engine:
+    def __init__(self, config):
+        self.config = config
+        self.logger = config.logger
+
+        self.connections = {}
+        self.workers = workerpool.WorkerPool(self.logger, config.getWorkerThreads(), config.getWorkerQueueSize())
+        self.configureHttp()
+        self.loop = None
+        self.events = None
+        self.thread_ident = None
+        self.watcher = None  # Task polling config.json for changes, see watchConfig().
+
+    def run(self):
+        """Start a connection for every network and run the event loop until all of them have terminated."""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.thread_ident = threading.get_ident()
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(sig, self.requestShutdown, "Shutdown requested by console.")
+            except (NotImplementedError, RuntimeError):
+                pass  # Not supported on this platform, we fall back to catching KeyboardInterrupt.
+
+        try:
+            self.loop.run_until_complete(self.supervise())
+        except KeyboardInterrupt:
+            self.logger.log("Shutdown requested by console.")
+            self.shutdown()
+
+            tasks = [conn.task for conn in self.connections.values() if conn.task]
+            if tasks:
+                self.loop.run_until_complete(asyncio.wait(tasks, timeout=SHUTDOWN_TIMEOUT))
+        finally:
+            self.workers.shutdown()
+            httpcache.getCache().save()
+            httpclient.getClient().close()
+            self.loop.close()
+            self.logger.flush(True)
+
+    async def supervise(self):
+        self.events = asyncio.Queue()
+
+        for name, network in self.config.getNetworks().items():
+            self.connections[name] = irc.IrcConnection(network, self.config, self)
+
+        for conn in self.connections.values():
+            conn.start()
+
+        self.startWatcher()
+
+        while self.connections:
+            conn, state = await self.events.get()
+
+            if state == irc.STATE_SHUTDOWN:
+                self.shutdown()
+            elif state == irc.STATE_TERMINATED:
+                self.logger.log_verbose("Connection to {} has terminated.", conn.network_name)
+                for name in [name for name, c in self.connections.items() if c is conn]:
+                    del self.connections[name]
+            else:
+                self.logger.log_verbose("Connection to {} is now {}.", conn.network_name, state)
+
+        if self.watcher:
+            self.watcher.cancel()
+
+        self.logger.log("No more connections remain, stopping script.")
+
+    def shutdown(self):
+        """Quit every network we are connected to, and stop trying to connect to the others."""
+        for conn in self.connections.values():
+            if conn.connected:
+                conn.quit("Shutting down...")
+            else:
+                conn.terminate()
+
+    def rehash(self, origin=None, reconnect=False):
+        """
+        Load the configuration again and apply what changed to every connection, returns False if it failed.
+
+        origin: the IrcConnection that requested the rehash, it is told when the configuration could not be loaded.
+        reconnect: boolean, whether origin should reconnect afterwards.
+        """
+
+        self.logger.flush(True)  # Log files are opened again, in the log directory that may have been changed.
+        changes = self.config.rehash()
+
+        if changes is None:
+            if origin:
+                origin.logger.error("Rehash failed, the configuration was left unchanged.")
+            return False
+
+        for name, conn in list(self.connections.items()):
+            if not self.config.getNetwork(name):
+                self.logger.log("Network {} was removed from the configuration, disconnecting.", name)
+                if conn.connected:
+                    conn.quit("Network removed from the configuration.")
+                else:
+                    conn.terminate()
+            else:
+                conn.applyConfig(changes, reconnect and conn is origin)
+
+        for name, network in self.config.getNetworks().items():
+            if name not in self.connections:
+                self.logger.log("Network {} was added to the configuration, connecting to it.", name)
+                self.connections[name] = irc.IrcConnection(network, self.config, self)
+                self.connections[name].start()
+
+        if any(key.startswith("http_") for key in changes["metadata"]):
+            self.configureHttp()
+
+        self.startWatcher()
+        return True
+
+    def configureHttp(self):
+        httpclient.configure(self.config.getHttpTimeout(), self.config.getHttpMaxSize(),
+                             self.config.getHttpUserAgent())
+        httpcache.configure(self.config.getHttpCacheSize(), self.config.getHttpCacheStaleTime(),
+                            self.config.getHttpCacheFile(), self.logger)
+
+    def startWatcher(self):
+        if self.config.getConfigWatchInterval() > 0 and not self.watcher:
+            self.watcher = self.loop.create_task(self.watchConfig())
+
+    async def watchConfig(self):
+        """
+        Rehash whenever config.json is modified, until the watch interval is set to 0.
+
+        The modification time is polled, as the standard library has no way to be notified of file changes.
+        """
+
+        try:
+            while self.config.getConfigWatchInterval() > 0:
+                await asyncio.sleep(self.config.getConfigWatchInterval())
+
+                if self.config.hasChanged():
+                    self.logger.log("config.json was modified, rehashing.")
+                    self.rehash()
+        finally:
+            self.watcher = None
+
+    def requestShutdown(self, reason="Shutdown requested."):
+        self.logger.log(reason)
+        self.notify(None, irc.STATE_SHUTDOWN)
+
+    def notify(self, conn, state):
+        """Report a state change of conn to the supervisor, safe to call from any thread."""
+        self.callSoon(self.events.put_nowait, (conn, state))
+
+    def callSoon(self, callback, *args):
+        """
+        Run callback on the event loop.
+
+        From within the loop it is called right away, other threads (module workers) have it scheduled
+        on the loop as asyncio objects are not thread safe.
+        """
+
+        if threading.get_ident() == self.thread_ident:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
@@ -0,0 +1,126 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+hookstats.py
+Measure how long module hooks and commands take, to find the module that makes the bot lag.
+
+Instrumentation is opt-in (hook_stats in the configuration, or the hookstats command): the ModuleHandler only wraps
+the hooks it dispatches to while it is enabled, so it costs nothing otherwise. Blocking hooks are timed on the
+worker thread that runs them, the time they spent waiting for a worker is not counted.
+"""
+
+import threading
+import time
+
+
+CALLS = 0
+TOTAL = 1
+MAX = 2
+EXCEPTIONS = 3
+
+
+class HookStats:
+    def __init__(self, logger, slow_threshold=0.25):
+        """
+        logger: Logger object
+        slow_threshold: float, seconds after which a call is logged as slow, 0 to never log them.
+        """
+
+        self.logger = logger
+        self.slow_threshold = slow_threshold
+
+        self.lock = threading.Lock()  # Blocking hooks are timed on the worker threads.
+        self.hooks = {}  # (module name, hook): [calls, total seconds, max seconds, exceptions]
+        self.commands = {}  # command: [calls, total seconds, max seconds, exceptions]
+        self.since = time.time()
+
+    def wrap(self, module_name, hook, func):
+        """Return a function that calls func and records how long it took."""
+        key = (module_name, hook)
+
+        def timed(*args):
+            return self.call(self.hooks, key, func, args)
+        timed.__name__ = hook
+        return timed
+
+    def callCommand(self, command, func, args):
+        """Call func(*args) for command and record how long it took, returns what func returns."""
+        return self.call(self.commands, command, func, args)
+
+    def call(self, table, key, func, args):
+        start = time.perf_counter()
+        failed = True
+
+        try:
+            result = func(*args)
+            failed = False
+            return result
+        finally:
+            self._record(table, key, time.perf_counter() - start, failed)
+
+    def reset(self):
+        with self.lock:
+            self.hooks.clear()
+            self.commands.clear()
+            self.since = time.time()
+
+    def getStats(self):
+        """Return a copy of the hook and command statistics, see __init__ for their layout."""
+        with self.lock:
+            return ({key: list(entry) for key, entry in self.hooks.items()},
+                    {key: list(entry) for key, entry in self.commands.items()})
+
+    def getSummary(self, limit=5):
+        """Return lines describing the hooks and commands that took the most time in total, the slowest first."""
+        hooks, commands = self.getStats()
+        entries = [("{}.{}".format(*key), entry) for key, entry in hooks.items()]
+        entries += [("command '{}'".format(key), entry) for key, entry in commands.items()]
+        entries.sort(key=lambda item: item[1][TOTAL], reverse=True)
+
+        lines = []
+        for name, entry in entries[:limit]:
+            lines.append("{}: {} calls, {:.1f} ms total, {:.2f} ms avg, {:.1f} ms max{}"
+                         .format(name, entry[CALLS], entry[TOTAL] * 1000, entry[TOTAL] / entry[CALLS] * 1000,
+                                 entry[MAX] * 1000,
+                                 ", {} exceptions".format(entry[EXCEPTIONS]) if entry[EXCEPTIONS] else ""))
+
+        return lines
+
+    def _record(self, table, key, elapsed, failed):
+        with self.lock:
+            entry = table.get(key)
+            if entry is None:
+                entry = table[key] = [0, 0.0, 0.0, 0]
+
+            entry[CALLS] += 1
+            entry[TOTAL] += elapsed
+            if elapsed > entry[MAX]:
+                entry[MAX] = elapsed
+            if failed:
+                entry[EXCEPTIONS] += 1
+
+        if self.slow_threshold and elapsed >= self.slow_threshold:
+            self.logger.notice("Slow handler: {} took {:.0f} ms.",
+                               "{}.{}".format(*key) if table is self.hooks else "command '{}'".format(key),
+                               elapsed * 1000)
@@ -0,0 +1,283 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+httpcache.py
+Cache the responses to the HTTP requests modules make, so repeated lookups do not cost a round trip and API quota.
+
+Responses are cached by method, URL and parameters for as long as the module asks, the least recently used ones are
+evicted once the cache is full. An expired response is still served for a while (stale-while-revalidate): the first
+request for it refreshes it in the background, so nobody has to wait for the API. Only successful responses are
+cached. The cache is shared by every network and may be saved to disk so it survives a restart.
+
+Keys are hashes of the request, so the API keys in URLs and parameters are not written to disk with the cache.
+Neither are the URLs and requests of the responses that are saved.
+"""
+
+import collections
+import concurrent.futures
+import copy
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+from tools import httpclient
+
+
+CACHE_SIZE = 512  # The amount of responses kept.
+STALE_TIME = 300  # Seconds an expired response may still be served while it is being refreshed.
+REFRESH_WORKERS = 2  # Threads refreshing expired responses in the background.
+MAX_REFRESHING = 32  # Refreshes that may be queued or running, further expired responses are served as they are.
+
+RESPONSE = 0
+EXPIRES = 1
+STALE = 2
+
+
+class HttpCache:
+    def __init__(self, max_size=CACHE_SIZE, stale_time=STALE_TIME, file=None, logger=None):
+        """
+        max_size: integer, the amount of responses to keep.
+        stale_time: integer, seconds an expired response may be served while it is refreshed, 0 to never do so.
+        file: string, file to save the cache to and load it from, None to keep it in memory only.
+        logger: Logger object, or None.
+        """
+
+        self.max_size = max_size
+        self.stale_time = stale_time
+        self.file = file
+        self.logger = logger
+
+        self.lock = threading.Lock()  # Modules make their requests on the worker threads.
+        self.entries = collections.OrderedDict()  # key: [response, expires, stale until], least recently used first.
+        self.refreshing = set()  # Keys of the entries being refreshed in the background.
+        self.refresher = concurrent.futures.ThreadPoolExecutor(REFRESH_WORKERS)
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.sources = {}  # module name: [hits, misses]
+
+        if file:
+            self.load()
+
+    def request(self, method, url, ttl, params=None, data=None, source=None):
+        """
+        Make a request, or answer it with the cached response. Returns a requests.Response.
+
+        ttl: integer, seconds the response stays fresh, 0 to not cache it at all.
+        source: string, the name of the module making the request, hits and misses are counted per module.
+        """
+
+        if ttl <= 0:
+            return fetch(method, url, params, data)
+
+        key = makeKey(method, url, params, data)
+        now = time.time()  # Not monotonic, entries outlive the process when the cache is saved.
+        stale = None
+        refresh = False
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry and now < entry[STALE]:
+                self.entries.move_to_end(key)
+                self._count(source, True)
+
+                if now < entry[EXPIRES]:
+                    self.hits += 1
+                    return entry[RESPONSE]
+
+                self.stale_hits += 1
+                stale = entry[RESPONSE]
+                if key not in self.refreshing and len(self.refreshing) < MAX_REFRESHING:
+                    self.refreshing.add(key)
+                    refresh = True
+            else:
+                self.misses += 1
+                self._count(source, False)
+
+        if stale is not None:
+            if refresh:
+                self.refresher.submit(self._refresh, key, method, url, ttl, params, data)
+            return stale
+
+        response = fetch(method, url, params, data)
+        self._store(key, response, ttl)
+        return response
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def resize(self, max_size):
+        with self.lock:
+            self.max_size = max_size
+            self._evict()
+
+    def getStats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "stale": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "sources": {source: tuple(counts) for source, counts in self.sources.items()}
+            }
+
+    def save(self):
+        """Write the cache to its file, if it has one."""
+        if not self.file:
+            return
+
+        with self.lock:
+            entries = [(key, [redact(entry[RESPONSE])] + entry[EXPIRES:]) for key, entry in self.entries.items()]
+
+        try:
+            with open(self.file + ".tmp", "wb") as file:
+                pickle.dump(entries, file, pickle.HIGHEST_PROTOCOL)
+            os.replace(self.file + ".tmp", self.file)
+        except Exception as e:
+            self._error("Could not save the HTTP cache to {}: {}", self.file, str(e))
+
+    def load(self):
+        """Read the cache from its file, entries that are too old to be served are dropped."""
+        if not os.path.isfile(self.file):
+            return
+
+        try:
+            with open(self.file, "rb") as file:
+                entries = pickle.load(file)
+        except Exception as e:
+            self._error("Could not load the HTTP cache from {}: {}", self.file, str(e))
+            return
+
+        now = time.time()
+        with self.lock:
+            for key, entry in entries:
+                if now < entry[STALE]:
+                    self.entries[key] = entry
+            self._evict()
+
+    def _refresh(self, key, method, url, ttl, params, data):
+        try:
+            self._store(key, fetch(method, url, params, data), ttl)
+        except Exception as e:
+            self._error("Could not refresh {}: {}", url, str(e))
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def _store(self, key, response, ttl):
+        if not response.ok:
+            return
+
+        expires = time.time() + ttl
+
+        with self.lock:
+            self.entries[key] = [response, expires, expires + self.stale_time]
+            self.entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        """Drop the least recently used entries until the cache fits. The lock must be held."""
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(False)
+            self.evictions += 1
+
+    def _count(self, source, hit):
+        """Count a hit or miss for source. The lock must be held."""
+        if source:
+            self.sources.setdefault(source, [0, 0])[0 if hit else 1] += 1
+
+    def _error(self, message, *args):
+        if self.logger:
+            self.logger.error(message, *args)
+
+
+def fetch(method, url, params=None, data=None):
+    return httpclient.getClient().request(method, url, params=params, data=data)
+
+
+def makeKey(method, url, params=None, data=None):
+    """Return the key a request is cached under, parameters are compared regardless of their order."""
+    request = (method.upper(), url, _freeze(params), _freeze(data))
+    return hashlib.sha256(repr(request).encode("utf-8")).hexdigest()
+
+
+def redact(response):
+    """Return a copy of response without its URL and request, which may contain API keys, to save to disk."""
+    response = copy.copy(response)
+    response.url = None
+    response.request = None
+    response.history = []
+    return response
+
+
+def _freeze(values):
+    if values is None or isinstance(values, (str, bytes)):
+        return values
+
+    items = values.items() if isinstance(values, dict) else values
+    return tuple(sorted((str(key), str(value)) for key, value in items))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def getCache():
+    """Return the HttpCache shared by every module, it is created with the defaults if configure() was not called."""
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = HttpCache()
+
+    return _cache
+
+
+def configure(max_size=CACHE_SIZE, stale_time=STALE_TIME, file=None, logger=None):
+    """Create the shared HttpCache, or change its settings if it already exists."""
+    global _cache
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = HttpCache(max_size, stale_time, file, logger)
+            return _cache
+
+    _cache.stale_time = stale_time
+    _cache.logger = logger
+    _cache.resize(max_size)
+
+    if file != _cache.file:
+        _cache.file = file
+        if file:
+            _cache.load()
+
+    return _cache
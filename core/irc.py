@@ -24,17 +24,21 @@ THE SOFTWARE.
 IRC class for irc connections
 """
 
+import asyncio
+import base64
 import socket
 import ssl
 import time
-import re
 import traceback
-import queue
-import threading
 
 from core import channel
+from core import channelstate
 from core import module
 from core import commandhelp
+from core import ircmessage
+from core import linebuffer
+from core import linesplitter
+from core import netsplit
 from core import ratelimit
 from tools import validator
 from tools import formatter
@@ -44,107 +48,353 @@ from tools import banmask
 from tools import ignorelist
 
 
-class IrcConnection(threading.Thread):
-    def __init__(self, network, config, modules=None):
+EVENTS = frozenset(["PRIVMSG", "NOTICE", "MODE", "JOIN", "PART", "INVITE", "KICK", "QUIT"])
+# Events that only change what we know about a user.
+USER_EVENTS = frozenset(["NICK", "ACCOUNT", "AWAY", "CHGHOST"])
+
+# IRCv3 capabilities we request, with them the server tells us about changes to users and channels so we do not
+# have to WHO them. See https://ircv3.net/irc/
+CAPABILITIES = ("multi-prefix", "extended-join", "account-notify", "account-tag", "away-notify", "chghost",
+                "userhost-in-names", "batch")
+
+# States a connection reports to the Engine.
+STATE_CONNECTED = "connected"
+STATE_DISCONNECTED = "disconnected"
+STATE_SHUTDOWN = "shutdown"
+STATE_TERMINATED = "terminated"
+
+CONNECT_TIMEOUT = 30
+# Numerics that tell us we could not join a channel: no such channel, too many channels, full, invite only, banned,
+# bad key, registered users only.
+JOIN_ERRORS = frozenset([403, 405, 471, 473, 474, 475, 477])
+
+# Network settings that are only used while connecting, a rehash changes them for the next connection.
+CONNECTION_SETTINGS = frozenset(["server", "port", "ssl", "ipv4", "bindhost", "ssl_cert", "sasl", "user", "realname",
+                                 "znc", "account", "password", "auth_string"])
+# Network settings and the attributes they are loaded into. Attributes are read whenever they are used, so a rehash
+# may change them at any time, those of CONNECTION_SETTINGS are only read when we connect. znc is not among them,
+# the authentication it holds is used up once we sent it and is loaded again on every connect (see loadZncSettings).
+NETWORK_SETTINGS = {
+    "id": "id", "server": "server", "port": "port", "ssl": "ssl", "ipv4": "ipv4", "bindhost": "bindhost",
+    "nick": "mnick", "altnick": "altnick", "user": "user", "realname": "realname", "auth_string": "_auth_string",
+    "account": "account", "password": "password", "sasl": "sasl", "ssl_cert": "ssl_cert",
+    "command_prefix": "command_prefix", "invite_join": "invite_join", "leave_empty_channels": "leave_empty_channels",
+    "modes": "modes", "perform": "perform", "debug_chan": "debug_chan", "administrators": "administrators",
+    "moderators": "moderators", "disallowed_channels": "disallowed_channels", "flood_burst": "flood_burst",
+    "flood_rate": "flood_rate"
+}
+# Settings auth_string and sasl are derived from when the configuration is validated. The derived values change
+# without their own keys changing (see Config.parseAuthString), so all settings are loaded again if one of these does.
+AUTH_SETTINGS = frozenset(["nick", "account", "password", "auth_string", "sasl", "ssl_cert"])
+HOOK_STATS_SETTINGS = frozenset(["hook_stats", "hook_stats_slow_ms", "hook_stats_interval"])
+SASL_CHUNK_SIZE = 400  # AUTHENTICATE payloads are sent base64 encoded, in pieces of at most this many bytes.
+
+
+class IrcConnection:
+    def __init__(self, network, config, engine, modules=None):
+        """
+        network: dict, the network block from the configuration.
+        config: Config object
+        engine: Engine object whose event loop this connection runs on, call start() to schedule it.
+        """
+
         self.running = True
         self.connected = False
         self.shutdownRequested = False
+        self.reconnecting = False
 
         self.network = network
+        self.network_name = network["network_name"]  # Set again once the settings are loaded, see run().
         self.config = config
+        self.engine = engine
+
+        self.task = None
+        self.reader = None
+        self.writer = None
+        self.outqueue = None
+
+        self.capabilities = set()  # The IRCv3 capabilities the server acknowledged.
+        self.cap_available = {}  # capability: value, what the server offers.
+        self.cap_negotiating = False
+        self.prefix_modes = "ov"  # Channel modes that give a nick prefix, highest first (PREFIX in RPL_ISUPPORT).
+        self.prefix_symbols = "@+"  # The prefixes those modes give.
+        self.chanmodes = ("", "", "")  # Channel modes with a parameter: always, always, only when set (CHANMODES).
+        self.sasl_authenticated = False
+        self.registered = False  # True once we sent our JOINs and perform.
+        self.connect_time = None
+        self.pending_joins = set()  # Channels we asked to join since connecting, we are ready once they are empty.
+        self.netsplit = netsplit.NetsplitTracker(engine.loop, self.processBatch)
+
+    def start(self):
+        self.task = self.engine.loop.create_task(self.run())
+        # Reported from the task rather than run(), which never starts if the task is cancelled before it does.
+        self.task.add_done_callback(self._taskDone)
+
+    def _taskDone(self, task):
+        self.running = False
+        self.connected = False
+
+        if not task.cancelled() and task.exception():
+            # The logger of the connection does not exist if loading the settings failed.
+            self.engine.logger.error("Connection to {} failed: {}", self.network_name, repr(task.exception()))
+
+        self.engine.notify(self, STATE_TERMINATED)
+
+    async def run(self):
+        try:
+            self.loadNetworkVariables()
+            self._loadModules()
+
+            self.linebuffer = linebuffer.LineBuffer()  # Kept across rehashes so partial lines are not lost.
 
-        threading.Thread.__init__(self)
-        self.start()
+            while self.running:
+                if await self.connect():
+                    await self.session()
 
-    def run(self):
-        self.loadNetworkVariables()
-        self._loadModules()
+                if not self.running:
+                    break
 
-        self.numeric_regex = re.compile(":.* [0-9]{3}")
+                if self.reconnecting:
+                    self.reconnecting = False
+                    await asyncio.sleep(2)
+                else:  # We failed to connect, each attempt we wait a bit longer.
+                    self.reconnect_attempts += 1
+                    await asyncio.sleep(2 * self.reconnect_attempts)
+        except asyncio.CancelledError:
+            pass
 
-        self.connect()
-        while self.running:
+    async def session(self):
+        """Run the reader and writer tasks for as long as we are connected."""
+        reader = self.engine.loop.create_task(self.readBuffer())
+        writer = self.engine.loop.create_task(self.writeBuffer())
+
+        try:
+            done, pending = await asyncio.wait([reader, writer], return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                if task.exception():
+                    self.logger.error("Connection task failed: {}", repr(task.exception()))
+        finally:
+            reader.cancel()
+            writer.cancel()
+            self.writer.close()
+
+        if self.connected:
+            # The server closed the connection without us asking for it.
+            self.logger.log("Connection to {} was lost. Automatically terminating...", self.server)
+            self.disconnect()
+
+        self.engine.notify(self, STATE_DISCONNECTED)
+
+    async def readBuffer(self):
+        while True:
             try:
-                self.readBuffer()
-            except KeyboardInterrupt:
-                self.shutdownRequested = True
-            except OSError:
-                self.logger.log("OSError caught. Automatically terminating...")
-                self.running = False
-            except Exception as e:
-                if int(time.time()) > self.time_error_per_minute + 60:
-                    self.time_error_per_minute = int(time.time())
-                    self.errors_per_minute = 0
-
-                self.errors_per_minute += 1
-
-                if self.errors_per_minute > 25:
-                    self.running = False
-                    self.quit("Too many errors per minute, exiting.")
-                else:
-                    traceback.print_exc()
-                    tb = traceback.format_exc()
-
-                    if self.debug_chan:
-                        gist = paste.Paste.gist("Traceback for {} on {} at {}".format(self.currentnick,
-                                                self.network_name,
-                                                time.strftime(self.config.getMetadata("timestamp"))),
-                                                tb, "traceback.py", False, self.logger)
-                        self.debug("An exception has occured and has been logged: {} | {}".format(gist, str(e)))
-        self.connected = False
+                buff = await self.reader.read(4096)
+            except OSError as e:
+                self.logger.log("OSError caught: {}", e)
+                return
+
+            if not buff:
+                self.logger.log_verbose("Connection closed by {}.", self.server)
+                return
+
+            for line in self.linebuffer.feedDecoded(buff):
+                try:
+                    self.processLine(line)
+                except Exception as e:
+                    self.handleException(e)
+
+    async def writeBuffer(self):
+        """
+        Write everything send_raw() queued to the socket.
+
+        Lines that were queued at the same time are written in one go, a None in the queue means
+        disconnect() was called: everything before it is flushed and then the connection is closed.
+        """
+
+        outqueue = self.outqueue  # disconnect() unsets it before we have flushed it.
+
+        while True:
+            lines = [await outqueue.get()]
+            while not outqueue.empty():
+                lines.append(outqueue.get_nowait())
+
+            close = None in lines
+            if close:
+                lines = lines[:lines.index(None)]
+
+            try:
+                self.writer.write(b"".join(lines))
+                await self.writer.drain()
+            except OSError as e:
+                self.logger.log("OSError caught: {}", e)
+                return
 
-    def readBuffer(self):
-        buff = self.socket.recv(4096)
-        lines = buff.decode("utf-8").split("\n")
-        for data in lines:
-            data = str(data).strip()
+            if close:
+                return
 
-            if not data:
-                continue
+    def handleException(self, e):
+        if int(time.time()) > self.time_error_per_minute + 60:
+            self.time_error_per_minute = int(time.time())
+            self.errors_per_minute = 0
 
-            words = data.split()
+        self.errors_per_minute += 1
 
-            if len(words) > 1:
-                if words[0] == "PING":
-                    # Reply to PING
-                    self.send_raw("PONG " + words[1])
-                    continue
+        if self.errors_per_minute > 25:
+            self.running = False
+            self.quit("Too many errors per minute, exiting.")
+        else:
+            traceback.print_exc()
+            tb = traceback.format_exc()
 
-                if self.numeric_regex.match(" ".join(words[:2])):
-                    # Check if a server numeric is sent, and handle it appropriately.
-                    if self.on_numeric(int(words[1]), data):
-                        # _processIrcNumeric returns true if we need to continue, false if we don't
-                        continue
+            if self.debug_chan:
+                # Uploading the traceback would block the event loop, leave it to an executor thread.
+                self.engine.loop.run_in_executor(None, self._reportTraceback, tb, str(e))
 
-                if self.isEvent(words[1]):
-                    # Most(?) events share the following syntax:
-                    # :nick!user@host EVENT target [[:]message/params]
+    def _reportTraceback(self, tb, error):
+        gist = paste.Paste.gist("Traceback for {} on {} at {}".format(self.currentnick, self.network_name,
+                                time.strftime(self.config.getMetadata("timestamp"))),
+                                tb, "traceback.py", False, self.logger)
+        self.debug("An exception has occured and has been logged: {} | {}".format(gist, error))
 
-                    uinfo = words[0][1:]
-                    event = words[1]
-                    target = words[2]
-                    params = words[3:] if len(words) > 3 else None
+    def processLine(self, data):
+        message = ircmessage.parse(data)
 
-                    self.processEvent(uinfo, event, target, params)
+        if not message:
+            return
+
+        if message.command == "PING":
+            # Reply to PING
+            self.send_raw("PONG :" + message.param(0, ""))
+            return
+
+        if message.command == "CAP":
+            self.on_cap(message)
+            return
+
+        if message.command == "AUTHENTICATE":
+            self.on_authenticate(message)
+            return
+
+        if message.command == "BATCH":
+            self.on_batch(message)
+            return
+
+        if message.command in USER_EVENTS and message.nick:
+            self.netsplit.flushAll()
+            self.processUserEvent(message)
+            return
+
+        if message.numeric is not None:
+            # Check if a server numeric is sent, and handle it appropriately.
+            if self.on_numeric(message.numeric, message):
+                # on_numeric returns true if we need to continue, false if we don't
+                return
+
+        if message.command in EVENTS and message.params:
+            # Most(?) events share the following syntax:
+            # :nick!user@host EVENT target [[:]message/params]
+            self.processEvent(message)
 
     def rehash(self, reconnect=False):
-        self.config.rehash()
-        self.ratelimiter.stop()
-        self.loadNetworkVariables(self.config.getNetwork(self.network_name), self.currentnick)
-        self.ratelimiter.start()
-        self.ModuleHandler.unloadAll()
-        self._loadModules()
+        """Reload the configuration for every network, see Engine.rehash(). This may be called from any thread."""
+        self.engine.callSoon(self.engine.rehash, self, reconnect)
+
+    def applyConfig(self, changes, reconnect=False):
+        """
+        Apply the changes a rehash made to the configuration (see config.diff()).
+
+        Only what changed is applied: users, channels and the modules whose settings did not change keep their state.
+        """
+
+        network = self.config.getNetwork(self.network_name)
+        if not network:
+            self.logger.notice("Network {} is no longer configured.", self.network_name)
+            return
+
+        changed = changes["networks"].get(self.network_name, set())
+        self.loadNetworkSettings(network, None if changed & AUTH_SETTINGS else changed)
+
+        self.logger.reconfigure(self.config.getLogging(), self.config.getVerbose(), self.config.getTimestampFormat(),
+                                self.config.getLogTimestampFormat(),
+                                self.config.getMetadata("logger_terminal_colours"),
+                                self.config.getLogLevel(self.network_name),
+                                self.config.getLogEvents(self.network_name))
+        logger.configure(self.config.getLogMaxSize(), self.config.getLogCompress())
+
+        if "ignorelist" in changed:
+            self.ignorelist.reload(network["ignorelist"])
+
+        if "flood_burst" in changed or "flood_rate" in changed:
+            self.ratelimiter.burstlimit = self.flood_burst
+            self.ratelimiter.rate = self.flood_rate
+
+        if "command_prefix" in changed:
+            self.commandhelp.command_prefix = self.config.getCommandPrefix(self.network_name)
+            self.commandhelp.commands_gist_md = None
+            self.commandhelp.commands_gist_txt = None
+
+        if "channels" in changed:
+            for chan in network["channels"]:
+                if chan not in self.channels:
+                    self.channels.append(chan)
+                    if self.connected:
+                        self.join_channel(chan)
+
+        if "nick" in changed and self.connected and self.currentnick != self.mnick:
+            self.nick(self.mnick)
+
+        if changed & CONNECTION_SETTINGS and not reconnect:
+            self.logger.log("Changes to {} are applied when we reconnect.",
+                            ", ".join(sorted(changed & CONNECTION_SETTINGS)))
+
+        self._applyModuleConfig(changes)
 
         if reconnect:
             self.reconnect()
-        else:
-            if self.currentnick != self.mnick:
-                self.nick(self.mnick)
 
-        self.logger.log("Rehash completed.")
+        self.logger.log("Rehash completed, changed: {}.", ", ".join(sorted(changed)) if changed else "nothing")
+
+    def _applyModuleConfig(self, changes):
+        """Reload the modules whose settings or API keys changed, and load those that were missing an API key."""
+        reload = [file for file, mod in self.ModuleHandler.modules.items() if mod.module_name in changes["modules"] or
+                  set(mod.api_key) & changes["api_keys"]]
+
+        for file in reload:
+            self.ModuleHandler.reload(file)
+
+        if changes["api_keys"]:
+            for file in self.ModuleHandler.getAvailableModulesList():
+                if file not in self.ModuleHandler.modules:
+                    self.ModuleHandler.load(file)
+
+        if changes["metadata"] & HOOK_STATS_SETTINGS:
+            if self.config.getHookStats():
+                self.ModuleHandler.enableStats(self.config.getHookStatsSlowThreshold() / 1000,
+                                               self.config.getHookStatsInterval())
+            else:
+                self.ModuleHandler.disableStats()
 
     def send_raw(self, data):
-        self.socket.send(bytes(data + "\r\n", "utf-8"))
+        """Hand a raw line to the ratelimiter, this may be called from any thread."""
+        if not self.outqueue:
+            self.logger.log_verbose("Not connected, cannot send: {}", data)
+            return
+
+        self.engine.callSoon(self.ratelimiter.queue, data)
+
+    def _write(self, lines):
+        """Queue a batch of raw lines for the writer task, the ratelimiter calls this once it is their turn."""
+        if self.outqueue:
+            self.outqueue.put_nowait("".join(line + "\r\n" for line in lines).encode("utf-8"))
+
+    def getPrefix(self):
+        """Return nick!user@host as the server relays our messages, assuming a long host if we do not know it."""
+        ud = self.getUserData(self.currentnick) if self.currentnick else False
+        if ud:
+            return "{}!{}@{}".format(ud["nick"], ud["user"], ud["host"])
+
+        return "{}!~{}@{}".format(self.currentnick or self.mnick, self.user, "x" * linesplitter.HOST_LENGTH)
 
     def debug(self, message, format=False):
         self.logger.debug(message)
@@ -154,11 +404,11 @@ class IrcConnection(threading.Thread):
 
     def say(self, target, message, format=False):
         """Queue a PRIVMG to the ratelimiter."""
-        self.queue_privmsg.put([target, message, format], True)
+        self.engine.callSoon(self.ratelimiter.say, target, message, format)
 
     def notice(self, target, notice, format=False):
         """Queue a NOTICE to the ratelimiter."""
-        self.queue_notice.put([target, notice, format], True)
+        self.engine.callSoon(self.ratelimiter.notice, target, notice, format)
 
     def action(self, target, action, format=False):
         """
@@ -167,75 +417,92 @@ class IrcConnection(threading.Thread):
         """
 
         if not format:
-            self.logger.log("Sending ACTION '{}' to {}.".format(action, target))
+            self.logger.log("Sending ACTION '{}' to {}.", action, target)
             self.send_raw("PRIVMSG {} :\x01ACTION {}\x01".format(target, action))
         else:
             parser = formatter.IrcFormatter()
-            self.logger.log("Sending parsed ACTION '{}' to {}.".format(action, target))
+            self.logger.log("Sending parsed ACTION '{}' to {}.", action, target)
             self.send_raw("PRIVMSG {} :\x01ACTION {}\x01".format(target, parser.parse(action)))
 
     def ctcp(self, target, ctcp):
-        self.logger.log("Sending CTCP '{}' to {}.".format(ctcp, target))
+        self.logger.log("Sending CTCP '{}' to {}.", ctcp, target)
         self.send_raw("PRIVMSG {} :\x01{}\x01".format(target, ctcp))
 
     def ctcp_reply(self, target, ctcp, ctcpreply):
-        self.logger.log("Sending CTCPREPLY '{}' to {}.".format(ctcp, target))
+        self.logger.log("Sending CTCPREPLY '{}' to {}.", ctcp, target)
         self.send_raw("NOTICE {} :\x01{} {}\x01".format(target, ctcp, ctcpreply))
 
     def join_channel(self, channel):
         if len(self.disallowed_channels):
             for chan in self.disallowed_channels:
                 if chan.lower() == channel:
-                    self.logger.notice("Tried to join disallowed channel {}.".format(channel))
+                    self.logger.notice("Tried to join disallowed channel {}.", channel)
                     return False
 
-        self.logger.log("Joining channel: {}".format(channel))
+        self.logger.log("Joining channel: {}", channel)
         self.send_raw("JOIN :{}".format(channel))
 
     def part_channel(self, channel, reason=None):
         if not reason:
-            self.logger.log("Parting channel '{}'".format(channel))
+            self.logger.log("Parting channel '{}'", channel)
             self.send_raw("PART {}".format(channel))
         else:
-            self.logger.log("Parting channel '{}' with reason: {}".format(channel, reason))
+            self.logger.log("Parting channel '{}' with reason: {}", channel, reason)
             self.send_raw("PART {} :{}".format(channel, reason))
 
     def quit(self, message=None, callDisconnect=True):
         if not message:
             message = "{} shutting down.".format(self.currentnick)
 
-        self.logger.log("Quitting IRC: {}".format(message))
+        self.logger.log("Quitting IRC: {}", message)
         self.send_raw("QUIT :{}".format(message))
 
         if callDisconnect:
             self.disconnect()
 
-    def disconnect(self, terminateThread=True):
+    def disconnect(self, terminate=True):
+        """Close the connection once everything queued so far has been sent, terminate stops us from reconnecting."""
+        self.engine.callSoon(self._disconnect, terminate)
+
+    def _disconnect(self, terminate):
         self.ModuleHandler.sendDisconnect()
         self.ratelimiter.stop()
         self.currentnick = None
         self.connected = False
         self.server_name = None
-        self.socket.close()
-        if terminateThread:
+        if self.outqueue:
+            self.outqueue.put_nowait(None)
+            self.outqueue = None
+        if terminate:
             self.running = False
 
+    def terminate(self):
+        """Stop a connection that is not connected, such as one waiting to reconnect."""
+        self.running = False
+        if self.task:
+            self.engine.callSoon(self.task.cancel)
+
+    def requestShutdown(self):
+        """Ask the Engine to quit every network."""
+        self.shutdownRequested = True
+        self.engine.notify(self, STATE_SHUTDOWN)
+
     def nick(self, newnick):
         if not self.validator.nickname(newnick):
-            self.logger.notice("Invalid nickname: {}".format(newnick))
+            self.logger.notice("Invalid nickname: {}", newnick)
             return False
 
-        self.logger.log("Assuming new nickname '{}' (changing from {})".format(newnick, self.currentnick))
+        self.logger.log("Assuming new nickname '{}' (changing from {})", newnick, self.currentnick)
         self.send_raw("NICK :{}".format(newnick))
         self.currentnick = newnick
         return True
 
     def mode(self, target, modes):
         if not modes.startswith("+") and not modes.startswith("-") or len(modes) < 2:
-            self.logger.notice("Trying to set invalid modes on {}: '{}'".format(target, modes))
+            self.logger.notice("Trying to set invalid modes on {}: '{}'", target, modes)
             return False
 
-        self.logger.log("Setting modes '{}' on {}".format(modes, target))
+        self.logger.log("Setting modes '{}' on {}", modes, target)
         self.send_raw("MODE {} {}".format(target, modes))
         return True
 
@@ -265,43 +532,180 @@ class IrcConnection(threading.Thread):
             return mask
         return None
 
-    def connect(self, reconnecting=False):
+    async def connect(self):
+        """Open the connection and register with the server, returns False if we could not connect."""
         if self.connected:
             raise Exception("Attempting to connect to {} when already connected as {}"
                             .format(self.server, self.currentnick))
 
+        self.linebuffer.clear()
+        self.loadZncSettings()
+
+        sslcontext = None
         if self.ssl:
-            self.logger.log("Attempting to connect to server ({}:{}) with SSL using {}."
-                            .format(self.server, self.port, "IPv4" if self.ipv4 else "IPv6"))
-            self._connect_ssl()
-        else:
-            self.logger.log("Attempting to connect to server. ({}:{}) using {}."
-                            .format(self.server, self.port, "IPv4" if self.ipv4 else "IPv6"))
-            self._connect()
-        if not reconnecting:
-            self.ratelimiter.start()
-        else:
-            self.ratelimiter = ratelimit.Ratelimit(self, self.logger)
-            self.ratelimiter.start()
+            # Like ssl.wrap_socket() always did for us, we do not verify certificates.
+            sslcontext = ssl.create_default_context()
+            sslcontext.check_hostname = False
+            sslcontext.verify_mode = ssl.CERT_NONE
+
+            if self.ssl_cert:
+                # The certificate (and its key, in the same file) identifies us with SASL EXTERNAL (CertFP).
+                try:
+                    sslcontext.load_cert_chain(self.ssl_cert)
+                except (OSError, ssl.SSLError) as e:
+                    self.logger.error("Could not load ssl_cert {}: {}", self.ssl_cert, str(e))
+
+        self.logger.log("Attempting to connect to server ({}:{}){} using {}.", self.server, self.port,
+                        " with SSL" if self.ssl else "", "IPv4" if self.ipv4 else "IPv6")
+
+        if self.bindhost:
+            self.logger.log('Attempting to bind to {}'.format(self.bindhost))
+
+        self.connect_time = time.monotonic()
+
+        try:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(
+                self.server, self.port, ssl=sslcontext, family=socket.AF_INET if self.ipv4 else socket.AF_INET6,
+                local_addr=(self.bindhost, 0) if self.bindhost else None), CONNECT_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as e:
+            self.logger.notice("Could not connect to {}:{}: {}", self.server, self.port, str(e) or "Timed out")
+            return False
+
+        self.outqueue = asyncio.Queue()
+        self.ratelimiter = ratelimit.Ratelimit(self, self.logger, self.flood_burst, self.flood_rate)
+        self.ratelimiter.start()
+
+        self.capabilities = set()
+        self.cap_available = {}
+        self.cap_negotiating = True
+        self.prefix_modes = "ov"
+        self.prefix_symbols = "@+"
+        self.chanmodes = ("", "", "")
+        self.channel_state.setPrefixes(self.prefix_modes, self.prefix_symbols)
+        self.sasl_authenticated = False
+        self.registered = False
+        self.pending_joins = set()
+        self.netsplit.clear()
+
+        # Servers that do not know CAP ignore it, or reply with ERR_UNKNOWNCOMMAND, and register us as usual.
+        self.send_raw("CAP LS 302")
+        self.send_raw("NICK {}".format(self.mnick))
+        self.currentnick = self.mnick
+        # <username> <hostname> <servername> :<realname> - servername/hostname will be ignored by the ircd.
+        self.send_raw("USER {} 0 0 :{}".format(self.user, self.realname))
+        self.connected = True
+
+        self.engine.notify(self, STATE_CONNECTED)
+        return True
 
     def reconnect(self, message=None):
-        if self.connected:
-            if message:
-                self.quit("Reconnecting: {}".format(message), False)
-            else:
-                self.quit("Reconnecting.", False)
-            time.sleep(2)
-        else:  # We quit by other means than user input.
-            self.reconnect_attempts += 1
-            time.sleep(2 * self.reconnect_attempts)
+        """Quit and connect again, the run() task takes care of connecting once the connection has closed."""
+        if not self.connected:
+            return  # We are not connected, run() is already trying to connect.
+
+        if message:
+            self.quit("Reconnecting: {}".format(message), False)
+        else:
+            self.quit("Reconnecting.", False)
 
+        self.reconnecting = True
         self.disconnect(False)
-        self.socket.close()
 
-        self.connect(True)
+    def on_cap(self, message):
+        """
+        Negotiate IRCv3 capabilities, CAP LS was sent when we connected.
+
+        CAP <nick> <subcommand> [*] :<capabilities>, the * means more lines with capabilities follow.
+        """
+
+        subcommand = message.param(1, "").upper()
+        more = len(message.params) > 3 and message.params[2] == "*"
+        caps = message.params[-1].split() if len(message.params) > 2 else []
+
+        if subcommand == "LS" or subcommand == "NEW":
+            for cap in caps:
+                name, sep, value = cap.partition("=")
+                self.cap_available[name] = value
+
+            if more:
+                return
+
+            wanted = [cap for cap in CAPABILITIES if cap in self.cap_available and cap not in self.capabilities]
+            if self.wantsSasl():
+                wanted.append("sasl")
+            if wanted:
+                self.send_raw("CAP REQ :" + " ".join(wanted))
+            elif self.cap_negotiating:
+                self.endCapabilities()
+        elif subcommand == "ACK":
+            for cap in caps:
+                if cap.startswith("-"):
+                    self.capabilities.discard(cap[1:])
+                else:
+                    self.capabilities.add(cap)
+
+            if more or not self.cap_negotiating:
+                return
+
+            if "sasl" in caps and self.sasl and not self.sasl_authenticated:
+                # Registration waits for CAP END, so we identify before the server lets us join anything.
+                self.logger.log_verbose("Authenticating using SASL {}.", self.sasl)
+                self.send_raw("AUTHENTICATE " + self.sasl)
+            else:
+                self.endCapabilities()
+        elif subcommand == "NAK":
+            self.logger.notice("The server refused the capabilities: {}", " ".join(caps))
+            if self.cap_negotiating:
+                self.endCapabilities()
+        elif subcommand == "DEL":
+            for cap in caps:
+                self.capabilities.discard(cap)
+                self.cap_available.pop(cap, None)
+            self.logger.log_verbose("The server no longer supports the capabilities: {}", " ".join(caps))
+
+    def endCapabilities(self):
+        self.cap_negotiating = False
+        self.send_raw("CAP END")
+        self.logger.log("Enabled capabilities: {}", ", ".join(sorted(self.capabilities)) or "none")
+
+    def wantsSasl(self):
+        """Return True if we should request the sasl capability, the server may list the mechanisms it supports."""
+        if not self.sasl or self.sasl_authenticated or "sasl" not in self.cap_available or not self.cap_negotiating:
+            return False
+
+        mechanisms = self.cap_available["sasl"]
+        if mechanisms and self.sasl not in mechanisms.upper().split(","):
+            self.logger.notice("The server does not support SASL {}, only {}.", self.sasl, mechanisms)
+            return False
+
+        return True
+
+    def on_authenticate(self, message):
+        """The server is ready for our credentials (AUTHENTICATE +)."""
+        if message.param(0) != "+" or not self.sasl:
+            return
+
+        if self.sasl == "EXTERNAL":
+            # The server identifies us by our client certificate, we only have to confirm.
+            self.send_raw("AUTHENTICATE +")
+            return
+
+        credentials = "{0}\0{0}\0{1}".format(self.account, self.password).encode("utf-8")
+        payload = base64.b64encode(credentials).decode("ascii")
+
+        for i in range(0, len(payload), SASL_CHUNK_SIZE):
+            self.send_raw("AUTHENTICATE " + payload[i:i + SASL_CHUNK_SIZE])
+
+        if len(payload) % SASL_CHUNK_SIZE == 0:
+            # A full last piece means more is coming, an empty one tells the server we are done.
+            self.send_raw("AUTHENTICATE +")
 
     def identify(self):
         """Attempt to identify to services using the auth_string, returns True if auth_string was set, False if not."""
+        if self.sasl_authenticated:
+            self.logger.log_verbose("Not identifying - we identified using SASL.")
+            return False
+
         if self._auth_string:
             self.send_raw(self._auth_string)
             self.logger.log_verbose("Identifying to services.")
@@ -319,89 +723,100 @@ class IrcConnection(threading.Thread):
         """
 
         if self.last_uwho and nick == self.last_uwho:
-            self.logger.log_verbose("send_who(): WHO {} prevented, recently WHO'd nick.".format(nick))
+            self.logger.log_verbose("send_who(): WHO {} prevented, recently WHO'd nick.", nick)
             return False
 
         if nick.startswith("#"):
-            self.logger.error("send_who({}): expects a nick, not a channel.".format(nick))
+            self.logger.error("send_who({}): expects a nick, not a channel.", nick)
             return False
 
-        self.logger.log_verbose("send_who(): WHO {}".format(nick))
+        self.logger.log_verbose("send_who(): WHO {}", nick)
         self.send_raw("WHO {} %tuhnfar,000".format(nick))
         self.last_uwho = nick
 
-    def send_chanwho(self, channel):
+    def send_chanwho(self, channel, forget=True):
         """
         Request /WHO data from server
         This data is prepended with '001' so the bot can distinguish it from other WHO requests.
         format: 001 channel user host nick status account realname
         This should be used to identify a channel.
+
+        forget: whether to forget who is in the channel first, pass False when NAMES already tells us.
         """
         if not channel.startswith("#"):
-            self.logger.error("send_chanwho({}) expects a channel, not a nick.".format(channel))
+            self.logger.error("send_chanwho({}) expects a channel, not a nick.", channel)
             return False
         if self.last_chanwho:
             if self.last_chanwho[0] == channel and int(time.time()) < self.last_chanwho[1] + 5:
                 # Let's not flood the server too much, one chanwho per channel per 5 seconds
-                self.logger.log_verbose("send_chanwho(): WHO {} prevented, recently WHO'd channel.".format(channel))
+                self.logger.log_verbose("send_chanwho(): WHO {} prevented, recently WHO'd channel.", channel)
                 return False
 
-        if channel.lower() in self.channel_data:
-            self.channel_data.pop(channel.lower())
+        if forget:
+            self.channel_state.remove(channel)
 
-        self.logger.log_verbose("send_chanwho(): WHO {}".format(channel))
+        self.logger.log_verbose("send_chanwho(): WHO {}", channel)
         self.send_raw("WHO {} %tcuhnfar,001".format(channel))
         self.last_chanwho = [channel, int(time.time())]
 
     def isEvent(self, event):
-        if event in ["PRIVMSG", "NOTICE", "MODE", "JOIN", "PART", "INVITE", "KICK", "QUIT"]:
-            return True
-        return False
-
-    def processEvent(self, uinfo, event, target, params_list):
-        nick = uinfo.split("!")[0]
-        user = ""
-        host = ""
-        params = ""
-
-        if event in ["PRIVMSG", "NOTICE", "JOIN", "PART", "KICK"] and self.validator.hostmask(uinfo):
-            user = uinfo.split("@")[0][len(nick) + 1:]
-            host = uinfo.split("@")[1]
-
-            udata = self.getUserData(nick)  # Set host / ident so no /WHO is needed.
-            if not udata:
-                self.send_who(nick)
-
-        if params_list:
-            params = " ".join(params_list)
-            if params.startswith(":"):
-                params = params[1:]
-
-        if target:
-            if target.startswith(":"):
-                target = target[1:]
+        return event in EVENTS
+
+    def processEvent(self, message):
+        uinfo = message.prefix or "*"
+        nick = message.nick or uinfo
+        user = message.user or ""
+        host = message.host or ""
+        event = message.command
+        target = message.params[0]
+
+        batch = None
+        if event == "QUIT" or event == "JOIN":
+            batch = self.netsplit.classify(message, nick)
+
+        if event == "JOIN" and "extended-join" in self.capabilities and len(message.params) >= 3:
+            # JOIN #channel account :realname tells us everything WHO would, except whether they are an oper.
+            self.setUserData(nick, user, host, message.params[1], message.params[2])
+        elif event in ["PRIVMSG", "NOTICE", "JOIN", "PART", "KICK"] and user and host and not batch:
+            # Users returning from a netsplit are not WHO'd one by one, we most likely know them already.
+            if "account-tag" in self.capabilities:
+                # Messages of users who are logged in carry their account, those without the tag are not logged in.
+                self.setUserData(nick, user, host, message.tags.get("account", "*") if message.tags else "*")
+            elif not self.tracksAccounts():
+                # WHO is the fallback for servers that do not tell us accounts themselves.
+                udata = self.getUserData(nick)  # Set host / ident so no /WHO is needed.
+                if not udata or udata["account"] is None:  # We know them from NAMES, but not their account.
+                    self.send_who(nick)
+
+        self.logger.record(event, nick, target, message.params[1:], user, host, message.tags)
 
         if uinfo != "*" and self.ignorelist.isIgnoredWildcard(uinfo):
             self.logger.log("Not processing " + event + " event because [" + str(uinfo) + "] is ignored.")
             return False
 
+        if batch:
+            self.netsplit.add(batch, nick, target)
+            return
+        elif event != "PRIVMSG" and event != "NOTICE":
+            # Whatever the netsplit changed has to be known before we look at changes to the same channels.
+            self.netsplit.flushAll()
+
         if event == "PRIVMSG":
-            self.on_privmsg(nick, target, params, [nick, user, host, uinfo])
+            self.on_privmsg(nick, target, message.param(1, ""), [nick, user, host, uinfo])
         elif event == "NOTICE":
-            self.on_notice(nick, target, params)
+            self.on_notice(nick, target, message.param(1, ""))
         elif event == "MODE":
-            self.on_mode(nick, target, params)
+            self.on_mode(nick, target, " ".join(message.params[1:]))
         elif event == "JOIN":
             self.on_join(nick, target)
         elif event == "PART":
-            self.on_part(nick, target, params)
+            self.on_part(nick, target, message.param(1, ""))
         elif event == "INVITE":
-            self.on_invite(nick, params)
+            self.on_invite(nick, message.param(1, ""))
         elif event == "KICK":
-            kreason = " ".join(params_list[1:])[1:]
-            self.on_kick(nick, target, params_list[0], kreason if kreason else "No reason.")
+            self.on_kick(nick, target, message.param(1, ""), message.param(2) or "No reason.")
         elif event == "QUIT":
-            self.on_quit(nick, params)
+            self.on_quit(nick, target)
 
     def on_privmsg(self, nick, target, message, uinfo=None):
         if message.startswith("\x01") and message.endswith("\x01"):
@@ -412,7 +827,7 @@ class IrcConnection(threading.Thread):
                 if success:
                     return True
         else:
-            self.logger.event("PRIVMSG", "{}/{}: {}".format(nick, target, message))
+            self.logger.event("PRIVMSG", "{}/{}: {}", nick, target, message)
             self.ModuleHandler.sendPrivmsg(target, nick, message)
 
         # Message looks like one of: nick: <cmd> | nick, <cmd> | nick <cmd>
@@ -426,11 +841,11 @@ class IrcConnection(threading.Thread):
             self.on_command(nick, target, message, uinfo)
 
     def on_action(self, nick, target, message):
-        self.logger.event("ACTION", "{}/{}: * {} {}".format(nick, target, nick, message))
+        self.logger.event("ACTION", "{}/{}: * {} {}", nick, target, nick, message)
         self.ModuleHandler.sendAction(target, nick, message)
 
     def on_ctcp(self, nick, target, ctcp):
-        self.logger.event("CTCP", "{}/{}: {}".format(nick, target, ctcp))
+        self.logger.event("CTCP", "{}/{}: {}", nick, target, ctcp)
 
         if ctcp == "CLIENTINFO":
             self.ctcp_reply(nick, ctcp, "CLIENTINFO MAINTAINER PING TIME VERSION")
@@ -464,24 +879,61 @@ class IrcConnection(threading.Thread):
                 self.server_name = nick
                 self.ModuleHandler.sendConnect()
         else:
-            self.logger.event("NOTICE", "{}/{}: {}".format(nick, target, message))
+            self.logger.event("NOTICE", "{}/{}: {}", nick, target, message)
 
     def on_mode(self, nick, target, modes):
-        self.logger.event("MODE", "{}/{} sets mode: {}".format(nick, target, modes))
-        if target.startswith("#") and ("o" in modes or "v" in modes):
+        self.logger.event("MODE", "{}/{} sets mode: {}", nick, target, modes)
+        if not target.startswith("#"):
+            return
+
+        if self.tracksMembership():
+            self.applyChannelModes(target, modes.split())
+        elif "o" in modes or "v" in modes:
             self.send_chanwho(target)
 
+    def applyChannelModes(self, channel, words):
+        """Update the status of the members of channel from a mode change: words is ["+o-v", "nick", "nick2"]."""
+        adding = True
+        params = words[1:]
+
+        for mode in words[0] if words else "":
+            if mode == "+":
+                adding = True
+            elif mode == "-":
+                adding = False
+            elif mode in self.prefix_modes:
+                if not params:
+                    break
+
+                nick = params.pop(0)
+                self.channel_state.setMode(channel, nick, self.channel_state.modeBit(mode), adding)
+            elif mode in self.chanmodes[0] or mode in self.chanmodes[1] or (adding and mode in self.chanmodes[2]):
+                if params:
+                    params.pop(0)
+
     def on_join(self, nick, channel):
-        self.logger.event("JOIN", "{} joined {}".format(nick, channel))
+        self.logger.event("JOIN", "{} joined {}", nick, channel)
 
         if nick != self.currentnick:
-            if channel.lower() in self.channel_data:
-                self.channel_data[channel.lower()]["regular"].append(nick.lower())
+            if self.channel_state.has(channel):
+                self.channel_state.set(channel, nick)
             else:
-                self.logger.notice_verbose("on_join({}, {}): channel was not in channel_data".format(nick, channel))
+                self.logger.notice_verbose("on_join({}, {}): channel was not in channel_state", nick, channel)
                 self.send_chanwho(channel)
         else:
-            self.send_chanwho(channel)
+            if self.tracksMembership():
+                # The server follows up with NAMES, which lists everyone in the channel along with their status.
+                self.channel_state.reset(channel)
+
+                if self.tracksAccounts() and "account-tag" not in self.capabilities:
+                    # NAMES does not tell us their accounts, one WHO of the channel does so for everyone in it.
+                    self.send_chanwho(channel, False)
+            else:
+                self.send_chanwho(channel)
+
+            if self.pending_joins:
+                self.channelJoined(channel)
+
             if channel not in self.channels:
                 self.channels.append(channel)
                 self.ModuleHandler.sendSelfJoin(channel)
@@ -491,9 +943,9 @@ class IrcConnection(threading.Thread):
 
     def on_part(self, nick, channel, message=None):
         if not message:
-            self.logger.event("PART", "{} parted {}".format(nick, channel))
+            self.logger.event("PART", "{} parted {}", nick, channel)
         else:
-            self.logger.event("PART", "{} parted {}: {}".format(nick, channel, message))
+            self.logger.event("PART", "{} parted {}: {}", nick, channel, message)
 
         if nick != self.currentnick:
             self.channeldata_remove_user(nick, channel)
@@ -501,9 +953,7 @@ class IrcConnection(threading.Thread):
             self.check_channel_empty(channel)
         else:
             self.channelmanager.delete(channel)
-
-            if channel.lower() in self.channel_data:
-                self.channel_data.pop(channel.lower())
+            self.channel_state.remove(channel)
 
             if channel in self.channels:
                 self.channels.remove(channel)
@@ -512,40 +962,132 @@ class IrcConnection(threading.Thread):
         self.ModuleHandler.sendPart(nick, channel, message)
 
     def on_kick(self, nick, channel, knick, reason):
-        self.logger.event("KICK", "{} was kicked from {} by {}: {}".format(knick, channel, nick, reason))
+        self.logger.event("KICK", "{} was kicked from {} by {}: {}", knick, channel, nick, reason)
 
         if knick == self.currentnick:
             self.channelmanager.delete(channel)
-            if channel.lower() in self.channel_data:
-                self.channel_data.pop(channel.lower())
+            self.channel_state.remove(channel)
             if channel in self.channels:
                 self.channels.remove(channel)
                 self.ModuleHandler.sendSelfPart(channel)
         else:
+            self.channeldata_remove_user(knick, channel)
             self.check_channel_empty(channel)
 
         self.ModuleHandler.sendKick(nick, channel, knick, reason)
 
     def on_invite(self, nick, channel):
-        self.logger.event("INVITE", "{} invited me to join {}".format(nick, channel))
+        self.logger.event("INVITE", "{} invited me to join {}", nick, channel)
 
         if self.invite_join:
             self.join_channel(channel)
 
     def on_quit(self, nick, message=None):
-        self.logger.event("QUIT", "{} has quit IRC: {}".format(nick, "Quit" if not message else message))
+        self.logger.event("QUIT", "{} has quit IRC: {}", nick, "Quit" if not message else message)
 
-        for chan in self.channel_data:
-            if self.isOn(nick, chan):
-                self.channeldata_remove_user(nick, chan)
-                self.check_channel_empty(chan)
+        for chan in self.channel_state.quit(nick):
+            self.check_channel_empty(chan)
 
         if nick == self.currentnick and self.connected:
-            self.logger.notice("We have disconnected from {}, attempting to reconnect.".format(self.server_name))
+            self.logger.notice("We have disconnected from {}, attempting to reconnect.", self.server_name)
             self.reconnect()
 
         self.ModuleHandler.sendQuit(nick, message)
 
+    def on_batch(self, message):
+        """IRCv3 batch: BATCH +reference type [params] starts one, BATCH -reference ends it."""
+        reference = message.param(0, "")
+
+        if reference.startswith("+"):
+            self.netsplit.startBatch(reference[1:], message.param(1, "").lower(), " ".join(message.params[2:]))
+        elif reference.startswith("-"):
+            self.netsplit.endBatch(reference[1:])
+
+    def processBatch(self, batch, events):
+        """
+        Process the QUITs of a netsplit, or the JOINs of users returning from one, all at once.
+
+        events: list of (nick, quit message) or (nick, channel).
+        """
+
+        if batch.kind == netsplit.NETSPLIT:
+            self.logger.event("QUIT", "Netsplit {}: {} users quit", batch.servers, len(events))
+
+            for nick, message in events:
+                self.channel_state.quit(nick)
+            # We do not leave channels that are empty now, everyone is expected to be back shortly.
+
+            self.ModuleHandler.sendNetsplit(batch.servers, events)
+        else:
+            self.logger.event("JOIN", "Netsplit {} is over: {} users rejoined", batch.servers, len(events))
+
+            unknown = set()
+            for nick, chan in events:
+                if self.channel_state.has(chan):
+                    self.channel_state.set(chan, nick)
+                else:
+                    unknown.add(chan)
+
+            for chan in unknown:
+                self.send_chanwho(chan)
+
+            self.ModuleHandler.sendNetjoin(batch.servers, events)
+
+    def processUserEvent(self, message):
+        """Handle the events in USER_EVENTS, some of which are only sent with the matching IRCv3 capability."""
+        nick = message.nick
+        event = message.command
+
+        if event == "NICK":
+            self.on_nick(nick, message.param(0, nick))
+        elif event == "ACCOUNT":  # account-notify
+            self.on_account(nick, message.param(0, "*"))
+        elif event == "AWAY":  # away-notify
+            self.on_away(nick, message.param(0))
+        elif event == "CHGHOST" and len(message.params) >= 2:  # chghost
+            self.on_chghost(nick, message.params[0], message.params[1])
+
+    def on_nick(self, nick, newnick):
+        self.logger.event("NICK", "{} is now known as {}", nick, newnick)
+
+        if nick == self.currentnick:
+            self.currentnick = newnick
+
+        self.config.forgetHostmask(self.network_name, nick)
+
+        old = nick.lower()
+        new = newnick.lower()
+
+        if old in self.user_data:
+            udata = self.user_data.pop(old)
+            udata["nick"] = newnick
+            self.user_data[new] = udata
+
+        self.channel_state.rename(old, new)
+
+    def on_account(self, nick, account):
+        """account is * when they logged out."""
+        self.logger.log_verbose("{} is now identified as: {}", nick, account)
+
+        udata = self.getUserData(nick)
+        if udata:
+            udata["account"] = "0" if account == "*" else account
+            udata["identified"] = account != "*"
+
+    def on_away(self, nick, message=None):
+        udata = self.getUserData(nick)
+        if udata:
+            udata["away"] = bool(message)
+
+    def on_chghost(self, nick, user, host):
+        self.logger.log_verbose("{} changed their host to {}@{}", nick, user, host)
+        self.config.forgetHostmask(self.network_name, nick)
+
+        udata = self.getUserData(nick)
+        if udata:
+            udata["user"] = user
+            udata["host"] = host
+
     def on_command(self, nick, target, message, uinfo):
         split = message.split()
         command = ""
@@ -575,10 +1117,19 @@ class IrcConnection(threading.Thread):
 
         success = self.ModuleHandler.sendCommand(ttarget, nick, command, params, mod, admin)
 
-        self.logger.event("COMMAND", "{}/{} sent command '{}' with result: {}"
-                                     .format(nick, target, command, "Success" if success else "Command did not exist"))
+        if success:
+            self.logger.event("COMMAND", "{}/{} sent command '{}' with result: Success", nick, target, command)
+        else:
+            self.commandNotFound(ttarget, nick, command)
+
+        return success
+
+    def commandNotFound(self, target, nick, command):
+        """No module handled the command nick sent to target (nick itself for a query), tell them in a query."""
+        self.logger.event("COMMAND", "{}/{} sent command '{}' with result: Command did not exist",
+                          nick, target, command)
 
-        if (not success and target == self.currentnick and nick != self.currentnick and
+        if (target == nick and nick != self.currentnick and
             ((nick not in self.cmdhelp_delays) or  # Not in cmdhelp dict or 10 seconds passed.
              (nick in self.cmdhelp_delays and int(time.time()) > self.cmdhelp_delays[nick] + 10))):
             self.say(nick, ("I'm sorry, but I did not understand the command '$(bold){}$(bold)'. " +
@@ -586,22 +1137,62 @@ class IrcConnection(threading.Thread):
                      .format(command, self.command_prefix), True)
             self.cmdhelp_delays[nick] = int(time.time())
 
-        return success
-
-    def on_numeric(self, numeric, data):
+    def on_numeric(self, numeric, message):
         """
         The ircd sends numerics to indicate something is wrong (or right),
         This method will interact with a few of them
 
+        message: IrcMessage, the parsed line. The first parameter is always our own nickname.
+
         https://www.alien.net.au/irc/irc2numerics.html
         """
 
         if numeric == 354:
             # RPL_WHOREPLY
-            whodata = data.split()[3:]
+            whodata = message.params[1:]
             if len(whodata):
                 self.on_whoreply(whodata)
 
+        if numeric == 1:
+            # RPL_WELCOME, servers that do not know CAP register us without negotiating.
+            self.cap_negotiating = False
+
+            nick = message.param(0)
+            if nick and nick != self.currentnick:
+                self.currentnick = nick
+
+            if self.sasl_authenticated:
+                # We are identified already, there is no need to wait for the MOTD to join our channels.
+                self.onRegistered()
+
+        if numeric == 900:
+            # RPL_LOGGEDIN
+            self.logger.log("Identified as {} using SASL.", message.param(2, "?"))
+
+        if numeric == 903 or numeric == 907:
+            # RPL_SASLSUCCESS or ERR_SASLALREADY
+            self.sasl_authenticated = True
+            if self.cap_negotiating:
+                self.endCapabilities()
+
+        if numeric in (902, 904, 905, 906):
+            # ERR_NICKLOCKED, ERR_SASLFAIL, ERR_SASLTOOLONG, ERR_SASLABORTED
+            self.logger.notice("SASL authentication failed ({}): {}", numeric, message.params[-1])
+            if self.cap_negotiating:
+                self.endCapabilities()
+
+        if numeric in JOIN_ERRORS and self.pending_joins:
+            # We will not get to join this channel, do not wait for it before we call ourselves ready.
+            self.channelJoined(message.param(1, ""))
+
+        if numeric == 5:
+            # RPL_ISUPPORT
+            self.on_isupport(message.params[1:-1])
+
+        if numeric == 353 and self.tracksMembership():
+            # RPL_NAMREPLY
+            self.on_names(message.param(2, ""), message.param(3, ""))
+
         if numeric == 433:
             # Nick is already taken.
             if self.currentnick != self.altnick:
@@ -611,36 +1202,58 @@ class IrcConnection(threading.Thread):
             # No MOTD found or End of MOTD
 
             # Set name to what it really is as provided by the server over what we think it is.
-            nick = data.split()[2]
-            if nick != self.currentnick:
-                self.logger.notice_verbose("Incorrect currentnick: {} -> {}".format(self.currentnick, nick))
+            nick = message.param(0)
+            if nick and nick != self.currentnick:
+                self.logger.notice_verbose("Incorrect currentnick: {} -> {}", self.currentnick, nick)
                 self.currentnick = nick
 
-            self.identify()  # Identify to services.
-
-            if self.modes:
-                self.mode(self.currentnick, self.modes)
-
-            if len(self.channels):
-                self.send_raw("JOIN :" + ",".join(self.channels))
-            else:
-                self.logger.log_verbose("Not configured to join any channels.")
-
-            if self.perform:
-                for perform in self.perform:
-                    self.send_raw(perform)
+            if not self.registered:
+                self.identify()  # Identify to services.
+                self.onRegistered()
 
             if not self.server_name:
                 self.logger.notice_verbose("Could not retrieve server name, using network name instead.")
                 self.server_name = self.network_name
 
-            self.logger.log("A connection has been established with {}.".format(self.server_name))
+            self.logger.log("A connection has been established with {}.", self.server_name)
 
-        self.ModuleHandler.sendNumeric(numeric, data)
+        self.ModuleHandler.sendNumeric(numeric, message)
         return False
 
+    def onRegistered(self):
+        """Set our modes, join our channels and send the perform commands, once we are registered."""
+        self.registered = True
+
+        if self.modes:
+            self.mode(self.currentnick, self.modes)
+
+        if len(self.channels):
+            self.pending_joins = set(chan.lower() for chan in self.channels)
+            self.send_raw("JOIN :" + ",".join(self.channels))
+        else:
+            self.logger.log_verbose("Not configured to join any channels.")
+            self.channelJoined(None)
+
+        if self.perform:
+            for perform in self.perform:
+                self.send_raw(perform)
+
+    def channelJoined(self, channel):
+        """Mark channel as no longer pending, and log how long it took to get ready when it was the last one."""
+        if channel:
+            self.pending_joins.discard(channel.lower())
+
+        if not self.pending_joins and self.connect_time is not None:
+            self.logger.log("Ready after {:.2f} seconds{}.", time.monotonic() - self.connect_time,
+                            ", identified using SASL" if self.sasl_authenticated else "")
+            self.connect_time = None
+
     def on_whoreply(self, args):
-        """Handles custom WHO requests by the bot."""
+        """
+        Handles custom WHO requests by the bot.
+
+        args: list, the parameters of the 354 reply after our nickname. The realname is the last (trailing) one.
+        """
 
         if args[0] == "000" and len(args) >= 7:  # self.send_who() response
             """format: 000 user host nick status account realname"""
@@ -657,7 +1270,7 @@ class IrcConnection(threading.Thread):
                 "host": args[2],
                 "away": "G" in args[4],
                 "oper": "*" in args[4],
-                "realname": " ".join(args[6:])[1:]
+                "realname": " ".join(args[6:])
             }
         elif args[0] == "001" and len(args) >= 8:  # self.send_chanwho() response
             """format: 001 channel user host nick status account realname"""
@@ -674,59 +1287,90 @@ class IrcConnection(threading.Thread):
                 "host": args[3],
                 "away": "G" in args[5],
                 "oper": "*" in args[5],
-                "realname": " ".join(args[7:])[1:]
+                "realname": " ".join(args[7:])
             }
 
-            iChan = args[1].lower()
-            iNick = args[4].lower()
-            if iChan not in self.channel_data:
-                self.channel_data[iChan] = {"op": [], "voice": [], "regular": []}
+            # The status is H or G (here or gone), * for opers and then the prefixes of the user in the channel.
+            self.channel_state.set(args[1], args[4], self.channel_state.bitsOf(args[5][1:].lstrip("*")))
+
+    def on_isupport(self, tokens):
+        """Remember the features of the server we need to follow mode changes: PREFIX and CHANMODES."""
+        for token in tokens:
+            name, sep, value = token.partition("=")
+
+            if name == "PREFIX" and value.startswith("("):
+                modes, sep, symbols = value[1:].partition(")")
+                if len(modes) == len(symbols):
+                    self.prefix_modes = modes
+                    self.prefix_symbols = symbols
+                    self.channel_state.setPrefixes(modes, symbols)
+            elif name == "CHANMODES":
+                groups = value.split(",")
+                if len(groups) >= 3:
+                    self.chanmodes = tuple(groups[:3])
+
+    def on_names(self, channel, names):
+        """
+        Add the users in a NAMES reply to channel_state and user_data.
 
-            if "@" in args[5]:
-                self.channel_data[iChan]["op"].append(iNick)
-            elif "+" in args[5]:
-                self.channel_data[iChan]["voice"].append(iNick)
-            else:
-                self.channel_data[iChan]["regular"].append(iNick)
+        With multi-prefix and userhost-in-names the entries look like @+nick!user@host.
+        """
+
+        for entry in names.split():
+            mask = entry.lstrip(self.prefix_symbols)
+            nick, user, host = ircmessage.splitPrefix(mask)
+
+            self.channel_state.set(channel, nick, self.channel_state.bitsOf(entry[:len(entry) - len(mask)]))
+            if user and host:
+                self.setUserData(nick, user, host)
+
+    def tracksMembership(self):
+        """Whether the server tells us who is in our channels (and their status), so we need not WHO them."""
+        return "multi-prefix" in self.capabilities and "userhost-in-names" in self.capabilities
+
+    def tracksAccounts(self):
+        """Whether the server tells us the accounts of users, so we need not WHO them one by one."""
+        return "account-tag" in self.capabilities or \
+            ("extended-join" in self.capabilities and "account-notify" in self.capabilities)
+
+    def setUserData(self, nick, user, host, account=None, realname=None):
+        """
+        Remember nick!user@host, along with their account and realname if we know them, in user_data.
+
+        account: * (or 0) if they are not identified, None if we do not know. Whatever we knew before is kept.
+        """
+
+        iName = nick.lower()
+        udata = self.user_data.get(iName)
+
+        if udata is None:
+            udata = self.user_data[iName] = {"identified": False, "account": None, "nick": nick, "user": user,
+                                             "host": host, "away": False, "oper": False, "realname": ""}
+
+        udata["nick"] = nick
+        udata["user"] = user
+        udata["host"] = host
+
+        if account is not None:
+            udata["account"] = "0" if account == "*" else account
+            udata["identified"] = udata["account"] != "0"
+        if realname is not None:
+            udata["realname"] = realname
+
+        return udata
 
     def channeldata_remove_user(self, nick, channel):
         """Check if user is in channel data array, remove if they are"""
-        nick = nick.lower()
-        channel = channel.lower()
-
-        if channel in self.channel_data:
-            if self.isOp(nick, channel):
-                self.channel_data[channel]["op"].remove(nick)
-            elif self.isVoice(nick, channel):
-                self.channel_data[channel]["voice"].remove(nick)
-            elif self.isOn(nick, channel):
-                self.channel_data[channel]["regular"].remove(nick)
+        self.channel_state.part(channel, nick)
 
     def isOp(self, nick, channel):
-        nick = nick.lower()
-        channel = channel.lower()
-
-        if channel in self.channel_data:
-            return nick in self.channel_data[channel]["op"]
-        return False
+        return self.channel_state.isOp(channel, nick)
 
     def isVoice(self, nick, channel):
-        nick = nick.lower()
-        channel = channel.lower()
-
-        if channel in self.channel_data:
-            return nick in self.channel_data[channel]["op"] or nick in self.channel_data[channel]["voice"]
-        return False
+        return self.channel_state.isVoice(channel, nick)
 
     def isOn(self, nick, channel):
-        nick = nick.lower()
-        channel = channel.lower()
-
-        if channel in self.channel_data:
-            return (nick in self.channel_data[channel]["op"] or
-                    nick in self.channel_data[channel]["voice"] or
-                    nick in self.channel_data[channel]["regular"])
-        return False
+        return self.channel_state.isOn(channel, nick)
 
     def isOper(self, nick):
         nick = nick.lower()
@@ -770,11 +1414,8 @@ class IrcConnection(threading.Thread):
         return False
 
     def getChannelData(self, channel):
-        channel = channel.lower()
-
-        if channel in self.channel_data:
-            return self.channel_data[channel]
-        return False
+        """Return {"op": [nicks], "voice": [nicks], "regular": [nicks]} for channel, False if we do not know it."""
+        return self.channel_state.getChannelData(channel) or False
 
     def isRunning(self):
         return True if self.running else False
@@ -784,75 +1425,54 @@ class IrcConnection(threading.Thread):
 
     def check_channel_empty(self, channel):
         if self.leave_empty_channels:
-            ucount = 0
-            cdata = self.getChannelData(channel)
-            if cdata:
-                for value in cdata.items():
-                    for user in value[1]:
-                        ucount += 1
-
-            if ucount == 1:
+            if self.channel_state.count(channel) == 1:
                 self.part_channel(channel, "Channel is empty, leaving channel.")
 
-    def register_command(self, command, params, help, priv, aliases=None, module=None):
-        self.commandhelp.register(command, params, help, priv, aliases, module)
+    def register_command(self, command, params, help, priv, aliases=None, module=None, handler=None):
+        self.commandhelp.register(command, params, help, priv, aliases, module, handler)
 
     def unregister_command(self, command):
         self.commandhelp.unregister(command)
 
-    def loadNetworkVariables(self, network=None, curnick=None):
-        """variables that will get created on initialisation, recreated on rehash"""
-        if not network:
-            network = self.network
+    def loadNetworkSettings(self, network, keys=None):
+        """
+        Load the settings of network that can be changed by a rehash without resetting any state.
 
-        self.id = network["id"]
+        keys: the keys of network to load (those a rehash changed), all of NETWORK_SETTINGS if None.
+        """
+
+        self.network = network
         self.network_name = network["network_name"]
-        self.server_name = None  # Gets set upon connecting.
-        self.server = network["server"]
-        self.port = network["port"]
-        self.ssl = network["ssl"]
-        self.ipv4 = network["ipv4"]
-        self.bindhost = network["bindhost"]
 
-        self.znc = type(network["znc"]) == str  # False if not using znc, true otherwise.
+        for key in NETWORK_SETTINGS if keys is None else keys:
+            if key in NETWORK_SETTINGS:
+                setattr(self, NETWORK_SETTINGS[key], network[key])
+
+    def loadZncSettings(self):
+        """Load the ZNC password, which is forgotten once we logged in, from the settings of the network."""
+        self.znc = type(self.network["znc"]) == str  # False if not using znc, true otherwise.
         if self.znc:
             # the user/network:password phrase if self.znc is true
             # for security reasons, this will unset itself automatically once used.
-            self.znc_auth = network["znc"]
+            self.znc_auth = self.network["znc"]
         else:
             self.znc_auth = False
 
-        self.mnick = network["nick"]
-        self.altnick = network["altnick"]
-        self.user = network["user"]
-        self.realname = network["realname"]
-
-        self._auth_string = network["auth_string"]
-
-        self.command_prefix = network["command_prefix"]
-        self.invite_join = network["invite_join"]
-        self.leave_empty_channels = network["leave_empty_channels"]
-        self.modes = network["modes"]
-        self.perform = network["perform"]
+    def loadNetworkVariables(self, network=None, curnick=None):
+        """variables that will get created on initialisation"""
+        if not network:
+            network = self.network
 
+        self.loadNetworkSettings(network)
+        self.loadZncSettings()
+        self.server_name = None  # Gets set upon connecting.
         self.channels = network["channels"]
-        self.debug_chan = network["debug_chan"]
-
-        self.administrators = network["administrators"]
-        self.moderators = network["moderators"]
-
-        self.disallowed_channels = network["disallowed_channels"]
-
         self.ignorelist = ignorelist.IgnoreList(network["ignorelist"])
-
         self.currentnick = curnick
 
-        self.queue_privmsg = queue.Queue()
-        self.queue_notice = queue.Queue()
-
         self.user_data = {}  # Data gathered by /WHO
         self.last_uwho = None
-        self.channel_data = {}
+        self.channel_state = channelstate.ChannelState(self.prefix_modes, self.prefix_symbols)
         self.last_chanwho = None  # Last channel who (self.send_chanwho())
         self.cmdhelp_delays = {}  # Pause before telling someone their command was not correct to avoid endless loops
 
@@ -860,76 +1480,22 @@ class IrcConnection(threading.Thread):
 
         self.logger = logger.Logger(self.network_name, self.config.getLogging(), self.config.getVerbose(),
                                     self.config.getTimestampFormat(), self.config.getLogTimestampFormat(),
-                                    self.config.getMetadata("logger_terminal_colours"))
+                                    self.config.getMetadata("logger_terminal_colours"),
+                                    self.config.getLogLevel(self.network_name),
+                                    self.config.getLogEvents(self.network_name))
+        logger.configure(self.config.getLogMaxSize(), self.config.getLogCompress())
         self.validator = validator.Validator()
         self.channelmanager = channel.ChannelManager(self.config.getDatabaseDir(), self.logger, self.network_name,
                                                      self.validator)
         self.commandhelp = commandhelp.CommandHelp(self.logger, self.config.getCommandPrefix(self.network_name))
-        self.ratelimiter = ratelimit.Ratelimit(self, self.logger)
+        self.ratelimiter = ratelimit.Ratelimit(self, self.logger, self.flood_burst, self.flood_rate)
 
         self.errors_per_minute = 0  # If we get too many EPM (errors per minute), we stop.
         self.time_error_per_minute = int(time.time())
 
-    def _connect_ssl(self):
-        sock = None
-
-        try:
-            if self.ipv4:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.bind_socket(sock)
-                sock.connect((self.server, self.port))
-            else:
-                sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
-                self.bind_socket(sock)
-                sock.connect((self.server, self.port, 0, 0))
-        except Exception:
-            self.reconnect()
-            return
-
-        self.socket = ssl.wrap_socket(sock)
-
-        self.send_raw("NICK {}".format(self.mnick))
-        self.currentnick = self.mnick
-        # <username> <hostname> <servername> :<realname> - servername/hostname will be ignored by the ircd.
-        self.send_raw("USER {} 0 0 :{}".format(self.user, self.realname))
-        self.connected = True
-
-    def _connect(self):
-        try:
-            if self.ipv4:
-                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.bind_socket()
-                self.socket.connect((self.server, self.port))
-            else:
-                self.socket = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
-                self.bind_socket()
-                self.socket.connect((self.server, self.port, 0, 0))
-        except Exception:
-            self.reconnect()
-            return
-
-        self.send_raw("NICK {}".format(self.mnick))
-        self.currentnick = self.mnick
-        # <username> <hostname> <servername> :<realname> - servername/hostname will be ignored by the ircd.
-        self.send_raw("USER {} 0 0 :{}".format(self.user, self.realname))
-        self.connected = True
-
-    def bind_socket(self, sock=False):
-        if self.bindhost:
-            self.logger.log('Attempting to bind to {}'.format(self.bindhost))
-
-            if not sock:
-                self.socket.bind((self.bindhost, 0))
-            else:
-                sock.bind((self.bindhost, 0))
-
     def _loadModules(self):
         self.ModuleHandler = module.ModuleHandler(self)
+        if self.config.getHookStats():
+            self.ModuleHandler.enableStats(self.config.getHookStatsSlowThreshold() / 1000,
+                                           self.config.getHookStatsInterval())
         self.ModuleHandler.loadAll()
-
-    def _getPrivmsgQueue(self):
-        """Gets the message queue from the ratelimiter thread."""
-        return self.queue_privmsg
-
-    def _getNoticeQueue(self):
-        return self.queue_notice
@@ -0,0 +1,169 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+ircmessage.py
+Parse a raw line from the IRC server into an IrcMessage in one pass.
+
+Lines look like this (RFC 1459 with IRCv3 message tags):
+  [@tag=value;tag2 ][:nick!user@host ]COMMAND [param ...][ :trailing]
+"""
+
+TAG_ESCAPES = {
+    ":": ";",
+    "s": " ",
+    "\\": "\\",
+    "r": "\r",
+    "n": "\n"
+}
+
+
+class IrcMessage:
+    """
+    A parsed line, attributes that are not present in the line are None (or an empty list for params).
+
+    params contains every parameter including the trailing one, trailing is also stored on its own so
+    a trailing parameter can be told apart from a middle one.
+    """
+
+    __slots__ = ("raw", "tags", "prefix", "nick", "user", "host", "command", "numeric", "params", "trailing")
+
+    def __init__(self, raw, tags, prefix, nick, user, host, command, params, trailing):
+        self.raw = raw
+        self.tags = tags
+        self.prefix = prefix
+        self.nick = nick
+        self.user = user
+        self.host = host
+        self.command = command
+        self.numeric = int(command) if command.isdigit() else None
+        self.params = params
+        self.trailing = trailing
+
+    def param(self, index, default=None):
+        """Return the parameter at index, or default if there are not that many parameters."""
+        if index < len(self.params):
+            return self.params[index]
+        return default
+
+    def __str__(self):
+        return self.raw
+
+    def __repr__(self):
+        return "IrcMessage({!r})".format(self.raw)
+
+
+def parse(line):
+    """Parse a line (string, without line ending) into an IrcMessage, returns None if the line is malformed."""
+    rest = line
+    tags = prefix = nick = user = host = None
+    first = line[:1]
+
+    # Lines without tags or a prefix (PING and the like) skip their handling altogether.
+    if first == ":" or first == "@":
+        if first == "@":
+            tagstring, sep, rest = line.partition(" ")
+            if not sep:
+                return None
+
+            tags = parseTags(tagstring[1:])
+            rest = rest.lstrip(" ")
+
+        if rest[:1] == ":":
+            prefix, sep, rest = rest.partition(" ")
+            if not sep:
+                return None
+
+            # Inlined splitPrefix(), the function call costs as much as the split itself.
+            prefix = prefix[1:]
+            nick, sep, host = prefix.partition("@")
+            if not sep:
+                host = None
+            else:
+                nick, sep, user = nick.partition("!")
+                if not sep:
+                    user = None
+
+    # Only the text before the trailing parameter is split, the trailing parameter is taken as it is.
+    middle, sep, trailing = rest.partition(" :")
+    params = middle.split()
+
+    if not params:
+        return None
+
+    command = params[0].upper()
+    del params[0]
+
+    if sep:
+        params.append(trailing)
+    else:
+        trailing = None
+
+    return IrcMessage(line, tags, prefix, nick, user, host, command, params, trailing)
+
+
+def splitPrefix(prefix):
+    """Split nick!user@host into its parts, parts that are missing are None (server prefixes only have a nick)."""
+    if "@" not in prefix:
+        return prefix, None, None
+
+    nick, sep, host = prefix.partition("@")
+    if "!" not in nick:
+        return nick, None, host
+
+    nick, sep, user = nick.partition("!")
+    return nick, user, host
+
+
+def parseTags(tagstring):
+    """Parse IRCv3 message tags into a dict, tags without a value are set to True."""
+    tags = {}
+
+    for tag in tagstring.split(";"):
+        if not tag:
+            continue
+
+        key, sep, value = tag.partition("=")
+        if not sep:
+            tags[key] = True
+        elif "\\" in value:
+            tags[key] = unescapeTagValue(value)
+        else:
+            tags[key] = value
+
+    return tags
+
+
+def unescapeTagValue(value):
+    unescaped = []
+    escaping = False
+
+    for char in value:
+        if escaping:
+            unescaped.append(TAG_ESCAPES.get(char, char))
+            escaping = False
+        elif char == "\\":
+            escaping = True
+        else:
+            unescaped.append(char)
+
+    return "".join(unescaped)
@@ -0,0 +1,133 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+linebuffer.py
+Reassemble lines from a stream of bytes received from the IRC server.
+
+recv() hands us arbitrary chunks of the stream, a chunk may end halfway through a line or even halfway
+through a multibyte character. The LineBuffer keeps whatever is left over after the last newline and prepends it
+to the next chunk, lines are only decoded once they are complete.
+"""
+
+MAX_LINE_LENGTH = 8192  # IRCv3 tags may push lines beyond 512 bytes, but nothing legitimate comes close to this.
+
+
+class LineBuffer:
+
+    def __init__(self, encoding="utf-8", fallback_encoding="latin-1", max_line_length=MAX_LINE_LENGTH):
+        """
+        encoding: string, the encoding to attempt first when decoding a line.
+        fallback_encoding: string, encoding to use when a line is not valid in `encoding`.
+        max_line_length: integer, amount of bytes a partial line may grow to before it is discarded, along with the
+                         rest of it that is still to come.
+        """
+
+        self.encoding = encoding
+        self.fallback_encoding = fallback_encoding
+        self.max_line_length = max_line_length
+
+        self.buffer = b""
+        self.discarding = False  # Whether we are dropping what remains of a line that grew too long.
+        self.lines_total = 0
+        self.lines_fallback = 0
+        self.lines_discarded = 0
+
+    def feed(self, data):
+        """
+        Add a chunk of bytes to the buffer, returns a list of complete lines (bytes, without line endings).
+
+        Empty lines are dropped, incomplete lines are kept until the rest of them arrives.
+        """
+
+        complete = [line for line in self._split(data).split(b"\n") if line]
+
+        self.lines_total += len(complete)
+        return complete
+
+    def feedDecoded(self, data):
+        """
+        Like feed(), but returns decoded strings instead of bytes.
+
+        All complete lines in the chunk are decoded in one go, only when that fails do we fall back to decoding
+        them one by one so a single badly encoded line does not affect the others.
+        """
+
+        data = self._split(data)
+        if not data:
+            return []
+
+        try:
+            complete = [line for line in data.decode(self.encoding).split("\n") if line]
+        except UnicodeDecodeError:
+            complete = [self.decode(line) for line in data.split(b"\n") if line]
+
+        self.lines_total += len(complete)
+        return complete
+
+    def decode(self, line):
+        """Decode a line of bytes, falling back to the fallback encoding if it is not valid in the primary one."""
+        try:
+            return line.decode(self.encoding)
+        except UnicodeDecodeError:
+            self.lines_fallback += 1
+            return line.decode(self.fallback_encoding, "replace")
+
+    def clear(self):
+        """Throw away any partial line, used when the connection is reset."""
+        self.buffer = b""
+        self.discarding = False
+
+    def _split(self, data):
+        """Return everything up to the last newline, and keep the rest in the buffer for the next chunk."""
+        if self.discarding:
+            # The start of this line was discarded, the rest of it must not be taken for a line of its own.
+            start = data.find(b"\n")
+            if start < 0:
+                return b""
+
+            data = data[start + 1:]
+            self.discarding = False
+        elif self.buffer:
+            data = self.buffer + data
+
+        end = data.rfind(b"\n")
+        self.buffer = data[end + 1:]
+
+        if len(self.buffer) > self.max_line_length:
+            self.buffer = b""
+            self.discarding = True
+            self.lines_discarded += 1
+
+        if end < 0:
+            return b""
+
+        # A bare carriage return has no business inside an IRC line, so we may drop them all at once.
+        return data[:end].replace(b"\r", b"")
+
+    def getStats(self):
+        return {
+            "lines": self.lines_total,
+            "fallback_decoded": self.lines_fallback,
+            "discarded": self.lines_discarded,
+            "buffered_bytes": len(self.buffer)
+        }
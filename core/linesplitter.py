@@ -0,0 +1,147 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+linesplitter.py
+Split messages that do not fit in a single IRC line.
+
+A line may be 512 bytes including the CRLF, and the server relays our messages prefixed with our nick!user@host,
+so that is how much less room we have. Messages are split on word boundaries where possible and never halfway
+through a UTF-8 character or a colour code. Formatting (bold, colours, ...) that is still active at the end of a
+line is opened again at the start of the next one.
+"""
+
+import re
+
+
+MAX_LINE_LENGTH = 512
+MIN_MESSAGE_LENGTH = 64  # Never split into pieces smaller than this, no matter how long the prefix is.
+HOST_LENGTH = 63  # What we assume our host to be, while we do not know it.
+
+FORMAT_TOGGLES = ("\x02", "\x1D", "\x1F", "\x16")  # bold, italics, underline, reverse
+FORMAT_RE = re.compile(r"[\x02\x1D\x1F\x16\x0F]|\x03(\d{1,2})?(?:,(\d{1,2}))?")
+
+
+def split(command, target, message, prefix):
+    """
+    Split a PRIVMSG or NOTICE into as many lines as needed, returns a list of raw lines.
+
+    command: string, PRIVMSG or NOTICE.
+    target: string, the channel or nick the message is for.
+    message: string, the (already formatted) message.
+    prefix: string, our nick!user@host as the server will relay it.
+    """
+
+    head = "{} {} :".format(command, target)
+    before = ""
+    after = ""
+
+    if message.startswith("\x01ACTION ") and message.endswith("\x01") and len(message) > 9:
+        # Every piece of an action has to be an action itself.
+        before = "\x01ACTION "
+        after = "\x01"
+        message = message[8:-1]
+
+    limit = max(MIN_MESSAGE_LENGTH, MAX_LINE_LENGTH - len("\r\n") - len(":{} ".format(prefix).encode("utf-8")) -
+                len((head + before + after).encode("utf-8")))
+
+    return [head + before + piece + after for piece in splitMessage(message, limit)]
+
+
+def splitMessage(message, limit):
+    """Split message into pieces of at most limit bytes when encoded as UTF-8."""
+    pieces = []
+    carry = ""
+
+    while message:
+        message = carry + message
+        encoded = message.encode("utf-8")
+
+        if len(encoded) <= limit:
+            pieces.append(message)
+            break
+
+        cut = findCut(message, encoded, limit, len(carry))
+        piece = message[:cut].rstrip(" ")
+        message = message[cut:].lstrip(" ")
+
+        pieces.append(piece)
+        carry = formattingState(piece)
+
+        if carry.endswith(tuple("0123456789")) and message.startswith(","):
+            carry += "\x02\x02"  # Keep the comma from being read as a background colour.
+
+    return pieces
+
+
+def findCut(message, encoded, limit, minimum):
+    """Return the index in message to split at, so that the part before it fits in limit bytes."""
+    # Characters cut in half by the limit are dropped by ignoring decode errors.
+    cut = len(encoded[:limit].decode("utf-8", "ignore"))
+
+    space = message.rfind(" ", minimum, cut + 1)
+    if space > max(minimum, cut // 2):
+        return space
+
+    # No usable word boundary, but we should not end up in the middle of a colour code either.
+    colour = message.rfind("\x03", max(minimum, cut - 5), cut)
+    if colour > minimum:
+        match = FORMAT_RE.match(message, colour)
+        if match.end() > cut:
+            return colour
+
+    return max(cut, minimum + 1)
+
+
+def formattingState(text):
+    """Return the formatting codes needed to continue where text left off, an empty string if there are none."""
+    if not FORMAT_RE.search(text):
+        return ""
+
+    toggled = dict.fromkeys(FORMAT_TOGGLES, False)
+    foreground = None
+    background = None
+
+    for match in FORMAT_RE.finditer(text):
+        code = match.group(0)
+
+        if code == "\x0F":
+            toggled = dict.fromkeys(FORMAT_TOGGLES, False)
+            foreground = None
+            background = None
+        elif code[0] == "\x03":
+            if match.group(1) is None:
+                foreground = None
+                background = None
+            else:
+                foreground = match.group(1).zfill(2)
+                if match.group(2) is not None:
+                    background = match.group(2).zfill(2)
+        else:
+            toggled[code] = not toggled[code]
+
+    state = "".join(code for code in FORMAT_TOGGLES if toggled[code])
+
+    if foreground:
+        state += "\x03" + foreground + ("," + background if background else "")
+
+    return state
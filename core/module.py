@@ -27,8 +27,31 @@ Module handler -- handles the loading, unloading, and sending instructions to mo
 import os
 import importlib
 import inspect
+import sys
+import threading
+import time
 import traceback
 
+from core import hookstats
+from core import moduletemplate
+
+
+# Hooks modules may override, the ModuleHandler only calls a hook on modules that override it.
+HOOKS = ("on_connect", "on_disconnect", "on_command", "on_privmsg", "on_action", "on_join", "on_self_join",
+         "on_self_part", "on_part", "on_kick", "on_quit", "on_netsplit", "on_netjoin", "on_numeric")
+# Hooks whose BotModule default calls another hook once per event, modules overriding only that one need them too.
+FALLBACK_HOOKS = {"on_netsplit": "on_quit", "on_netjoin": "on_join"}
+
+# Hooks that may run on the worker pool, their first argument is the target replies go to.
+BLOCKING_HOOKS = ("on_command", "on_privmsg", "on_action")
+# Modules importing any of these make HTTP requests, unless they say otherwise their BLOCKING_HOOKS are blocking.
+# "import urllib.request" binds urllib, see isBlockingImport() for how that is told apart from other urllib modules.
+BLOCKING_IMPORTS = frozenset(["requests", "urllib.request", "tools.httpclient", "tools.paste", "tools.shorturl",
+                              "tools.urltools"])
+BLOCKING_METHODS = frozenset(["http", "httpGet", "httpPost"])  # Modules using these BotModule members do so as well.
+REFUSED_LOG_INTERVAL = 60  # Seconds between logging that the worker pool refused jobs of the same module.
+BUSY_NOTICE_INTERVAL = 10  # Seconds between telling the same nick that the worker pool refused their command.
+
 
 class ModuleHandler:
 
@@ -39,76 +62,142 @@ class ModuleHandler:
         self.modules = {}
         self.module_dir = "modules"
 
+        self.subscribers = {}  # hook: [bound methods of the modules that override it]
+        self.blocking = {}  # module: hooks of that module that run on the worker pool
+
+        self.stats = None  # HookStats while instrumentation is enabled, see enableStats()
+        self.stats_interval = 0
+        self.stats_timer = None
+
+        self.refused_lock = threading.Lock()  # Jobs may be submitted from the worker threads as well.
+        self.refused = {}  # module name: jobs refused since the last time it was logged
+        self.busy_notices = {}  # nick: time we last told them their command was refused, guarded by refused_lock
+
+        self._rebuildSubscribers()
+
     def sendConnect(self):
-        for module in self.modules:
-            self.modules[module].on_connect()
+        for hook in self.subscribers["on_connect"]:
+            hook()
 
     def sendDisconnect(self):
-        for module in self.modules:
-            self.modules[module].on_disconnect()
+        for hook in self.subscribers["on_disconnect"]:
+            hook()
 
     def sendCommand(self, target, nick, command, commandtext, mod=False, admin=False):
-        for module in self.modules:
-            if self.modules[module].on_command(target, nick, command, commandtext, mod, admin):
+        """
+        Route a registered command to the module that registered it. Commands that were not registered, or that
+        the owning module did not handle, fall back to asking every module in turn until one handles it.
+
+        Modules whose on_command blocks are asked on the worker pool, after the others. Returns False if no module
+        handled the command, True if one did or if it was handed to the worker pool; in that case the connection's
+        commandNotFound() is called once it turns out no module handled it, and the nick is told to try again later
+        if the worker pool refused it.
+        """
+
+        handler = self._conn.commandhelp.getHandler(command)
+        args = (target, nick, command, commandtext, mod, admin)
+
+        if handler and self._isBlocking(handler):
+            self._submitCommand(handler, command, args)
+            return True
+
+        if self.stats:
+            return self.stats.callCommand(command, self._dispatchCommand, (handler, command, args))
+        return self._dispatchCommand(handler, command, args)
+
+    def _dispatchCommand(self, handler, command, args):
+        if handler and handler(*args):
+            self._conn.commandhelp.countHit(command)
+            return True
+
+        return self._fallbackCommand(handler, command, args)
+
+    def _fallbackCommand(self, handler, command, args):
+        """Ask every module but handler to handle command, the ones whose on_command blocks last."""
+        deferred = []
+
+        for hook in self.subscribers["on_command"]:
+            if hook == handler:
+                continue
+
+            if self._isBlocking(hook):
+                deferred.append(hook)
+            elif hook(*args):
+                self._conn.commandhelp.countHit(command)
                 return True
+
+        if deferred:
+            self._submitCommand(deferred[0], command, args, deferred[1:])
+            return True
         return False
 
     def sendPrivmsg(self, target, nick, message):
-        for module in self.modules:
-            self.modules[module].on_privmsg(target, nick, message)
+        for hook in self.subscribers["on_privmsg"]:
+            hook(target, nick, message)
 
     def sendAction(self, target, nick, message):
-        for module in self.modules:
-            self.modules[module].on_action(target, nick, message)
+        for hook in self.subscribers["on_action"]:
+            hook(target, nick, message)
 
     def sendJoin(self, nick, channel):
-        for module in self.modules:
-            self.modules[module].on_join(nick, channel)
+        for hook in self.subscribers["on_join"]:
+            hook(nick, channel)
 
     def sendSelfJoin(self, channel):
-        for module in self.modules:
-            self.modules[module].on_self_join(channel)
+        for hook in self.subscribers["on_self_join"]:
+            hook(channel)
 
     def sendSelfPart(self, channel):
-        for module in self.modules:
-            self.modules[module].on_self_part(channel)
+        for hook in self.subscribers["on_self_part"]:
+            hook(channel)
 
     def sendPart(self, nick, channel, message):
-        for module in self.modules:
-            self.modules[module].on_part(nick, channel, message)
+        for hook in self.subscribers["on_part"]:
+            hook(nick, channel, message)
 
     def sendKick(self, nick, channel, knick, reason):
-        for module in self.modules:
-            self.modules[module].on_kick(nick, channel, knick, reason)
+        for hook in self.subscribers["on_kick"]:
+            hook(nick, channel, knick, reason)
 
     def sendQuit(self, nick, message):
-        for module in self.modules:
-            self.modules[module].on_quit(nick, message)
+        for hook in self.subscribers["on_quit"]:
+            hook(nick, message)
 
-    def sendNumeric(self, numeric, data):
-        for module in self.modules:
-            self.modules[module].on_numeric(numeric, data)
+    def sendNetsplit(self, servers, quits):
+        for hook in self.subscribers["on_netsplit"]:
+            hook(servers, quits)
+
+    def sendNetjoin(self, servers, joins):
+        for hook in self.subscribers["on_netjoin"]:
+            hook(servers, joins)
+
+    def sendNumeric(self, numeric, message):
+        for hook in self.subscribers["on_numeric"]:
+            hook(numeric, message)
 
     def loadAll(self):
         for module in self.getAvailableModulesList():
             if module in self.modules:
-                self.logger.notice("Attempted to load module '{}', but it was already loaded.".format(module))
+                self.logger.notice("Attempted to load module '{}', but it was already loaded.", module)
                 continue
 
             self.load(module)
 
     def unloadAll(self):
+        self._cancelStatsDump()
+
         for module in self.modules:
             self.unload(module, False)
         self.modules = {}
+        self._rebuildSubscribers()
 
     def reloadAll(self):
-        for module in self.modules:
+        for module in list(self.modules):
             self.reload(module)
 
     def load(self, module):
         if module in self.modules:
-            self.logger.notice("Attempted to load module '{}', but it was already loaded.".format(module))
+            self.logger.notice("Attempted to load module '{}', but it was already loaded.", module)
             return False
 
         success = True
@@ -120,7 +209,7 @@ class ModuleHandler:
                 self.modules[module] = moduleclass(self._conn, self.logger, modulename)
                 self.modules[module].on_module_load()
         except Exception as e:
-            self.logger.error("Failed to load module {}: {}".format(module, str(e)))
+            self.logger.error("Failed to load module {}: {}", module, str(e))
 
             if "requires API key" not in str(e):  # The error is not related to API keys not existing, print the tb.
                 traceback.print_exc()
@@ -128,8 +217,10 @@ class ModuleHandler:
             success = False
             self.unload(module)
 
+        self._rebuildSubscribers()
+
         if success:
-            self.logger.log("Successfully loaded module {}".format(module))
+            self.logger.log("Successfully loaded module {}", module)
 
         return success
 
@@ -139,9 +230,11 @@ class ModuleHandler:
 
         self.modules[module].on_module_unload()
         self.modules[module]._unregister_commands()
+        self.modules[module]._closeDatabases()
         if pop:
             del self.modules[module]
-        self.logger.log("Unloaded module {}".format(module))
+            self._rebuildSubscribers()
+        self.logger.log("Unloaded module {}", module)
 
         return True
 
@@ -150,6 +243,185 @@ class ModuleHandler:
         loaded_fine = self.load(module)
         return unloaded_fine and loaded_fine
 
+    def enableStats(self, slow_threshold=0.25, interval=0):
+        """
+        Start timing hooks and commands, see HookStats.
+
+        slow_threshold: float, seconds after which a call is logged as slow, 0 to never log them.
+        interval: integer, seconds between logging a summary of the statistics (after which they are reset),
+                  0 to not log them.
+        """
+
+        self._cancelStatsDump()
+        self.stats = hookstats.HookStats(self.logger, slow_threshold)
+        self.stats_interval = interval
+        self._rebuildSubscribers()
+        self._scheduleStatsDump()
+
+    def disableStats(self):
+        self._cancelStatsDump()
+        self.stats = None
+        self._rebuildSubscribers()
+
+    def getSubscribers(self, hook):
+        """Return the names of the loaded modules that override hook."""
+        return [name for name, module in self.modules.items() if hook in getOverriddenHooks(module)]
+
+    def _rebuildSubscribers(self):
+        """
+        Rebuild the subscriber list for every hook, in the order the modules were loaded.
+
+        New lists are created rather than changing the old ones, a module (un)loading another module from
+        within a hook does not affect the dispatch loop that is calling it.
+        """
+
+        subscribers = {hook: [] for hook in HOOKS}
+        blocking = {}
+
+        for module in self.modules.values():
+            overridden = getOverriddenHooks(module)
+            blocking[module] = [hook for hook in getBlockingHooks(module) if hook in overridden]
+
+            for hook in overridden:
+                func = getattr(module, hook)
+
+                if hook == "on_command":
+                    # on_command needs to return whether it handled the command, unless the command is routed to
+                    # the module (see sendCommand) it is called directly. It is timed per command.
+                    subscribers[hook].append(func)
+                    continue
+
+                if self.stats:
+                    func = self.stats.wrap(module.module_name, hook, func)
+
+                if hook in blocking[module]:
+                    subscribers[hook].append(self._deferred(module, func))
+                else:
+                    subscribers[hook].append(func)
+
+        self.subscribers = subscribers
+        self.blocking = blocking
+
+    def _deferred(self, module, hook):
+        """Return a function that submits hook to the worker pool instead of calling it."""
+        def submit(target, *args):
+            self.submit(module, target, hook, (target,) + args)
+        return submit
+
+    def submit(self, module, target, func, args):
+        """
+        Run func(*args) for module on the worker pool, replies to target are sent in the order they were submitted.
+
+        Returns False if the pool refused the job because too many are queued, that is logged.
+        """
+
+        if self._conn.engine.workers.submit(module, (self._conn.network_name, target.lower()), func, args):
+            return True
+
+        self._logRefused(module.module_name)
+        return False
+
+    def _logRefused(self, module_name):
+        """
+        Log that the worker pool refused a job of module_name. Further refusals are counted, and logged together
+        REFUSED_LOG_INTERVAL seconds later.
+        """
+
+        with self.refused_lock:
+            if module_name in self.refused:
+                self.refused[module_name] += 1
+                return
+            self.refused[module_name] = 0
+
+        self.logger.notice("Worker pool is full, refused a job of {}. Consider raising its max_workers or max_queue, "
+                           "or worker_threads.", module_name)
+        engine = self._conn.engine
+        engine.callSoon(engine.loop.call_later, REFUSED_LOG_INTERVAL, self._logRefusedSince, module_name)
+
+    def _logRefusedSince(self, module_name):
+        with self.refused_lock:
+            count = self.refused.pop(module_name, 0)
+
+        if count:
+            self.logger.notice("Worker pool refused {} more job{} of {} in the last {} seconds.",
+                               count, "s" if count != 1 else "", module_name, REFUSED_LOG_INTERVAL)
+
+    def _isBlocking(self, hook):
+        return "on_command" in self.blocking.get(hook.__self__, ())
+
+    def _submitCommand(self, hook, command, args, remaining=None):
+        """Run a blocking on_command on the worker pool, see _runCommand()."""
+        if self.submit(hook.__self__, args[0], self._runCommand, (hook, command, args, remaining)):
+            return
+
+        if remaining:
+            # The command was not routed to this module, it is likely another one handles it.
+            self._submitCommand(remaining[0], command, args, remaining[1:])
+        else:
+            self._noticeBusy(args[1], command)
+
+    def _noticeBusy(self, nick, command):
+        """Tell nick their command was refused, at most once every BUSY_NOTICE_INTERVAL seconds."""
+        now = time.monotonic()
+
+        with self.refused_lock:
+            last = self.busy_notices.get(nick.lower())
+            if last is not None and now - last < BUSY_NOTICE_INTERVAL:
+                return
+
+            self.busy_notices = {other: when for other, when in self.busy_notices.items()
+                                 if now - when < BUSY_NOTICE_INTERVAL}
+            self.busy_notices[nick.lower()] = now
+
+        self._conn.notice(nick, "I am too busy to handle '{}' right now, please try again later.".format(command))
+
+    def _runCommand(self, hook, command, args, remaining=None):
+        """
+        Call a blocking on_command, on a worker thread. If it does not handle the command, a command routed to it
+        (remaining is None) falls back to the other modules, otherwise the next of remaining is asked.
+        """
+
+        handled = self.stats.callCommand(command, hook, args) if self.stats else hook(*args)
+        engine = self._conn.engine
+
+        if handled:
+            engine.callSoon(self._conn.commandhelp.countHit, command)
+        elif remaining is None:
+            self.logger.log_verbose("Command '{}' was routed to {}, but it did not handle it.",
+                                    command, hook.__self__.module_name)
+            engine.callSoon(self._fallbackAfterRouted, hook, command, args)
+        elif remaining:
+            self._submitCommand(remaining[0], command, args, remaining[1:])
+        else:
+            engine.callSoon(self._conn.commandNotFound, args[0], args[1], command)
+
+    def _fallbackAfterRouted(self, handler, command, args):
+        if not self._fallbackCommand(handler, command, args):
+            self._conn.commandNotFound(args[0], args[1], command)
+
+    def _scheduleStatsDump(self):
+        if self.stats and self.stats_interval:
+            self.stats_timer = self._conn.engine.loop.call_later(self.stats_interval, self._dumpStats)
+
+    def _cancelStatsDump(self):
+        if self.stats_timer:
+            self.stats_timer.cancel()
+            self.stats_timer = None
+
+    def _dumpStats(self):
+        """Log the hooks and commands that took the most time since the last time, and start counting anew."""
+        self.stats_timer = None
+        lines = self.stats.getSummary()
+
+        if lines:
+            self.logger.log("Module handlers that took the most time in the last {} seconds:",
+                            int(time.time() - self.stats.since))
+            for line in lines:
+                self.logger.log("  {}", line)
+
+        self.stats.reset()
+        self._scheduleStatsDump()
+
     def getLoadedModulesList(self):
         loaded_modules = []
 
@@ -168,3 +440,58 @@ class ModuleHandler:
             available_modules.append(file)
 
         return available_modules
+
+
+def getOverriddenHooks(module):
+    """Return the hooks module overrides, the BotModule defaults do nothing so there is no point in calling them."""
+    overridden = []
+
+    for hook in HOOKS:
+        if hook in vars(module) or getattr(type(module), hook, None) is not getattr(moduletemplate.BotModule, hook):
+            overridden.append(hook)
+
+    for hook, fallback in FALLBACK_HOOKS.items():
+        if fallback in overridden and hook not in overridden:
+            overridden.append(hook)
+
+    return overridden
+
+
+def getBlockingHooks(module):
+    """Return the hooks of module that should run on the worker pool, see BotModule.blocking_hooks."""
+    if module.blocking_hooks is not None:
+        return list(module.blocking_hooks)
+
+    pymodule = sys.modules.get(type(module).__module__)
+    if not pymodule:
+        return []
+
+    used = set()  # The names the methods of the module refer to.
+    for value in vars(type(module)).values():
+        if inspect.isfunction(value):
+            used.update(value.__code__.co_names)
+
+    if BLOCKING_METHODS.intersection(used):
+        return list(BLOCKING_HOOKS)
+
+    for value in vars(pymodule).values():
+        if inspect.ismodule(value) and isBlockingImport(value.__name__, used):
+            return list(BLOCKING_HOOKS)
+
+    return []
+
+
+def isBlockingImport(name, used=()):
+    """
+    Whether importing the module name makes a module blocking, see BLOCKING_IMPORTS.
+
+    used: the names the code of the module refers to. "import urllib.request" binds urllib, the package counts if
+    the code refers to the submodule in it (urllib.request.urlopen refers to request).
+    """
+
+    if name in BLOCKING_IMPORTS:
+        return True
+
+    prefix = name + "."
+    return any(blocking.startswith(prefix) and blocking[len(prefix):].partition(".")[0] in used
+               for blocking in BLOCKING_IMPORTS)
@@ -24,6 +24,10 @@ THE SOFTWARE.
 The core bot module template, include this in every module you write.
 """
 
+from core import database
+from core import httpcache
+from tools import httpclient
+
 import time
 
 
@@ -35,6 +39,15 @@ class BotModule:
     PRIV_ADMIN = "admin"
     PRIV_ADMINISTRATOR = "admin"
 
+    # Hooks that block (on network I/O for example) run on the worker pool, so they do not hold up the connection.
+    # None lets the ModuleHandler decide: if the module imports requests, urllib.request or one of our tools that
+    # make HTTP requests, or uses self.http, httpGet() or httpPost(), its on_command, on_privmsg and on_action
+    # hooks are considered blocking.
+    # Set this to a list of hook names to choose yourself, and use submit() to run only part of a hook on the pool.
+    blocking_hooks = None
+    max_workers = 2  # The amount of blocking hooks of this module that may run at the same time.
+    max_queue = 10  # The amount that may be waiting or running before further ones are refused.
+
     def __init__(self, conn, logger, module_name):
         self._conn = conn
         self.logger = logger
@@ -43,10 +56,14 @@ class BotModule:
         self.db_dir = self._conn.config.getDatabaseDir()
 
         self._registered_commands = []
+        self._databases = []
         self.api_key = {}
         self.last_command = {}
         self.module_data = self._getModuleData()
 
+        if self.logger and "log_level" in self.module_data:
+            self.logger.setThreshold(self.module_name, self.module_data["log_level"])
+
         self.isBotAdmin = self.isBotAdministrator  # aliases for admin/moderator
         self.isBotMod = self.isBotModerator
 
@@ -103,6 +120,25 @@ class BotModule:
         """Occurs when someone quits IRC"""
         pass
 
+    def on_netsplit(self, servers, quits):
+        """
+        Occurs when users quit because two servers split, instead of on_quit for each of them.
+
+        servers: string, the names of the servers that split ("hub.example.net leaf.example.net").
+        quits: list of (nick, quit message), by default on_quit is called for each.
+        """
+        for nick, message in quits:
+            self.on_quit(nick, message)
+
+    def on_netjoin(self, servers, joins):
+        """
+        Occurs when users who split join their channels again, instead of on_join for each of them.
+
+        joins: list of (nick, channel), by default on_join is called for each.
+        """
+        for nick, channel in joins:
+            self.on_join(nick, channel)
+
     def on_command(self, target, nick, command, commandtext, mod, admin):
         """
         On command is triggered when someone prefixes the bot by its name, or
@@ -126,7 +162,8 @@ class BotModule:
         Whenever the server sends a numeric reply thos callback gets called.
 
         numeric: integer, numeric sent by the server.
-        data: string, anything after the numeric. What varies per numeric.
+        data: IrcMessage, the parsed line (see core/ircmessage.py). data.params holds the parameters, the first
+              of which is always our own nickname. str(data) returns the raw line.
         """
         pass
 
@@ -192,23 +229,29 @@ class BotModule:
     def debug(self, message, format=False):
         self._conn.debug(message, format)
 
-    def log(self, message):
-        self.logger.log("({}) {}".format(self.module_name, message))
+    def log(self, message, *args):
+        """
+        Log message, formatted with args if there are any. Formatting only happens if the message is logged:
+        self.log_verbose("Fetched {} in {} seconds", url, elapsed) costs next to nothing when verbose is off.
 
-    def log_verbose(self, message):
-        self.logger.log_verbose("({}) {}".format(self.module_name, message))
+        The module's log level can be set with "log_level" in its configuration.
+        """
+        self.logger.log(message, *args, source=self.module_name)
 
-    def warning(self, message):
-        self.logger.notice("({}) {}".format(self.module_name, message))
+    def log_verbose(self, message, *args):
+        self.logger.log_verbose(message, *args, source=self.module_name)
 
-    def notice_verbose(self, message):
-        self.logger.notice_verbose("({}) {}".format(self.module_name, message))
+    def warning(self, message, *args):
+        self.logger.notice(message, *args, source=self.module_name)
 
-    def warning_verbose(self, message):
-        self.logger.notice_verbose("({}) {}".format(self.module_name, message))
+    def notice_verbose(self, message, *args):
+        self.logger.notice_verbose(message, *args, source=self.module_name)
 
-    def error(self, message):
-        self.logger.error("({}) {}".format(self.module_name, message))
+    def warning_verbose(self, message, *args):
+        self.logger.notice_verbose(message, *args, source=self.module_name)
+
+    def error(self, message, *args):
+        self.logger.error(message, *args, source=self.module_name)
 
     def isOp(self, nick, channel):
         return self._conn.isOp(nick, channel)
@@ -264,19 +307,70 @@ class BotModule:
         help: string, help description
         priv: string, either self.PRIV_NONE, self.PRIV_MOD, or self.PRIV_ADMIN
         aliases: list, list of strings containing aliases of this command.
+
+        Registered commands (and their aliases) are routed straight to this module's on_command.
         """
 
-        self._conn.register_command(command, params, help, priv, aliases, self.module_name)
+        self._conn.register_command(command, params, help, priv, aliases, self.module_name, self.on_command)
         self._registered_commands.append(command)
 
     def unregister_command(self, command):
         if command in self._registered_commands:
-            self._registered_commands = self._registered_commands.pop(command)
+            self._registered_commands.remove(command)
             self._conn.unregister_command(command)
 
             return True
         return False
 
+    def openDatabase(self, db_file):
+        """
+        Return a core.database.Database for db_file, which keeps a connection open for every thread that uses it.
+
+        Call this once in on_module_load and set up the schema with db.migrate() there as well,
+        the connections are closed when the module is unloaded.
+        """
+
+        db = database.Database(db_file)
+        self._databases.append(db)
+
+        return db
+
+    @property
+    def http(self):
+        """
+        The tools.httpclient.HttpClient shared by every module, its requests keep their connections alive.
+
+        Use it for requests that should not be cached, self.http.get(url) and self.http.post(url, data) work like
+        requests.get and requests.post, with a timeout, maximum response size and user agent set by default.
+        """
+
+        return httpclient.getClient()
+
+    def httpGet(self, url, params=None, ttl=0):
+        """
+        requests.get(url, params=params), answered from the HTTP cache while it has a response younger than ttl.
+
+        The "cache_ttl" setting of the module overrides ttl, set it to 0 to not cache any of its requests.
+        See core/httpcache.py, expired responses may be served while they are refreshed. Requests are made with
+        self.http.
+        """
+
+        return httpcache.getCache().request("GET", url, self._cacheTtl(ttl), params=params, source=self.module_name)
+
+    def httpPost(self, url, data=None, ttl=0):
+        """requests.post(url, data=data), see httpGet(). Only cache requests that do not change anything."""
+        return httpcache.getCache().request("POST", url, self._cacheTtl(ttl), data=data, source=self.module_name)
+
+    def submit(self, target, func, *args):
+        """
+        Run func(*args) on the worker pool, returns False if it was refused because too many jobs are queued.
+
+        Jobs with the same target (where their replies go) run one after the other, in the order they were submitted.
+        Use it from a hook that is not blocking to do only the blocking part of its work on the pool.
+        """
+
+        return self._conn.ModuleHandler.submit(self, target, func, args)
+
     def getConfigMetadata(self, metadata):
         return self._conn.config.getMetadata(metadata)
 
@@ -300,6 +394,14 @@ class BotModule:
         for cmd in self._registered_commands:
             self._conn.unregister_command(cmd)
 
+    def _closeDatabases(self):
+        for db in self._databases:
+            db.close()
+        self._databases = []
+
+    def _cacheTtl(self, ttl):
+        return self.module_data["cache_ttl"] if "cache_ttl" in self.module_data else ttl
+
     def _getModuleData(self):
         """Read the config's module block for an entry matching the class name of the module."""
         mdata = self._conn.config.getModuleData(self.module_name)
@@ -0,0 +1,181 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+netsplit.py
+Recognise netsplits and the rejoins after them, so they can be handled as one batch rather than user by user.
+
+When two servers split every user on the far side quits at once with "server1 server2" as their message, and when
+the servers link again they all join their channels again. Servers with the IRCv3 batch capability wrap both in a
+BATCH of the netsplit or netjoin type, other servers we recognise by the quit message and by who rejoins.
+Events are collected until no more arrive for BATCH_DELAY seconds (or the BATCH ends), and then handed to the
+connection in one go.
+"""
+
+import re
+import time
+
+
+# Two server names separated by a space, users cannot quit with that as their message as the ircd prefixes "Quit:".
+SPLIT_RE = re.compile(r"^[\w*-]+(\.[\w*-]+)+ [\w*-]+(\.[\w*-]+)+$")
+BATCH_DELAY = 1.0  # Seconds to wait for more split QUITs or rejoin JOINs before the batch is processed.
+REJOIN_TIMEOUT = 1800  # Seconds we recognise users who split when they join again.
+
+NETSPLIT = "netsplit"
+NETJOIN = "netjoin"
+
+
+class Batch:
+    __slots__ = ("kind", "servers", "events", "timer")
+
+    def __init__(self, kind, servers):
+        self.kind = kind  # NETSPLIT or NETJOIN
+        self.servers = servers  # string, "server1 server2"
+        self.events = []  # (nick, quit message) for NETSPLIT, (nick, channel) for NETJOIN
+        self.timer = None
+
+
+class NetsplitTracker:
+
+    def __init__(self, loop, flush):
+        """
+        loop: the asyncio event loop the connection runs on, batches are processed from it.
+        flush: function called with a Batch and the events collected in it, once it is complete.
+        """
+
+        self.loop = loop
+        self.flush = flush
+
+        self.pending = {}  # (kind, servers): Batch we are collecting events for
+        self.batches = {}  # IRCv3 batch reference: Batch
+        self.split = {}  # nick (lowercase): (servers, time.monotonic() they split)
+
+    def classify(self, message, nick):
+        """
+        Return the Batch a QUIT or JOIN belongs to, or None if it is not part of a netsplit or netjoin.
+
+        message: IrcMessage, the QUIT or JOIN.
+        """
+
+        reference = message.tags.get("batch") if message.tags else None
+        if reference in self.batches:
+            return self.batches[reference]
+
+        if message.command == "QUIT":
+            servers = message.param(0, "")
+            if SPLIT_RE.match(servers):
+                return self._pending(NETSPLIT, servers)
+        elif message.command == "JOIN" and self.split:
+            split = self.split.get(nick.lower())
+            if split and time.monotonic() - split[1] < REJOIN_TIMEOUT:
+                return self._pending(NETJOIN, split[0])
+
+        return None
+
+    def add(self, batch, nick, data):
+        """Add an event to batch, data is the quit message or the channel joined."""
+        batch.events.append((nick, data))
+
+        if batch.kind == NETSPLIT:
+            self.split[nick.lower()] = (batch.servers, time.monotonic())
+
+        if batch.timer:
+            # The batch is done once it has been quiet for a while.
+            batch.timer.cancel()
+            batch.timer = self.loop.call_later(BATCH_DELAY, self.flushBatch, batch)
+
+    def _pending(self, kind, servers):
+        batch = self.pending.get((kind, servers))
+
+        if batch is None:
+            if kind == NETSPLIT:
+                self._expire()
+            else:
+                # Users rejoin once the split is over, whatever is left of it has to be processed first.
+                split = self.pending.get((NETSPLIT, servers))
+                if split:
+                    self.flushBatch(split)
+
+            batch = self.pending[(kind, servers)] = Batch(kind, servers)
+            batch.timer = self.loop.call_later(BATCH_DELAY, self.flushBatch, batch)
+
+        return batch
+
+    def startBatch(self, reference, kind, servers):
+        """An IRCv3 BATCH started, kind is its type. Returns False if it is not one we handle."""
+        if kind not in (NETSPLIT, NETJOIN):
+            return False
+
+        if kind == NETSPLIT:
+            self._expire()
+
+        self.batches[reference] = Batch(kind, servers)
+        return True
+
+    def endBatch(self, reference):
+        batch = self.batches.pop(reference, None)
+        if batch:
+            self.flushBatch(batch)
+
+    def flushBatch(self, batch):
+        """Hand the events collected in batch to the connection, an IRCv3 batch stays open for more."""
+        if batch.timer:
+            batch.timer.cancel()
+            batch.timer = None
+
+        if self.pending.get((batch.kind, batch.servers)) is batch:
+            del self.pending[(batch.kind, batch.servers)]
+
+        events = batch.events
+        batch.events = []
+        if not events:
+            return
+
+        if batch.kind == NETJOIN:
+            for nick, channel in events:
+                self.split.pop(nick.lower(), None)
+
+        self.flush(batch, events)
+
+    def flushAll(self):
+        """Process everything we are still collecting, before an event that may depend on it."""
+        if not self.pending and not self.batches:
+            return
+
+        for batch in list(self.pending.values()) + list(self.batches.values()):
+            self.flushBatch(batch)
+
+    def clear(self):
+        """Forget everything, we disconnected."""
+        for batch in self.pending.values():
+            if batch.timer:
+                batch.timer.cancel()
+
+        self.pending = {}
+        self.batches = {}
+        self.split = {}
+
+    def _expire(self):
+        now = time.monotonic()
+        for nick in [nick for nick, split in self.split.items() if now - split[1] >= REJOIN_TIMEOUT]:
+            del self.split[nick]
@@ -23,94 +23,214 @@ THE SOFTWARE.
 
 Ratelimiter class by Zarthus,
 Put messages in a queue to send them later
+
+Every line we send passes through here. Lines are sorted into priority classes: urgent lines (PONG, QUIT,
+registration) are written straight away, the others wait for a token from a token bucket modelled after the
+flood protection of most ircds (a burst of lines, after which lines trickle in at a fixed rate).
+Within a class, targets take turns so one busy channel cannot starve replies to everyone else.
+
+Messages too long to fit in one line are split (see core/linesplitter.py), the resulting lines are queued and
+written together as one batch.
 """
 
+from core import linesplitter
 from tools import formatter
 
-import threading
+import asyncio
+import collections
 import time
 
 
-class Ratelimit(threading.Thread):
-    def __init__(self, conn, logger, burstlimit=5):
+PRIORITY_URGENT = 0
+PRIORITY_MODE = 1
+PRIORITY_REPLY = 2
+PRIORITY_NORMAL = 3
+
+PRIORITY_NAMES = ("urgent", "mode", "reply", "normal")
+
+COMMAND_PRIORITIES = {
+    "PONG": PRIORITY_URGENT,
+    "PING": PRIORITY_URGENT,
+    "QUIT": PRIORITY_URGENT,
+    "PASS": PRIORITY_URGENT,
+    "NICK": PRIORITY_URGENT,
+    "USER": PRIORITY_URGENT,
+    "CAP": PRIORITY_URGENT,
+    "AUTHENTICATE": PRIORITY_URGENT,
+    "MODE": PRIORITY_MODE,
+    "KICK": PRIORITY_MODE,
+    "PRIVMSG": PRIORITY_REPLY,
+    "NOTICE": PRIORITY_REPLY
+}
+
+
+class Ratelimit:
+    def __init__(self, conn, logger, burstlimit=10, rate=1.0):
         """
         conn: IrcConnection object
-        burstlimit: The amount of messages we can send in one go before entering we send our messages slower.
+        burstlimit: The amount of lines we can send in one go before we have to wait for the bucket to refill.
+        rate: The amount of lines per second the bucket refills with.
         """
 
         self._conn = conn
         self.logger = logger
+        self.formatter = formatter.IrcFormatter()
 
-        self.queue_privmsg = []
-        self.queue_notice = []
         self.burstlimit = burstlimit
-        self.lastburst = int(time.time())
+        self.rate = rate
+        self.tokens = float(burstlimit)
+        self.last_refill = time.monotonic()
 
+        # One queue per priority class, each holding a deque of ([lines], time queued) per target.
+        self.queues = [collections.OrderedDict() for name in PRIORITY_NAMES]
+        self.queued = 0
+        self.stats = [{"sent": 0, "latency_total": 0.0, "latency_max": 0.0} for name in PRIORITY_NAMES]
+
+        self.wakeup = None
         self.running = True
+        self.task = None
 
-        threading.Thread.__init__(self)
+    def start(self):
+        """Schedule the ratelimiter as a task on the connection's event loop."""
+        self.running = True
+        self.wakeup = asyncio.Event()
+        self.task = self._conn.engine.loop.create_task(self.run())
 
-    def run(self):
+    async def run(self):
         """
-        An infinite loop checking if items are in the queue to process,
-        if there are, we enter a for loop iterating over these queued messages, and dispatch them appropriately.
-        Should there be an excessive amount of messages (self.burstlimit) we enter a state where messages are
-        rate limited to be sent once every second.
+        Send queued lines for as long as we are running.
 
-        The burst limitation ends after 5 seconds of not sending any messages.
+        Lines are sent for as long as there are tokens, after which we sleep until the bucket has refilled enough
+        for the next batch: a token for every line in it, or a full bucket for a batch larger than the bucket.
+        With nothing queued we wait for queue() to wake us up.
         """
 
-        itters = 0
-        burstlimit = 0
-        msg_sent = False  # Whenever we don't send a message, we don't need to get into a long sleep.
-        self.getQueues()
         while self.running:
-            itters += 1
-
-            while not self.queue_privmsg.empty():
-                message = self.queue_privmsg.get()
+            priority = self._nextPriority()
+
+            if priority is None:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            self._refill()
+            needed = min(len(self._peek(priority)[0]), self.burstlimit)
+            if self.tokens < needed:
+                # Wake up early if something more important is queued in the meantime.
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), (needed - self.tokens) / self.rate)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._send(priority, self._pop(priority))
 
-                self.say(message[0], message[1], message[2])
-                msg_sent = True
-                burstlimit += 1
-
-                if burstlimit >= self.burstlimit or int(time.time()) < self.lastburst:
-                    self.lastburst = int(time.time())
-                    break
+    def stop(self):
+        if not self.running:
+            self.logger.notice("Cannot stop ratelimiter: Not running.")
+            return False
 
-            while not self.queue_notice.empty():
-                message = self.queue_notice.get()
+        self._conn.logger.log("Stopping ratelimiter.")
+        self.running = False
+        if self.task:
+            self._conn.engine.callSoon(self.task.cancel)
 
-                self.notice(message[0], message[1], message[2])
-                msg_sent = True
-                burstlimit += 1
+    def queue(self, line, priority=None, target=None):
+        """
+        Queue a raw line, must be called from the event loop (IrcConnection.send_raw takes care of that).
 
-                if burstlimit >= self.burstlimit or int(time.time()) < self.lastburst + 5:
-                    self.lastburst = int(time.time())
-                    break
+        priority: one of the PRIORITY_ constants, guessed from the command if None.
+        target: the channel or nick the line is for, lines for the same target are sent in order.
+        """
 
-            if msg_sent:
-                time.sleep(2)
-                msg_sent = False
-            else:
-                time.sleep(.25)
+        words = line.split(" ", 2)
+        if priority is None:
+            priority = COMMAND_PRIORITIES.get(words[0].upper(), PRIORITY_NORMAL)
+        if target is None:
+            target = words[1].lower() if len(words) > 1 else ""
+
+        lines = [line]
+        if len(words) == 3 and priority == PRIORITY_REPLY and self._tooLong(line):
+            lines = linesplitter.split(words[0], words[1], words[2][1:] if words[2][:1] == ":" else words[2],
+                                       self._conn.getPrefix())
+
+        if priority == PRIORITY_URGENT:
+            # Urgent lines still count towards the flood limit, but they never wait for it.
+            self._refill()
+            self._send(priority, (lines, time.monotonic()))
+            return
+
+        queue = self.queues[priority]
+        if target not in queue:
+            queue[target] = collections.deque()
+        queue[target].append((lines, time.monotonic()))
+        self.queued += 1
+
+        if self.wakeup:
+            self.wakeup.set()
+
+    def getStats(self):
+        """Return the amount of lines sent, and their average and maximum time spent queued, per priority class."""
+        stats = {"queued": self.queued, "tokens": round(self.tokens, 2)}
+
+        for priority, name in enumerate(PRIORITY_NAMES):
+            sent = self.stats[priority]["sent"]
+            stats[name] = {
+                "sent": sent,
+                "queued": sum(len(lines) for lines in self.queues[priority].values()),
+                "latency_avg": self.stats[priority]["latency_total"] / sent if sent else 0.0,
+                "latency_max": self.stats[priority]["latency_max"]
+            }
+
+        return stats
+
+    def _tooLong(self, line):
+        """Whether line would be too long once the server relays it with our prefix."""
+        return (len(line.encode("utf-8")) + len(self._conn.getPrefix()) + len(": \r\n") >
+                linesplitter.MAX_LINE_LENGTH)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burstlimit, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def _nextPriority(self):
+        for priority, queue in enumerate(self.queues):
+            if queue:
+                return priority
+        return None
+
+    def _peek(self, priority):
+        """Return the item _pop would take next, without taking it."""
+        return next(iter(self.queues[priority].values()))[0]
+
+    def _pop(self, priority):
+        """Take the next line of the first target in line, and move that target to the back of the line."""
+        queue = self.queues[priority]
+        target, lines = next(iter(queue.items()))
+
+        item = lines.popleft()
+        if lines:
+            queue.move_to_end(target)
+        else:
+            del queue[target]
 
-            if itters % 3 == 0 and burstlimit != 0:
-                # Resets the burst limit every 6 seconds.
-                itters = 0
-                burstlimit = 0
+        self.queued -= 1
+        return item
 
-    def stop(self):
-        if not self.running:
-            self.logger.notice("Cannot stop ratelimiter thread: Not running.")
-            return False
+    def _send(self, priority, item):
+        lines, queued_at = item
+        latency = time.monotonic() - queued_at
 
-        self._conn.logger.log("Stopping ratelimiter thread.")
-        self.running = False
+        self.tokens -= len(lines)
+        stats = self.stats[priority]
+        stats["sent"] += 1
+        stats["latency_total"] += latency
+        if latency > stats["latency_max"]:
+            stats["latency_max"] = latency
 
-    def getQueues(self):
-        self.queue_privmsg = self._conn._getPrivmsgQueue()
-        self.queue_notice = self._conn._getNoticeQueue()
+        self._conn._write(lines)
 
     def say(self, target, message, format):
         """
@@ -118,13 +238,10 @@ class Ratelimit(threading.Thread):
         With formatting enabled, we will attempt to parse the contents through the IrcFormatter class.
         """
 
-        if not format:
-            self.logger.log("Sending PRIVMSG '{}' to {}.".format(message, target))
-            self._conn.send_raw("PRIVMSG {} :{}".format(target, message))
-        else:
-            parser = formatter.IrcFormatter()
-            self.logger.log("Sending parsed PRIVMSG '{}' to {}.".format(message, target))
-            self._conn.send_raw("PRIVMSG {} :{}".format(target, parser.parse(message)))
+        self.logger.log("Sending {}PRIVMSG '{}' to {}.", "parsed " if format else "", message, target)
+        if format:
+            message = self.formatter.parse(message)
+        self.queue("PRIVMSG {} :{}".format(target, message), PRIORITY_REPLY, target.lower())
 
     def notice(self, target, notice, format):
         """
@@ -132,10 +249,7 @@ class Ratelimit(threading.Thread):
         With formatting enabled, we will attempt to parse the contents through the IrcFormatter class.
         """
 
-        if not format:
-            self.logger.log("Sending NOTICE '{}' to {}.".format(notice, target))
-            self._conn.send_raw("NOTICE {} :{}".format(target, notice))
-        else:
-            parser = formatter.IrcFormatter()
-            self.logger.log("Sending parsed NOTICE '{}' to {}.".format(notice, target))
-            self._conn.send_raw("NOTICE {} :{}".format(target, parser.parse(notice)))
+        self.logger.log("Sending {}NOTICE '{}' to {}.", "parsed " if format else "", notice, target)
+        if format:
+            notice = self.formatter.parse(notice)
+        self.queue("NOTICE {} :{}".format(target, notice), PRIORITY_REPLY, target.lower())
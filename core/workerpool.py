@@ -0,0 +1,156 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+workerpool.py
+Run blocking module hooks (HTTP requests and the like) on a bounded pool of threads.
+
+Jobs are ordered per target: a job only starts once the previous job for the same channel or query has finished,
+so replies arrive in the order the messages that caused them were received. Each module may only have a limited
+amount of jobs running at the same time, and a limited amount waiting.
+"""
+
+import collections
+import concurrent.futures
+import threading
+import traceback
+
+
+class Job:
+    __slots__ = ("module", "target", "func", "args")
+
+    def __init__(self, module, target, func, args):
+        self.module = module
+        self.target = target
+        self.func = func
+        self.args = args
+
+
+class WorkerPool:
+    def __init__(self, logger, max_workers=8, max_queue=100):
+        """
+        logger: Logger object
+        max_workers: integer, amount of threads to run jobs on.
+        max_queue: integer, amount of jobs that may be queued or running at once, further jobs are refused.
+        """
+
+        self.logger = logger
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        self.lock = threading.Lock()
+
+        self.queued = 0
+        self.targets = {}  # target: deque of jobs, the first one is running or waiting for its module.
+        self.modules = {}  # module: [running jobs, queued jobs, deque of jobs waiting for a free slot]
+
+        self.jobs_total = 0
+        self.jobs_refused = 0
+        self.jobs_failed = 0
+
+    def submit(self, module, target, func, args):
+        """
+        Queue func(*args) to run on the pool, returns False if the job was refused because too many are queued.
+
+        module: the BotModule the job belongs to, its max_workers and max_queue attributes cap its jobs.
+        target: a hashable identifying where replies go (network and channel or nick), jobs with the same target
+                run one after the other.
+        """
+
+        job = Job(module, target, func, args)
+
+        with self.lock:
+            state = self.modules.setdefault(module, [0, 0, collections.deque()])
+
+            if self.queued >= self.max_queue or state[1] >= module.max_queue:
+                self.jobs_refused += 1
+                if not state[1]:
+                    del self.modules[module]
+                return False
+
+            self.queued += 1
+            state[1] += 1
+            self.jobs_total += 1
+
+            jobs = self.targets.setdefault(target, collections.deque())
+            jobs.append(job)
+
+            if len(jobs) == 1:
+                self._start(job)
+
+        return True
+
+    def shutdown(self, wait=False):
+        self.executor.shutdown(wait)
+
+    def getStats(self):
+        with self.lock:
+            return {
+                "workers": self.max_workers,
+                "queued": self.queued,
+                "jobs": self.jobs_total,
+                "refused": self.jobs_refused,
+                "failed": self.jobs_failed
+            }
+
+    def _start(self, job):
+        """Run job if its module has a free slot, otherwise let it wait for one. The lock must be held."""
+        state = self.modules[job.module]
+
+        if state[0] >= job.module.max_workers:
+            state[2].append(job)
+            return
+
+        state[0] += 1
+        self.executor.submit(self._run, job)
+
+    def _run(self, job):
+        try:
+            job.func(*job.args)
+        except Exception as e:
+            with self.lock:
+                self.jobs_failed += 1
+            self.logger.error("Module {} raised an exception on the worker pool: {}\n{}",
+                              job.module.module_name, repr(e), traceback.format_exc())
+        finally:
+            self._finish(job)
+
+    def _finish(self, job):
+        with self.lock:
+            self.queued -= 1
+            state = self.modules[job.module]
+            state[0] -= 1
+            state[1] -= 1
+
+            jobs = self.targets[job.target]
+            jobs.popleft()
+            if jobs:
+                self._start(jobs[0])
+            else:
+                del self.targets[job.target]
+
+            while state[2] and state[0] < job.module.max_workers:
+                self._start(state[2].popleft())
+
+            if not state[1]:
+                del self.modules[job.module]
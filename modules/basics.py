@@ -27,10 +27,17 @@ Licensed under MIT
 This is a series of basic commands any bot really should have.
 """
 
+from core import httpcache
 from core import moduletemplate
+from core import ratelimit
+from tools import httpclient
+
+import time
 
 
 class BasicCommands(moduletemplate.BotModule):
+    # Only gistcommands makes a request (to paste the commands), on_command submits that one itself.
+    blocking_hooks = []
 
     def on_module_load(self):
         self.register_command("permissions", "[nick]",
@@ -58,6 +65,11 @@ class BasicCommands(moduletemplate.BotModule):
                               ["mod", "modules"])
         self.register_command("availablemodules", None, "Display a list of available modules.", self.PRIV_MOD,
                               ["amod"])
+        self.register_command("ignore", "<nick!user@host>", "Ignore everything from <nick!user@host>, which may "
+                              "contain * and ? as wildcards. A nick alone ignores that nick. Lasts until the bot "
+                              "restarts, add it to the configuration to keep ignoring it.", self.PRIV_MOD)
+        self.register_command("unignore", "<nick!user@host>", "Stop ignoring <nick!user@host>.", self.PRIV_MOD)
+        self.register_command("ignorelist", None, "Display the masks that are being ignored.", self.PRIV_MOD)
         self.register_command("identify", None, "Attempt to identify to services.", self.PRIV_ADMIN, ["auth"])
         self.register_command("shutdown", None,
                               "Shut the entire bot down. This includes connections to different networks",
@@ -73,6 +85,16 @@ class BasicCommands(moduletemplate.BotModule):
         self.register_command("loadmodule", "<module>", "Loads a <module>", self.PRIV_ADMIN, ["lmod"])
         self.register_command("unloadmodule", "<module>", "Unloads a <module>", self.PRIV_ADMIN, ["umod"])
         self.register_command("reloadmodule", "<module>", "Reloads a <module>", self.PRIV_ADMIN, ["rmod"])
+        self.register_command("hookstats", "[on/off/reset]", "Show which modules take the most time handling events "
+                              "and commands, or turn measuring it on or off.", self.PRIV_ADMIN)
+        self.register_command("httpcache", "[clear]", "Show how often modules were answered from the HTTP cache, "
+                              "or clear it.", self.PRIV_ADMIN)
+        self.register_command("sendqueue", None, "Show how long our messages wait in the flood protection queue "
+                              "before they are sent.", self.PRIV_ADMIN)
+        self.register_command("workers", None, "Show how busy the worker pool that runs blocking module hooks is.",
+                              self.PRIV_ADMIN)
+        self.register_command("httpstats", "[reset]", "Show how long HTTP requests to the slowest hosts take.",
+                              self.PRIV_ADMIN)
 
     def on_command(self, target, nick, command, commandtext, mod, admin):
 
@@ -131,9 +153,9 @@ class BasicCommands(moduletemplate.BotModule):
                 markdown = True
             # Paste all commands (and their respective commandhelps) to gist.github.com
             # this is useful if you want to provide a list of commands in your channels topic, etc.
-            cmdpaste = self._conn.commandhelp.getCommandPaste(nick, True, True, markdown)
-
-            return self.message(target, nick, cmdpaste)
+            if not self.submit(target, self.pasteCommands, target, nick, markdown):
+                return self.notice(nick, "I am too busy to paste the commands right now, please try again later.")
+            return
 
         if mod:
             if command == "join":
@@ -189,6 +211,33 @@ class BasicCommands(moduletemplate.BotModule):
                 return self.notice(nick, "The following modules are available: {}"
                                          .format(str(self._conn.ModuleHandler.getAvailableModulesList())))
 
+            if command == "ignore" or command == "unignore":
+                if not commandtext or " " in commandtext.strip():
+                    return self.notice(nick, "Usage: {} <nick!user@host>".format(command))
+
+                mask = commandtext.strip()
+                if "!" not in mask and "@" not in mask:
+                    mask += "!*@*"
+                elif "!" not in mask:
+                    mask = "*!" + mask
+                elif "@" not in mask:
+                    mask += "@*"
+
+                if command == "ignore":
+                    if not self._conn.ignorelist.ignore(mask):
+                        return self.notice(nick, "{} is already being ignored.".format(mask))
+                    return self.message(target, nick, "Now ignoring {}.".format(mask))
+
+                if not self._conn.ignorelist.unignore(mask):
+                    return self.notice(nick, "{} is not being ignored.".format(mask))
+                return self.message(target, nick, "No longer ignoring {}.".format(mask))
+
+            if command == "ignorelist":
+                masks = self._conn.ignorelist.getIgnoreList()
+                if not masks:
+                    return self.notice(nick, "Nobody is being ignored.")
+                return self.notice(nick, "Ignoring: {}".format(", ".join(masks)))
+
             if admin:
                 if command == "identify" or command == "auth":
                     identified = self._conn.identify()
@@ -198,8 +247,8 @@ class BasicCommands(moduletemplate.BotModule):
                     return True
 
                 if command == "shutdown":
-                    self._conn.shutdownRequested = True
                     self._conn.logger.log("Shutdown requested by {}".format(nick))
+                    self._conn.requestShutdown()
                     return True
 
                 if command == "disconnect":
@@ -277,8 +326,105 @@ class BasicCommands(moduletemplate.BotModule):
                     self._conn.reconnect()
                     return True
 
+                if command == "hookstats":
+                    return self.hook_stats(target, nick, commandtext.strip().lower() if commandtext else "")
+
+                if command == "httpcache":
+                    return self.http_cache(target, nick, commandtext.strip().lower() if commandtext else "")
+
+                if command == "sendqueue":
+                    return self.send_queue_stats(nick)
+
+                if command == "workers":
+                    stats = self._conn.engine.workers.getStats()
+                    return self.notice(nick, "Worker pool: {} threads, {} jobs queued or running, {} jobs run, "
+                                             "{} refused, {} failed."
+                                             .format(stats["workers"], stats["queued"], stats["jobs"],
+                                                     stats["refused"], stats["failed"]))
+
+                if command == "httpstats":
+                    return self.http_stats(target, nick, commandtext.strip().lower() if commandtext else "")
+
         return False
 
+    def http_cache(self, target, nick, action):
+        cache = httpcache.getCache()
+
+        if action == "clear":
+            cache.clear()
+            return self.message(target, nick, "The HTTP cache has been cleared.")
+
+        stats = cache.getStats()
+        self.notice(nick, "{} responses cached, {} hits ({} stale), {} misses, {} evicted."
+                          .format(stats["entries"], stats["hits"] + stats["stale"], stats["stale"], stats["misses"],
+                                  stats["evictions"]))
+        for source, counts in sorted(stats["sources"].items()):
+            self.notice(nick, "{}: {} hits, {} misses".format(source, counts[0], counts[1]))
+        return True
+
+    def send_queue_stats(self, nick):
+        stats = self._conn.ratelimiter.getStats()
+        self.notice(nick, "Send queue: {} lines queued, {} tokens left.".format(stats["queued"], stats["tokens"]))
+
+        for name in ratelimit.PRIORITY_NAMES:
+            self.notice(nick, "{}: {} sent, {} queued, waited {:.0f} ms on average, {:.0f} ms at most"
+                              .format(name, stats[name]["sent"], stats[name]["queued"],
+                                      stats[name]["latency_avg"] * 1000, stats[name]["latency_max"] * 1000))
+        return True
+
+    def http_stats(self, target, nick, action):
+        client = httpclient.getClient()
+
+        if action == "reset":
+            client.resetStats()
+            return self.message(target, nick, "HTTP statistics have been reset.")
+
+        stats = client.getStats()
+        if not stats:
+            return self.notice(nick, "No HTTP requests have been made yet.")
+
+        # Slowest on average first.
+        for host, (requests, errors, average, maximum) in sorted(stats.items(), key=lambda i: -i[1][2])[:5]:
+            self.notice(nick, "{}: {} requests ({} failed), {:.0f} ms on average, {:.0f} ms at most"
+                              .format(host, requests, errors, average, maximum))
+        return True
+
+    def hook_stats(self, target, nick, action):
+        handler = self._conn.ModuleHandler
+
+        if action == "on":
+            if handler.stats:
+                return self.notice(nick, "Hooks and commands are already being timed.")
+            handler.enableStats(self._conn.config.getHookStatsSlowThreshold() / 1000,
+                                self._conn.config.getHookStatsInterval())
+            return self.message(target, nick, "Timing hooks and commands from now on.")
+
+        if action == "off":
+            handler.disableStats()
+            return self.message(target, nick, "No longer timing hooks and commands.")
+
+        if not handler.stats:
+            return self.notice(nick, "Hooks and commands are not being timed, use 'hookstats on' to start.")
+
+        if action == "reset":
+            handler.stats.reset()
+            return self.message(target, nick, "Hook statistics have been reset.")
+
+        lines = handler.stats.getSummary()
+        if not lines:
+            return self.notice(nick, "Nothing has been timed yet.")
+
+        self.notice(nick, "Module handlers that took the most time in the last {} seconds:"
+                          .format(int(time.time() - handler.stats.since)))
+        for line in lines:
+            self.notice(nick, line)
+        return True
+
+    def pasteCommands(self, target, nick, markdown):
+        cmdpaste = self._conn.commandhelp.getCommandPaste(nick, True, True, markdown)
+
+        return self.message(target, nick, cmdpaste)
+
     def listCommands(self, nick, mod, admin, module=None):
         cmds = self._conn.commandhelp.getCommands(mod, admin, module)
         if module:
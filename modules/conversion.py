@@ -29,7 +29,6 @@ This is a module that introduces commands to convert currencies.
 
 from core import moduletemplate
 
-import requests
 import time
 
 
@@ -164,7 +163,7 @@ class Conversion(moduletemplate.BotModule):
                 tempname = "K"
                 newtempname = "°F"
             else:
-                self.warning("Temperature Conversion: Not found in lists: {}".format(commandtext))
+                self.warning("Temperature Conversion: Not found in lists: {}", commandtext)
                 return self.notice(nick, "An error occured: Conversion type was not found.")
 
             newtemp = round(newtemp, 2)
@@ -200,7 +199,7 @@ class Conversion(moduletemplate.BotModule):
                 weightname = "kg"
                 newweightname = "lb" if int(newweight) == 1 else "lbs"
             else:
-                self.warning("Weight Conversion: Not found in lists: {}".format(commandtext))
+                self.warning("Weight Conversion: Not found in lists: {}", commandtext)
                 return self.notice(nick, "An error occured: Conversion type was not found.")
 
             newweight = round(newweight, 2)
@@ -236,7 +235,7 @@ class Conversion(moduletemplate.BotModule):
                 distname = "kilometer" if int(dist) == 1 else "kilometers"
                 newdistname = "mile" if int(newdist) == 1 else "miles"
             else:
-                self.warning("Distance Conversion: Not found in lists: {}".format(commandtext))
+                self.warning("Distance Conversion: Not found in lists: {}", commandtext)
                 return self.notice(nick, "An error occured: Conversion type was not found.")
 
             newdist = round(newdist, 2)
@@ -288,11 +287,11 @@ class Conversion(moduletemplate.BotModule):
 
         json = None
         try:
-            r = requests.get(api_url, params=payload)
+            r = self.httpGet(api_url, payload)
             r.raise_for_status()
             json = r.json()
         except Exception as e:
-            self.warning("Error occured caching currency conversion: {}".format(str(e)))
+            self.warning("Error occured caching currency conversion: {}", str(e))
             return False
 
         self.cache["convert"]["age"] = time.time()
@@ -311,11 +310,11 @@ class Conversion(moduletemplate.BotModule):
 
         json = None
         try:
-            r = requests.get(api_url, params=payload)
+            r = self.httpGet(api_url, payload)
             r.raise_for_status()
             json = r.json()
         except Exception as e:
-            self.warning("Error occured caching currency info: {}".format(str(e)))
+            self.warning("Error occured caching currency info: {}", str(e))
             return False
 
         self.cache["info"]["age"] = time.time()
@@ -29,7 +29,6 @@ This module spellchecks, and looks up words from a dictionary.
 
 from core import moduletemplate
 
-import requests
 import xml.etree.ElementTree as et
 
 
@@ -84,12 +83,12 @@ class Dictionary(moduletemplate.BotModule):
 
         xml = None
         try:
-            r = requests.post(api_url, data=payload)
+            r = self.httpPost(api_url, payload, ttl=86400)
             r.raise_for_status()
 
             xml = r.text
         except Exception as e:
-            self.error("Spellcheck error: {}".format(str(e)))
+            self.error("Spellcheck error: {}", str(e))
             return "Could not check spelling: {}".format(str(e))
 
         retlist = {}
@@ -36,6 +36,14 @@ import sqlite3
 import time
 
 
+# Factoids are stored in lowercase, so the lookups can use a plain index.
+MIGRATIONS = [
+    ["CREATE TABLE IF NOT EXISTS factoids "
+     "(adder TEXT, channel TEXT, timestamp TEXT, factoid TEXT, response TEXT)"],
+    ["CREATE INDEX IF NOT EXISTS factoids_factoid ON factoids (factoid, channel)"]
+]
+
+
 class Factoid(moduletemplate.BotModule):
 
     def on_module_load(self):
@@ -43,6 +51,7 @@ class Factoid(moduletemplate.BotModule):
         self.validator = validator.Validator()
 
         self.db_file = os.path.join(self.db_dir, "{}_factoids.db".format(self.network_name))
+        self.db = self.openDatabase(self.db_file)
         self.factoid_make_db()
 
         if "global_factoids" not in self.module_data:
@@ -249,8 +258,7 @@ class Factoid(moduletemplate.BotModule):
         found = False
 
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
+            c = self.db.connection()
 
             if not channel:
                 result = (c.execute("SELECT response FROM factoids WHERE factoid = ?", [factoid])
@@ -264,8 +272,6 @@ class Factoid(moduletemplate.BotModule):
                 found = True
             else:
                 response = "Factoid '{}' was not found in the database".format(factoid)
-
-            conn.close()
         except sqlite3.Error as e:
             response = "factoid_getresponse({}) error: {}".format(factoid, str(e))
             self.error(response)
@@ -281,8 +287,7 @@ class Factoid(moduletemplate.BotModule):
         found = False
 
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
+            c = self.db.connection()
 
             if not channel:
                 result = (c.execute("SELECT adder, channel, timestamp, response FROM factoids WHERE factoid = ?",
@@ -298,8 +303,6 @@ class Factoid(moduletemplate.BotModule):
                 found = True
             else:
                 response = "Factoid '{}' was not found in the database".format(factoid)
-
-            conn.close()
         except sqlite3.Error as e:
             response = "factoid_getinfo({}): {}".format(factoid, str(e))
             self.error(response)
@@ -314,8 +317,7 @@ class Factoid(moduletemplate.BotModule):
         exists = False
 
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
+            c = self.db.connection()
             if not channel:
                 result = c.execute("SELECT adder FROM factoids WHERE factoid = ?", [factoid])
             else:
@@ -323,10 +325,8 @@ class Factoid(moduletemplate.BotModule):
 
             if result.fetchone():
                 exists = True
-
-            conn.close()
         except sqlite3.Error as e:
-            self.error("factoid_exists({}) error: {}".format(factoid, str(e)))
+            self.error("factoid_exists({}) error: {}", factoid, str(e))
 
         return exists
 
@@ -337,55 +337,38 @@ class Factoid(moduletemplate.BotModule):
         rows = 0
 
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
+            c = self.db.connection()
 
             if channel:
                 rows = len(c.execute("SELECT count(factoid) FROM factoids WHERE channel = ?", [channel]).fetchall())
             else:
                 rows = len(c.execute("SELECT count(factoid) FROM factoids").fetchall())
-
-            conn.close()
         except sqlite3.Error as e:
-            self.error("factoid_count() error: {}".format(str(e)))
+            self.error("factoid_count() error: {}", str(e))
 
         return rows
 
     def factoid_del(self, factoid_trigger, channel=None):
         factoid_trigger = factoid_trigger.lower()
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-
-            if not channel:
-                c.execute("DELETE FROM factoids WHERE factoid = ?", [factoid_trigger])
-            else:
-                c.execute("DELETE FROM factoids WHERE factoid = ? AND channel = ?", [factoid_trigger, channel])
-
-            conn.commit()
-            conn.close()
+            with self.db.connection() as c:
+                if not channel:
+                    c.execute("DELETE FROM factoids WHERE factoid = ?", [factoid_trigger])
+                else:
+                    c.execute("DELETE FROM factoids WHERE factoid = ? AND channel = ?", [factoid_trigger, channel])
         except sqlite3.Error as e:
-            self.error("factoid_del({}) error: {}".format(factoid_trigger, str(e)))
+            self.error("factoid_del({}) error: {}", factoid_trigger, str(e))
 
     def factoid_add(self, adder, factoid_trigger, factoid_response, channel=None):
         factoid_trigger = factoid_trigger.lower()
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
 
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-
-            if not channel:
-                c.execute("INSERT INTO factoids (adder, channel, timestamp, factoid, response) VALUES (?, ?, ?, ?, ?)",
-                          [adder, "global", timestamp, factoid_trigger, factoid_response])
-            else:
+            with self.db.connection() as c:
                 c.execute("INSERT INTO factoids (adder, channel, timestamp, factoid, response) VALUES (?, ?, ?, ?, ?)",
-                          [adder, channel, timestamp, factoid_trigger, factoid_response])
-
-            conn.commit()
-            conn.close()
+                          [adder, channel or "global", timestamp, factoid_trigger, factoid_response])
         except sqlite3.Error as e:
-            self.error("factoid_add({}, {}, {}) error: {}".format(adder, factoid_trigger, factoid_response, str(e)))
+            self.error("factoid_add({}, {}, {}) error: {}", adder, factoid_trigger, factoid_response, str(e))
 
     def factoid_isrequest(self, line):
         """What to check for to validate user is requesting a bot factoid"""
@@ -404,11 +387,6 @@ class Factoid(moduletemplate.BotModule):
 
     def factoid_make_db(self):
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            c.execute("CREATE TABLE IF NOT EXISTS factoids "
-                      "(adder TEXT, channel TEXT, timestamp TEXT, factoid TEXT, response TEXT)")
-            conn.commit()
-            conn.close()
+            self.db.migrate(MIGRATIONS)
         except sqlite3.Error as e:
-            self.error("factoid_make_db() error: Failed to create database factoids.db: {}".format(str(e)))
+            self.error("factoid_make_db() error: Failed to create database factoids.db: {}", str(e))
@@ -31,7 +31,6 @@ from core import moduletemplate
 from tools import shorturl
 from tools import urltools
 
-import requests
 import urllib.parse
 
 
@@ -69,7 +68,7 @@ class Google(moduletemplate.BotModule):
         json = ""
 
         try:
-            request = requests.get(url, params=payload)
+            request = self.httpGet(url, payload, ttl=3600)
             request.raise_for_status()
 
             json = request.json()
@@ -109,7 +108,7 @@ class Google(moduletemplate.BotModule):
         json = ""
 
         try:
-            request = requests.get(url, params=payload)
+            request = self.httpGet(url, payload, ttl=3600)
             request.raise_for_status()
 
             json = request.json()
@@ -29,8 +29,6 @@ isup - check if a website is up using isup.me and the bot itself
 
 from core import moduletemplate
 
-import requests
-
 
 class Isup(moduletemplate.BotModule):
 
@@ -51,7 +49,7 @@ class Isup(moduletemplate.BotModule):
 
     def check_if_up(self, url, target, nick):
         url = url.replace("https://", "").replace("http://", "")
-        r = requests.get("http://isup.me/{}".format(url))
+        r = self.httpGet("http://isup.me/{}".format(url), ttl=60)
 
         isup = ""
 
@@ -30,12 +30,16 @@ Look up recent songs from Last.FM.
 from core import moduletemplate
 from tools import duration
 
-import requests
 import sqlite3
 import time
 import os
 
 
+MIGRATIONS = [
+    ["CREATE TABLE IF NOT EXISTS lastfm (nick TEXT UNIQUE PRIMARY KEY, account TEXT, timestamp TEXT)"]
+]
+
+
 class LastFM(moduletemplate.BotModule):
 
     def on_module_load(self):
@@ -52,6 +56,7 @@ class LastFM(moduletemplate.BotModule):
                               ["dellastfm"])
 
         self.db_file = os.path.join(self.db_dir, "{}_lastfm.db".format(self.network_name))
+        self.db = self.openDatabase(self.db_file)
         self.lastfm_create_db()
 
     def on_command(self, target, nick, command, commandtext, mod, admin):
@@ -160,11 +165,11 @@ class LastFM(moduletemplate.BotModule):
 
         json = ""
         try:
-            r = requests.get(api_url, params=payload)
+            r = self.httpGet(api_url, payload, ttl=30)
             r.raise_for_status()
             json = r.json()
         except Exception as e:
-            self.warning("Could not retrieve LastFM np information for {}: {}".format(account, str(e)))
+            self.warning("Could not retrieve LastFM np information for {}: {}", account, str(e))
             self.message(target, nick, "Could not retrieve information: {}".format(str(e)))
 
         acct = ""
@@ -238,97 +243,79 @@ class LastFM(moduletemplate.BotModule):
 
     def lastfm_get_info(self, nick):
         if not nick.isalnum():
-            self.warning("lastfm: Possible injection: INSERT for nick '{}' requested.".format(nick))
+            self.warning("lastfm: Possible injection: INSERT for nick '{}' requested.", nick)
             return False
 
         nick = nick.lower()
         data = None
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
+            c = self.db.connection()
             result = c.execute("SELECT nick, account, timestamp FROM lastfm WHERE nick = ?", [nick]).fetchone()
 
             if result:
                 data = result
-
-            conn.close()
         except sqlite3.Error as e:
-            self.error("lastfm_get_info({}) error: {}".format(nick, str(e)))
+            self.error("lastfm_get_info({}) error: {}", nick, str(e))
             return False
 
         return data
 
     def lastfm_unset_account(self, nick):
         if not nick.isalnum():
-            self.warning("lastfm: Possible injection: INSERT for nick '{}' requested.".format(nick))
+            self.warning("lastfm: Possible injection: INSERT for nick '{}' requested.", nick)
             return False
 
         nick = nick.lower()
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            c.execute("DELETE FROM lastfm WHERE nick = ?", [nick])
-
-            conn.commit()
-            conn.close()
+            with self.db.connection() as c:
+                c.execute("DELETE FROM lastfm WHERE nick = ?", [nick])
         except sqlite3.Error as e:
-            self.error("lastfm_unset_account({}) error: {}".format(nick, str(e)))
+            self.error("lastfm_unset_account({}) error: {}", nick, str(e))
             return False
 
         return True
 
     def lastfm_set_account(self, nick, account):
         if not nick.isalnum():
-            self.warning("lastfm: Possible injection: INSERT for nick '{}' requested.".format(nick))
+            self.warning("lastfm: Possible injection: INSERT for nick '{}' requested.", nick)
             return False
         if not account.isalnum():
-            self.warning("lastfm: Possible injection: INSERT for account '{}' requested.".format(account))
+            self.warning("lastfm: Possible injection: INSERT for account '{}' requested.", account)
             return False
 
         nick = nick.lower()
         ts = time.strftime("%Y-%m-%d %H:%M:%S")
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            c.execute("INSERT OR REPLACE INTO lastfm (nick, account, timestamp) VALUES (?, ?, ?)", [nick, account, ts])
-
-            conn.commit()
-            conn.close()
+            with self.db.connection() as c:
+                c.execute("INSERT OR REPLACE INTO lastfm (nick, account, timestamp) VALUES (?, ?, ?)",
+                          [nick, account, ts])
         except sqlite3.Error as e:
-            self.error("lastfm_set_account({}, {}) error: {}".format(nick, account, str(e)))
+            self.error("lastfm_set_account({}, {}) error: {}", nick, account, str(e))
             return False
 
         return True
 
     def lastfm_get_account(self, nick):
         if not nick.isalnum():
-            self.warning("lastfm: Possible injection: Lookup for '{}' requested.".format(nick))
+            self.warning("lastfm: Possible injection: Lookup for '{}' requested.", nick)
             return False
 
         nick = nick.lower()
         account = None
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
+            c = self.db.connection()
             result = c.execute("SELECT account FROM lastfm WHERE nick = ?", [nick]).fetchone()
 
             if result:
                 account = result[0]
-
-            conn.close()
         except sqlite3.Error as e:
-            self.error("lastfm_get_account({}) error: {}".format(nick, str(e)))
+            self.error("lastfm_get_account({}) error: {}", nick, str(e))
             return False
 
         return account
 
     def lastfm_create_db(self):
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            c.execute("CREATE TABLE IF NOT EXISTS lastfm "
-                      "(nick TEXT UNIQUE PRIMARY KEY, account TEXT, timestamp TEXT)")
-            conn.commit()
-            conn.close()
+            self.db.migrate(MIGRATIONS)
         except sqlite3.Error as e:
-            self.error("lastfm_create_db() error: Failed to create database lastfm.db: {}".format(str(e)))
+            self.error("lastfm_create_db() error: Failed to create database lastfm.db: {}", str(e))
@@ -34,10 +34,18 @@ import os
 import time
 
 
+MIGRATIONS = [
+    ["CREATE TABLE IF NOT EXISTS quote "
+     "(id INTEGER UNIQUE PRIMARY KEY AUTOINCREMENT, author varchar(50), quote TEXT, "
+     "timestamp varchar(20), unix_timestamp INTEGER)"]
+]
+
+
 class Quote(moduletemplate.BotModule):
 
     def on_module_load(self):
         self.db_file = os.path.join(self.db_dir, "{}_quote.db".format(self.network_name))
+        self.db = self.openDatabase(self.db_file)
 
         self.register_command("quote", "[Quote ID / Quote String]",
                               "Show a random quote, the quote by ID [Quote ID], or a quote containing [Quote String]",
@@ -169,16 +177,14 @@ class Quote(moduletemplate.BotModule):
     def quote_exists(self, id):
         exists = False
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
+            c = self.db.connection()
 
             result = c.execute("SELECT id FROM quote WHERE id = ?", [id]).fetchone()
 
             if result and len(result) >= 1:
                 exists = True
-            conn.close()
         except sqlite3.Error as e:
-            self.error("quote_exists({}) error: {}".format(id, str(e)))
+            self.error("quote_exists({}) error: {}", id, str(e))
             return False
         return exists
 
@@ -187,17 +193,11 @@ class Quote(moduletemplate.BotModule):
         unix_timestamp = int(time.time())
         timestamp = time.strftime("%d %b, %Y")
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-
-            c.execute("INSERT INTO quote (author, quote, timestamp, unix_timestamp) VALUES (?, ?, ?, ?)",
-                      [author, quote, timestamp, unix_timestamp])
-            id = c.lastrowid
-
-            conn.commit()
-            conn.close()
+            with self.db.connection() as c:
+                id = c.execute("INSERT INTO quote (author, quote, timestamp, unix_timestamp) VALUES (?, ?, ?, ?)",
+                               [author, quote, timestamp, unix_timestamp]).lastrowid
         except sqlite3.Error as e:
-            self.error("quote_add({}, {}) error: {}".format(author, quote, str(e)))
+            self.error("quote_add({}, {}) error: {}", author, quote, str(e))
             return "Could not add quote: {}".format(str(e))
         return "Quote has been added under the ID {}.".format(id)
 
@@ -207,15 +207,10 @@ class Quote(moduletemplate.BotModule):
             return "Quote does not exist."
 
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-
-            c.execute("UPDATE quote SET quote = ? WHERE id = ? LIMIT 1", [newquote, id])
-
-            conn.commit()
-            conn.close()
+            with self.db.connection() as c:
+                c.execute("UPDATE quote SET quote = ? WHERE id = ? LIMIT 1", [newquote, id])
         except sqlite3.Error as e:
-            self.error("quote_edit({}, {}) error: {}".format(id, newquote, str(e)))
+            self.error("quote_edit({}, {}) error: {}", id, newquote, str(e))
             return "Could not edit quote: {}".format(str(e))
         return False  # Returns text (truthy) on failure; false on success.
 
@@ -225,15 +220,10 @@ class Quote(moduletemplate.BotModule):
             return "Quote does not exist."
 
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-
-            c.execute("DELETE FROM quote WHERE id = ? LIMIT 1", [id])
-
-            conn.commit()
-            conn.close()
+            with self.db.connection() as c:
+                c.execute("DELETE FROM quote WHERE id = ? LIMIT 1", [id])
         except sqlite3.Error as e:
-            self.error("quote_delete({}) error: {}".format(id, str(e)))
+            self.error("quote_delete({}) error: {}", id, str(e))
             return "Could not delete quote: {}".format(str(e))
         return False  # Returns text (truthy) on failure; false on success.
 
@@ -243,17 +233,14 @@ class Quote(moduletemplate.BotModule):
 
         author = ""
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
+            c = self.db.connection()
 
             result = c.execute("SELECT author FROM quote WHERE id = ?", [id]).fetchone()
 
             if result and len(result) >= 1:
                 author = result[0]
-
-            conn.close()
         except sqlite3.Error as e:
-            self.error("quote_author({}) error: {}".format(author, str(e)))
+            self.error("quote_author({}) error: {}", author, str(e))
             return False
 
         if author:
@@ -263,8 +250,7 @@ class Quote(moduletemplate.BotModule):
     def quote_random(self):
         quote = ""
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
+            c = self.db.connection()
 
             result = c.execute("SELECT id, author, quote, timestamp FROM quote WHERE id >= "
                                "(abs(random()) % (SELECT max(id) FROM quote)) LIMIT 1").fetchone()
@@ -273,10 +259,8 @@ class Quote(moduletemplate.BotModule):
                 quote = "Quote #{} by {}: {} (added on {})".format(result[0], result[1], result[2], result[3])
             else:
                 quote = "Could not find a random quote."
-
-            conn.close()
         except sqlite3.Error as e:
-            self.error("quote_random() error: {}".format(str(e)))
+            self.error("quote_random() error: {}", str(e))
             return "Could not retrieve random quote: {}".format(str(e))
 
         if quote:
@@ -286,8 +270,7 @@ class Quote(moduletemplate.BotModule):
     def quote_search(self, search):
         quote = ""
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
+            c = self.db.connection()
 
             if search.isdigit():
                 result = c.execute("SELECT id, author, quote, timestamp FROM quote WHERE id = ?",
@@ -300,10 +283,8 @@ class Quote(moduletemplate.BotModule):
                 quote = "Quote #{} by {}: {} (added on {})".format(result[0], result[1], result[2], result[3])
             else:
                 quote = "No such quote was found."
-
-            conn.close()
         except sqlite3.Error as e:
-            self.error("quote_search({}) error: {}".format(search, str(e)))
+            self.error("quote_search({}) error: {}", search, str(e))
             return "Could not retrieve quote: {}".format(str(e))
 
         if quote:
@@ -313,8 +294,7 @@ class Quote(moduletemplate.BotModule):
     def quote_count(self, author):
         count = 0
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
+            c = self.db.connection()
             result = None
 
             if author == "*":
@@ -325,21 +305,13 @@ class Quote(moduletemplate.BotModule):
 
             if result and len(result) >= 1:
                 count = result[0]
-
-            conn.close()
         except sqlite3.Error as e:
-            self.error("quote_count({}) error: {}".format(author, str(e)))
+            self.error("quote_count({}) error: {}", author, str(e))
             return False
         return count
 
     def quote_make_db(self):
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            c.execute("CREATE TABLE IF NOT EXISTS quote "
-                      "(id INTEGER UNIQUE PRIMARY KEY AUTOINCREMENT, author varchar(50), quote TEXT, "
-                      "timestamp varchar(20), unix_timestamp INTEGER)")
-            conn.commit()
-            conn.close()
+            self.db.migrate(MIGRATIONS)
         except sqlite3.Error as e:
-            self.error("quote_make_db() error: {}".format(str(e)))
+            self.error("quote_make_db() error: {}", str(e))
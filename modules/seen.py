@@ -25,6 +25,10 @@ seen.py by Zarthus
 Licensed under MIT
 
 Check when an user was last seen (according to the bots database).
+
+Seen data is stored on nearly every line the bot receives, so it is not written to the database right away.
+The latest entry of every nick is kept in memory and written in a single transaction every `flush_interval` seconds,
+or sooner when `flush_size` nicks are waiting. A crash loses at most `flush_interval` seconds of seen data.
 """
 
 from core import moduletemplate
@@ -34,9 +38,24 @@ from tools import validator
 import os
 import random
 import sqlite3
+import threading
 import time
 
 
+MIGRATIONS = [
+    ["CREATE TABLE IF NOT EXISTS seen "
+     "(nick TEXT UNIQUE, host TEXT, timestamp TEXT, unix_timestamp TEXT, description TEXT)"],
+    # Nicks are looked up case insensitively, so only keep the latest entry of nicks stored in several cases,
+    # after which a unique index makes INSERT OR REPLACE replace those too.
+    ["CREATE INDEX seen_nick_nocase ON seen (nick COLLATE NOCASE)",
+     "DELETE FROM seen WHERE EXISTS (SELECT 1 FROM seen AS newer WHERE newer.nick = seen.nick COLLATE NOCASE "
+     "AND (CAST(newer.unix_timestamp AS INTEGER) > CAST(seen.unix_timestamp AS INTEGER) OR "
+     "(newer.unix_timestamp = seen.unix_timestamp AND newer.rowid > seen.rowid)))",
+     "DROP INDEX seen_nick_nocase",
+     "CREATE UNIQUE INDEX IF NOT EXISTS seen_nick ON seen (nick COLLATE NOCASE)"]
+]
+
+
 class Seen(moduletemplate.BotModule):
 
     def on_module_load(self):
@@ -47,12 +66,33 @@ class Seen(moduletemplate.BotModule):
         self.db_file = os.path.join(self.db_dir, "{}_seen.db".format(self.network_name))
         self.validator = validator.Validator()
 
-        self.make_seen_db()
-
         if "store_message" not in self.module_data:
             # It's safer (sql injections), more resource efficient (less to store), and less privacy-infringing
             # to not store messages.
             self.module_data["store_message"] = False
+        if "flush_interval" not in self.module_data:
+            self.module_data["flush_interval"] = 10
+        if "flush_size" not in self.module_data:
+            self.module_data["flush_size"] = 250
+
+        self.pending = {}  # lowercase nick: the row to store for it.
+        self.pending_lock = threading.Lock()
+        self.flush_event = threading.Event()
+        self.running = True
+
+        self.db = self.openDatabase(self.db_file)
+        self.make_seen_db()
+
+        self.flusher = threading.Thread(target=self.run_flusher, name="{}-seen".format(self.network_name))
+        self.flusher.daemon = True
+        self.flusher.start()
+
+    def on_module_unload(self):
+        self.running = False
+        self.flush_event.set()
+        self.flusher.join()
+
+        self.flush_seen()
 
     def on_privmsg(self, target, nick, message):
         if self.module_data["store_message"]:
@@ -104,6 +144,17 @@ class Seen(moduletemplate.BotModule):
         else:
             self.store_seen(nick, "quitting IRC")
 
+    def on_netsplit(self, servers, quits):
+        self.store_seen_many([(nick, "quitting IRC in a netsplit ({})".format(servers)) for nick, message in quits])
+
+    def on_netjoin(self, servers, joins):
+        channels = {}
+        for nick, channel in joins:
+            channels.setdefault(nick, []).append(channel)
+
+        self.store_seen_many([(nick, "rejoining {} after a netsplit".format(", ".join(chans)))
+                              for nick, chans in channels.items()])
+
     def on_command(self, target, nick, command, commandtext, mod, admin):
         if command == "seen":
             if not commandtext:
@@ -155,76 +206,106 @@ class Seen(moduletemplate.BotModule):
 
     def was_seen(self, nickname):
         if not self.validator.nickname(nickname):
-            self.warning("seen: Tried to get wasseen data from invalid nickname {}".format(nickname))
+            self.warning("seen: Tried to get wasseen data from invalid nickname {}", nickname)
             return False
 
         seen = False
         nickname = nickname.lower()
+
+        with self.pending_lock:
+            if nickname in self.pending:
+                return True
+
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            result = c.execute("SELECT nick FROM seen WHERE lower(nick) = ?", [nickname])
+            result = self.db.execute("SELECT nick FROM seen WHERE nick = ? COLLATE NOCASE", [nickname]).fetchone()
 
-            if result.fetchone():
+            if result:
                 seen = True
-
-            conn.close()
         except sqlite3.Error as e:
-            self.error("was_seen({}) error: {}".format(nickname, str(e)))
+            self.error("was_seen({}) error: {}", nickname, str(e))
 
         return seen
 
     def get_seen(self, nickname):
         if not self.validator.nickname(nickname):
-            self.warning("seen: Tried to get seen data from invalid nickname {}".format(nickname))
+            self.warning("seen: Tried to get seen data from invalid nickname {}", nickname)
             return False
 
         nickname = nickname.lower()
         response = ""
 
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            result = c.execute("SELECT * FROM seen WHERE lower(nick) = ?", [nickname]).fetchone()
+            with self.pending_lock:
+                result = self.pending.get(nickname)
+
+            if not result:
+                result = self.db.execute("SELECT * FROM seen WHERE nick = ? COLLATE NOCASE", [nickname]).fetchone()
 
-            if len(result) > 4:
+            if result and len(result) > 4:
                 response = ("{} ({}) was last seen on {} ({} ago) {}"
                             .format(result[0], result[1], result[2],
                                     duration.timesincetimestamp(int(result[3])), result[4]))
-
-            conn.close()
         except sqlite3.Error as e:
-            self.error("get_seen({}) error: {}".format(nickname, str(e)))
+            self.error("get_seen({}) error: {}", nickname, str(e))
 
         return response
 
     def store_seen(self, nickname, data):
-        if not self.validator.nickname(nickname):
-            self.warning("seen: Tried to store invalid nickname {}".format(nickname))
-            return False
+        return self.store_seen_many([(nickname, data)])
 
-        host = self.get_userhost_from_nick(nickname)
+    def store_seen_many(self, entries):
+        """Store a list of (nickname, data) at once."""
         timestamp = time.strftime("%d %B, %Y - %H:%M:%S %Z")
-        unix_timestamp = int(time.time())
+        unix_timestamp = str(int(time.time()))
+        rows = []
 
-        try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            c.execute("INSERT OR REPLACE INTO seen (nick, host, timestamp, unix_timestamp, description) "
-                      "VALUES (?, ?, ?, ?, ?)", [nickname, host, timestamp, unix_timestamp, data])
+        for nickname, data in entries:
+            if not self.validator.nickname(nickname):
+                self.warning("seen: Tried to store invalid nickname {}", nickname)
+                continue
 
-            conn.commit()
-            conn.close()
+            rows.append((nickname, self.get_userhost_from_nick(nickname), timestamp, unix_timestamp, data))
+
+        if not rows:
+            return False
+
+        with self.pending_lock:
+            for row in rows:
+                self.pending[row[0].lower()] = row
+            full = len(self.pending) >= self.module_data["flush_size"]
+
+        if full:
+            self.flush_event.set()
+
+    def run_flusher(self):
+        """Write the pending seen data every flush_interval seconds, or when flush_event is set."""
+        while self.running:
+            self.flush_event.wait(self.module_data["flush_interval"])
+            self.flush_event.clear()
+            self.flush_seen()
+
+    def flush_seen(self):
+        with self.pending_lock:
+            if not self.pending:
+                return
+            rows = list(self.pending.values())
+            self.pending = {}
+
+        try:
+            with self.db.connection() as c:
+                c.executemany("INSERT OR REPLACE INTO seen (nick, host, timestamp, unix_timestamp, description) "
+                              "VALUES (?, ?, ?, ?, ?)", rows)
         except sqlite3.Error as e:
-            self.error("store_seen({}, {}) error: {}".format(nickname, data, str(e)))
+            self.error("flush_seen() error: Failed to store {} nicks, retrying on the next flush: {}",
+                       len(rows), str(e))
+
+            with self.pending_lock:
+                # Put them back for the next flush, entries stored since then are newer and are kept instead.
+                for row in rows:
+                    self.pending.setdefault(row[0].lower(), row)
 
     def make_seen_db(self):
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            c.execute("CREATE TABLE IF NOT EXISTS seen "
-                      "(nick TEXT UNIQUE, host TEXT, timestamp TEXT, unix_timestamp TEXT, description TEXT)")
-            conn.commit()
-            conn.close()
+            self.db.migrate(MIGRATIONS)
         except sqlite3.Error as e:
-            self.error("make_seen_db() error: Failed to create database seen.db: {}".format(str(e)))
+            self.error("make_seen_db() error: Failed to create database seen.db: {}", str(e))
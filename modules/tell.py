@@ -36,10 +36,20 @@ import os
 import time
 
 
+# Nicks are compared case insensitively, the indexes use the same collation as the queries so they can be used.
+MIGRATIONS = [
+    ["CREATE TABLE IF NOT EXISTS tell "
+     "(sender TEXT, recipient TEXT, message TEXT, timestamp TEXT, unix_timestamp TEXT)"],
+    ["CREATE INDEX IF NOT EXISTS tell_recipient ON tell (recipient COLLATE NOCASE)",
+     "CREATE INDEX IF NOT EXISTS tell_sender ON tell (sender COLLATE NOCASE, recipient COLLATE NOCASE)"]
+]
+
+
 class Tell(moduletemplate.BotModule):
 
     def on_module_load(self):
         self.db_file = os.path.join(self.db_dir, "{}_tell.db".format(self.network_name))
+        self.db = self.openDatabase(self.db_file)
 
         self.register_command("tell", "<nickname> <message>",
                               "Once <nickname> appears online (by sending a message to a channel I am in), "
@@ -154,10 +164,9 @@ class Tell(moduletemplate.BotModule):
 
     def show_tells(self, nick):
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            result = c.execute("SELECT sender, message, timestamp, unix_timestamp FROM tell WHERE "
-                               "lower(recipient) = ?", [nick.lower()]).fetchall()
+            result = self.db.execute("SELECT sender, message, timestamp, unix_timestamp FROM tell WHERE "
+                                     "recipient = ? COLLATE NOCASE", [nick]).fetchall()
+            receipts = []
 
             for msg in result:
                 self.message(nick, None, "$(bold){}$(clear) left you a message: {} - Sent on {} ({} ago)"
@@ -179,17 +188,16 @@ class Tell(moduletemplate.BotModule):
                                   .format(msg[1], nick, msg[2]))
                         timestamp = time.strftime("%Y-%m-%d %H:%M:%S %Z")
                         unix_timestamp = int(time.time())
-                        c.execute("INSERT INTO tell (sender, recipient, message, timestamp, unix_timestamp) "
-                                  "VALUES (?, ?, ?, ?, ?)", [sender, msg[0], rcvmsg, timestamp, unix_timestamp])
+                        receipts.append([sender, msg[0], rcvmsg, timestamp, unix_timestamp])
                         self.hastells[msg[0].lower()] = True
 
-            c.execute("DELETE FROM tell WHERE lower(recipient) = ?", [nick.lower()])
+            with self.db.connection() as c:
+                c.executemany("INSERT INTO tell (sender, recipient, message, timestamp, unix_timestamp) "
+                              "VALUES (?, ?, ?, ?, ?)", receipts)
+                c.execute("DELETE FROM tell WHERE recipient = ? COLLATE NOCASE", [nick])
             self.hastells[nick.lower()] = False
-
-            conn.commit()
-            conn.close()
         except sqlite3.Error as e:
-            self.error("show_tells({}) error: {}".format(nick, str(e)))
+            self.error("show_tells({}) error: {}", nick, str(e))
             return False
         return True
 
@@ -199,17 +207,15 @@ class Tell(moduletemplate.BotModule):
             return self.hastells[to]
 
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            result = c.execute("SELECT timestamp FROM tell WHERE lower(recipient) = ?",
+            c = self.db.connection()
+            result = c.execute("SELECT timestamp FROM tell WHERE recipient = ? COLLATE NOCASE LIMIT 1",
                                [to]).fetchone()
             if result and len(result) >= 1:
                 self.hastells[to] = True
             else:
                 self.hastells[to] = False
-            conn.close()
         except sqlite3.Error as e:
-            self.error("has_tells({}) error: {}".format(to, str(e)))
+            self.error("has_tells({}) error: {}", to, str(e))
             return False
 
         if to in self.hastells:  # This should always be set, but the extra security if doesn't hurt.
@@ -219,15 +225,13 @@ class Tell(moduletemplate.BotModule):
     def tell_exists(self, sender, to):
         exists = False
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            result = c.execute("SELECT timestamp FROM tell WHERE lower(sender) = ? and lower(recipient) = ?",
-                               [sender.lower(), to.lower()]).fetchone()
+            c = self.db.connection()
+            result = c.execute("SELECT timestamp FROM tell WHERE sender = ? COLLATE NOCASE and "
+                               "recipient = ? COLLATE NOCASE LIMIT 1", [sender, to]).fetchone()
             if result and len(result) >= 1:
                 exists = True
-            conn.close()
         except sqlite3.Error as e:
-            self.error("tell_exists({}, {}) error: {}".format(sender, to, str(e)))
+            self.error("tell_exists({}, {}) error: {}", sender, to, str(e))
             return False
 
         return exists
@@ -244,22 +248,20 @@ class Tell(moduletemplate.BotModule):
 
         passedlimit = False
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
+            c = self.db.connection()
 
             result = None
             if send:
-                result = c.execute("SELECT count(timestamp) FROM tell WHERE lower(sender) = ?",
-                                   [sender.lower()]).fetchone()
+                result = c.execute("SELECT count(timestamp) FROM tell WHERE sender = ? COLLATE NOCASE",
+                                   [sender]).fetchone()
             else:
-                result = c.execute("SELECT count(timestamp) FROM tell WHERE lower(recipient) = ?",
-                                   [sender.lower()]).fetchone()
+                result = c.execute("SELECT count(timestamp) FROM tell WHERE recipient = ? COLLATE NOCASE",
+                                   [sender]).fetchone()
 
             if result[0] >= self.module_data["max_tells"]:
                 passedlimit = True
-            conn.close()
         except sqlite3.Error as e:
-            self.error("tell_passes_limit({}, {}) error: {}".format(sender, str(send), str(e)))
+            self.error("tell_passes_limit({}, {}) error: {}", sender, str(send), str(e))
             return False
 
         return passedlimit
@@ -267,23 +269,21 @@ class Tell(moduletemplate.BotModule):
     def tell_count(self, sender, to=None):
         count = 0
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
+            c = self.db.connection()
             result = None
 
             if sender == "*":
                 result = c.execute("SELECT count(timestamp) FROM tell WHERE 1").fetchone()
             elif to:
-                result = c.execute("SELECT count(timestamp) FROM tell WHERE lower(sender) = ? and "
-                                   "lower(recipient) = ?", [sender.lower(), to.lower()]).fetchone()
+                result = c.execute("SELECT count(timestamp) FROM tell WHERE sender = ? COLLATE NOCASE and "
+                                   "recipient = ? COLLATE NOCASE", [sender, to]).fetchone()
             else:
-                result = c.execute("SELECT count(timestamp) FROM tell WHERE lower(sender) = ?",
-                                   [sender.lower()]).fetchone()
+                result = c.execute("SELECT count(timestamp) FROM tell WHERE sender = ? COLLATE NOCASE",
+                                   [sender]).fetchone()
 
             count = result[0]
-            conn.close()
         except sqlite3.Error as e:
-            self.error("tell_list({}) error: {}".format(sender, str(e)))
+            self.error("tell_list({}) error: {}", sender, str(e))
             return False
         return count
 
@@ -291,14 +291,11 @@ class Tell(moduletemplate.BotModule):
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S %Z")
         unix_timestamp = int(time.time())
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            c.execute("INSERT INTO tell (sender, recipient, message, timestamp, unix_timestamp) "
-                      "VALUES (?, ?, ?, ?, ?)", [sender, to, message, timestamp, unix_timestamp])
-            conn.commit()
-            conn.close()
+            with self.db.connection() as c:
+                c.execute("INSERT INTO tell (sender, recipient, message, timestamp, unix_timestamp) "
+                          "VALUES (?, ?, ?, ?, ?)", [sender, to, message, timestamp, unix_timestamp])
         except sqlite3.Error as e:
-            self.error("tell_store({}, {}, {}) error: {}".format(sender, to, message, str(e)))
+            self.error("tell_store({}, {}, {}) error: {}", sender, to, message, str(e))
             return False
 
         self.hastells[to.lower()] = True
@@ -306,14 +303,11 @@ class Tell(moduletemplate.BotModule):
 
     def tell_delete(self, sender, to):
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            c.execute("DELETE FROM tell WHERE lower(sender) = ? and lower(recipient) = ?",
-                      [sender.lower(), to.lower()])
-            conn.commit()
-            conn.close()
+            with self.db.connection() as c:
+                c.execute("DELETE FROM tell WHERE sender = ? COLLATE NOCASE and recipient = ? COLLATE NOCASE",
+                          [sender, to])
         except sqlite3.Error as e:
-            self.error("tell_delete({}, {}) error: {}".format(sender, to, str(e)))
+            self.error("tell_delete({}, {}) error: {}", sender, to, str(e))
             return False
 
         self.hastells[to.lower()] = False
@@ -322,13 +316,10 @@ class Tell(moduletemplate.BotModule):
     def tell_delete_all(self, sender):
         """Deletes all pending tells from user."""
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            c.execute("DELETE FROM tell WHERE lower(sender) = ?", [sender.lower()])
-            conn.commit()
-            conn.close()
+            with self.db.connection() as c:
+                c.execute("DELETE FROM tell WHERE sender = ? COLLATE NOCASE", [sender])
         except sqlite3.Error as e:
-            self.error("tell_delete_all({}) error: {}".format(sender, str(e)))
+            self.error("tell_delete_all({}) error: {}", sender, str(e))
             return False
 
         self.hastells[sender.lower()] = False
@@ -336,11 +327,6 @@ class Tell(moduletemplate.BotModule):
 
     def tell_make_db(self):
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            c.execute("CREATE TABLE IF NOT EXISTS tell "
-                      "(sender TEXT, recipient TEXT, message TEXT, timestamp TEXT, unix_timestamp TEXT)")
-            conn.commit()
-            conn.close()
+            self.db.migrate(MIGRATIONS)
         except sqlite3.Error as e:
-            self.error("tell_make_db() error: Failed to create database tell.db: {}".format(str(e)))
+            self.error("tell_make_db() error: Failed to create database tell.db: {}", str(e))
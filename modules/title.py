@@ -32,10 +32,11 @@ from tools import urlparse
 from tools import urltools
 
 import re
-import requests
 
 
 class Title(moduletemplate.BotModule):
+    # Most lines have no URL in them, on_privmsg looks for one itself and only submits the lines that have.
+    blocking_hooks = ["on_command"]
 
     def on_module_load(self):
         self.register_command("title", "<website>", "Get the title from <website>", self.PRIV_NONE, ["gettitle"])
@@ -48,6 +49,10 @@ class Title(moduletemplate.BotModule):
         self.wikipedia_url = re.compile(r"(https?:\/\/)?([a-z]{2}\.)?wikipedia\.[a-z]{1,3}\/wiki\/(.{1,32})")
 
     def on_privmsg(self, target, nick, message):
+        if urlparse.URL_REGEX.search(message):
+            self.submit(target, self.send_titles, target, nick, message)
+
+    def send_titles(self, target, nick, message):
         urls = urlparse.Url.findAll(message)
 
         urls_found = 0
@@ -120,11 +125,11 @@ class Title(moduletemplate.BotModule):
         json = None
 
         try:
-            r = requests.get("{}info.0.json".format(url))
+            r = self.httpGet("{}info.0.json".format(url), ttl=86400)
             r.raise_for_status()
             json = r.json()
         except Exception as e:
-            self.warning("Failed to get xkcd '{}': {}".format(url, str(e)))
+            self.warning("Failed to get xkcd '{}': {}", url, str(e))
             return False if ret_boolean else "Failed to get xkcd '{}' - {}".format(url, str(e))
 
         months = {
@@ -156,11 +161,11 @@ class Title(moduletemplate.BotModule):
 
         json = None
         try:
-            r = requests.get(api_url, params=payload)
+            r = self.httpGet(api_url, payload, ttl=3600)
             r.raise_for_status()
             json = r.json()
         except Exception as e:
-            self.warning("Failed to retrieve wikipedia article '{}' - {}".format(article, str(e)))
+            self.warning("Failed to retrieve wikipedia article '{}' - {}", article, str(e))
             return False if ret_boolean else "Failed to retrieve wikipedia article '{}' - {}".format(article, str(e))
 
         if "query" in json and "pages" in json["query"]:
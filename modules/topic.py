@@ -48,9 +48,7 @@ class Topic(moduletemplate.BotModule):
         if numeric == 332:
 
             if self.checking_topic:
-                splitdata = data.split()
-                if self.checking_topic == splitdata[3].lower():
+                if self.checking_topic == data.param(1, "").lower():
                     self.message(self.checking_topic, None, "Topic for {}: {}"
-                                                            .format(self.checking_topic,
-                                                                    " ".join(splitdata[4:])[1:]))
+                                                            .format(self.checking_topic, data.param(2, "")))
                     self.checking_topic = False
@@ -29,8 +29,6 @@ Validate webpages using W3's validation tool.
 
 from core import moduletemplate
 
-import requests
-
 
 class W3Validate(moduletemplate.BotModule):
 
@@ -52,10 +50,10 @@ class W3Validate(moduletemplate.BotModule):
 
         r = None
         try:
-            r = requests.get(val_link)
+            r = self.httpGet(val_link)
             r.raise_for_status()
         except Exception as e:
-            self.warning("Validation for '{}' failed: {}".format(website, str(e)))
+            self.warning("Validation for '{}' failed: {}", website, str(e))
             return "Validation for '{}' failed: {}".format(website, str(e))
 
         valid = r.headers["x-w3c-validator-status"].lower()
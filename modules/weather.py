@@ -33,7 +33,6 @@ If you are unsure what settings are safe, use the default.
 from core import moduletemplate
 from tools import duration
 
-import requests
 import time
 
 
@@ -61,8 +60,8 @@ class Weather(moduletemplate.BotModule):
 
         if self.module_data["forecasts_max"] > 5:
             self.warning("Too high value: Weather forecasts_max is set to {}, "
-                         "maximum value: 5. Please edit your configuration and lower this value."
-                         .format(self.module_data["forecasts_max"]))
+                         "maximum value: 5. Please edit your configuration and lower this value.",
+                         self.module_data["forecasts_max"])
             self.module_data["forecasts_max"] = 5
 
         if "forecasts_ignore_night" not in self.module_data:
@@ -122,12 +121,12 @@ class Weather(moduletemplate.BotModule):
 
         json = None
         try:
-            r = requests.get(api_url)
+            r = self.httpGet(api_url, ttl=600)
 
             r.raise_for_status()
             json = r.json()
         except Exception as e:
-            self.error("Could not find weather information for {}: {}".format(location, str(e)))
+            self.error("Could not find weather information for {}: {}", location, str(e))
             return "Could not find weather information for {}: {}".format(location, str(e))
 
         contents = ""
@@ -146,12 +145,12 @@ class Weather(moduletemplate.BotModule):
             lookup_url = "http://api.wunderground.com/api/{}/alerts/forecast/geolookup{}.json".format(api_key, loc)
             json = None
             try:
-                r = requests.get(lookup_url)
+                r = self.httpGet(lookup_url, ttl=600)
 
                 r.raise_for_status()
                 json = r.json()
             except Exception as e:
-                self.error("Could not lookup weather information for {}: {}".format(location, str(e)))
+                self.error("Could not lookup weather information for {}: {}", location, str(e))
                 return "Could not lookup weather information for {}: {}".format(location, str(e))
 
             try:
@@ -160,13 +159,13 @@ class Weather(moduletemplate.BotModule):
                 # The same happens underneath
                 contents = self.parse_weather(json)
             except Exception as e:
-                self.error("Error parsing forecast: {}".format(str(e)))
+                self.error("Error parsing forecast: {}", str(e))
                 return "Error parsing forecast: {}".format(str(e))
         elif "forecast" in json:
             try:
                 contents = self.parse_weather(json)
             except Exception as e:
-                self.error("Error parsing forecast: {}".format(str(e)))
+                self.error("Error parsing forecast: {}", str(e))
                 return "Error parsing forecast: {}".format(str(e))
 
         if contents:
@@ -30,7 +30,6 @@ This will require you to fill in the WolframAlpha API key in the configuration.
 
 from core import moduletemplate
 
-import requests
 import urllib.parse
 import xml.etree.ElementTree as et
 import time
@@ -75,7 +74,8 @@ class WolframAlpha(moduletemplate.BotModule):
 
         # Handle the request
         self.last_request = int(time.time())
-        apidata = requests.get("http://api.wolframalpha.com/v2/query", params={"input": query, "appid": api_key})
+        apidata = self.httpGet("http://api.wolframalpha.com/v2/query", {"input": query, "appid": api_key},
+                               ttl=3600)
         root = et.fromstring(apidata.text)
 
         if root.attrib["success"] == "false":
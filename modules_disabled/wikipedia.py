@@ -31,36 +31,40 @@ This module in itself collides with title.py. It is not required to run both at
 from core import moduletemplate
 
 import re
-import requests
 
 
 class Wikipedia(moduletemplate.BotModule):
+    # Most lines link no article, on_privmsg looks for one itself and only submits the lines that do.
+    blocking_hooks = []
 
     def on_module_load(self):
         self.wikipedia_url = re.compile(r"(https?:\/\/)?([a-z]{2}\.)?wikipedia\.[a-z]{1,3}\/wiki\/(.{1,32})")
 
     def on_privmsg(self, target, nick, message):
         if self.wikipedia_url.search(message):
-            for word in message.split():
-                match = self.wikipedia_url.match(word)
-                if match:
-                    groups = match.groups()
-                    groups_len = len(groups)
-                    article = groups[groups_len - 1]
-
-                    language = ""
-                    if groups_len > 1:
-                        if len(groups[groups_len - 2]) == 3:
-                            language = groups[groups_len - 2]
-
-                    if not language:
-                        language = "en"
-                    if language.endswith("."):
-                        language = language[:-1]
-
-                    info = self.get_wiki_info(language, article, True)
-                    if info:
-                        self.message(target, None, "({}) {}".format(nick, info), True)
+            self.submit(target, self.send_wiki_info, target, nick, message)
+
+    def send_wiki_info(self, target, nick, message):
+        for word in message.split():
+            match = self.wikipedia_url.match(word)
+            if match:
+                groups = match.groups()
+                groups_len = len(groups)
+                article = groups[groups_len - 1]
+
+                language = ""
+                if groups_len > 1:
+                    if len(groups[groups_len - 2]) == 3:
+                        language = groups[groups_len - 2]
+
+                if not language:
+                    language = "en"
+                if language.endswith("."):
+                    language = language[:-1]
+
+                info = self.get_wiki_info(language, article, True)
+                if info:
+                    self.message(target, None, "({}) {}".format(nick, info), True)
 
     def get_wiki_info(self, language, article, ret_boolean=False):
         api_url = "http://{}.wikipedia.org/w/api.php".format(language)
@@ -77,7 +81,7 @@ class Wikipedia(moduletemplate.BotModule):
 
         json = None
         try:
-            r = requests.get(api_url, params=payload)
+            r = self.httpGet(api_url, payload, ttl=3600)
             r.raise_for_status()
             json = r.json()
         except Exception as e:
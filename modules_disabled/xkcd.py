@@ -31,21 +31,25 @@ This module in itself collides with title.py. It is not required to run both at
 from core import moduletemplate
 
 import re
-import requests
 
 
 class Xkcd(moduletemplate.BotModule):
+    # Most lines link no xkcd, on_privmsg looks for one itself and only submits the lines that do.
+    blocking_hooks = []
 
     def on_module_load(self):
         self.xkcdurl = re.compile(r"(https?:\/\/)?xkcd\.com\/[0-9]{1,5}\/?")
 
     def on_privmsg(self, target, nick, message):
         if self.xkcdurl.search(message):
-            for word in message.split():
-                if self.xkcdurl.match(word):
-                    info = self.get_xkcd_info(word)
-                    if info:
-                        self.message(target, None, "({}) {}".format(nick, info), True)
+            self.submit(target, self.send_xkcd_info, target, nick, message)
+
+    def send_xkcd_info(self, target, nick, message):
+        for word in message.split():
+            if self.xkcdurl.match(word):
+                info = self.get_xkcd_info(word)
+                if info:
+                    self.message(target, None, "({}) {}".format(nick, info), True)
 
     def get_xkcd_info(self, url, ret_boolean=False):
         if not url.endswith("/"):
@@ -54,7 +58,7 @@ class Xkcd(moduletemplate.BotModule):
         json = None
 
         try:
-            r = requests.get("{}info.0.json".format(url))
+            r = self.httpGet("{}info.0.json".format(url), ttl=86400)
             r.raise_for_status()
             json = r.json()
         except Exception as e:
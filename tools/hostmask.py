@@ -21,11 +21,18 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 
+
 Hostmask.py - used for altering and validating hostmasks.
+
+A Matcher compiles a list of masks into one regular expression, so checking a hostmask against all of them is a
+single match. Masks without wildcards are looked up in a set instead. Results are remembered per nick until their
+hostmask changes or forget() is called.
 """
 
 import re
-from tools import validator
+
+
+CACHE_SIZE = 4096  # Nicks a Matcher remembers the result for, it starts over once it has this many.
 
 
 def match(hostmask, matchhost, require_nickname=False):
@@ -35,12 +42,65 @@ def match(hostmask, matchhost, require_nickname=False):
     You may include the name (anything before !) but it is not required.
     """
 
-    valid = validator.Validator()
+    return Matcher([matchhost]).match(hostmask)
+
+
+def toRegex(mask):
+    """Return the regular expression for a mask, * matches anything and ? any single character."""
+    return re.escape(mask).replace(r"\*", ".*").replace(r"\?", ".")
+
+
+class Matcher:
+
+    def __init__(self, masks, cache_size=CACHE_SIZE):
+        """
+        masks: list of strings, like nick!user@host with * and ? as wildcards. Masks without a nick match any nick,
+               masks without a @ are not valid and are listed in the invalid attribute.
+        """
+
+        self.masks = []
+        self.invalid = []
+        self.cache_size = cache_size
+        self.cache = {}  # nick (lowercase): (hostmask, whether it matched)
+
+        exact = set()
+        patterns = []
+
+        for mask in masks:
+            if "@" not in mask:
+                self.invalid.append(mask)
+                continue
+
+            mask = mask.lower()
+            if "!" not in mask:
+                mask = "*!" + mask
+
+            self.masks.append(mask)
+            if "*" in mask or "?" in mask:
+                patterns.append(toRegex(mask))
+            else:
+                exact.add(mask)
+
+        self.exact = frozenset(exact)
+        self.regex = re.compile(r"(?:{})\Z".format("|".join(patterns)), re.S) if patterns else None
+
+    def match(self, hostmask):
+        """Return True if hostmask (nick!user@host) matches any of the masks, case insensitively."""
+        nick = hostmask.partition("!")[0].lower()
+
+        cached = self.cache.get(nick)
+        if cached is not None and cached[0] == hostmask:
+            return cached[1]
+
+        lowered = hostmask.lower()
+        result = lowered in self.exact or (self.regex is not None and self.regex.match(lowered) is not None)
 
-    if valid.hostmask(hostmask) and valid.hostmask(matchhost):
-        mh = re.escape(matchhost).replace(r"\*", ".*")
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[nick] = (hostmask, result)
 
-        if re.match(mh, hostmask):
-            return True
+        return result
 
-    return False
+    def forget(self, nick):
+        """Forget the result for nick, their nick or host changed."""
+        self.cache.pop(nick.lower(), None)
@@ -0,0 +1,229 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2014 - 2015 Jos "Zarthus" Ahrens and contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+
+httpclient.py
+Make the HTTP requests of modules and tools over connections that are kept alive.
+
+Every host gets a requests.Session of its own, whose connection pool lets later requests reuse the connection
+(and the DNS lookup and TLS handshake) of earlier ones. Users paste URLs of any host, so only the sessions of the
+hosts used most recently are kept, the others are closed. Requests get default timeouts and a user agent, responses
+larger than the maximum size are refused instead of read into memory. How long the requests to each host take is
+measured, to find the API that makes a module slow.
+"""
+
+import collections
+import threading
+import time
+import urllib.parse
+
+import requests
+import requests.adapters
+
+
+CONNECT_TIMEOUT = 5  # Seconds to wait for a connection to be made.
+READ_TIMEOUT = 15  # Seconds to wait for the server to send data.
+MAX_SIZE = 2 * 1024 * 1024  # Bytes a response may be, larger ones raise ResponseTooLarge.
+POOL_SIZE = 4  # Connections kept alive per host, we have a handful of worker threads.
+MAX_HOSTS = 32  # Hosts whose sessions (and statistics) are kept, the least recently used ones are dropped.
+CHUNK_SIZE = 16384
+USER_AGENT = "Reconcile IRC Bot"
+
+REQUESTS = 0
+ERRORS = 1
+TOTAL = 2
+MAX = 3
+
+
+class ResponseTooLarge(requests.RequestException):
+    pass
+
+
+class HttpClient:
+    def __init__(self, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), max_size=MAX_SIZE, user_agent=USER_AGENT,
+                 pool_size=POOL_SIZE, max_hosts=MAX_HOSTS):
+        """
+        timeout: tuple of the connect and read timeout in seconds.
+        max_size: integer, bytes a response may be at most.
+        user_agent: string, sent with every request that does not set a User-Agent header of its own.
+        pool_size: integer, connections to keep alive per host.
+        max_hosts: integer, hosts to keep sessions and statistics for, least recently used first.
+        """
+
+        self.timeout = timeout
+        self.max_size = max_size
+        self.user_agent = user_agent
+        self.pool_size = pool_size
+        self.max_hosts = max_hosts
+
+        self.lock = threading.Lock()  # Requests are made from the worker threads.
+        self.sessions = collections.OrderedDict()  # scheme://host[:port]: requests.Session, least recently used first
+        self.hosts = collections.OrderedDict()  # host: [requests, errors, total seconds, max seconds]
+
+    def request(self, method, url, **kwargs):
+        """
+        requests.request(method, url, **kwargs) on the session of the host. Returns a requests.Response.
+
+        A timeout passed in kwargs replaces the default one. Raises ResponseTooLarge if the body exceeds the
+        maximum size, and the exceptions requests raises when a request fails.
+        """
+
+        kwargs.setdefault("timeout", self.timeout)
+        kwargs["stream"] = True
+
+        parts = urllib.parse.urlsplit(url)
+        session = self._getSession("{}://{}".format(parts.scheme, parts.netloc).lower())
+
+        start = time.perf_counter()
+        failed = True
+
+        try:
+            response = session.request(method, url, **kwargs)
+            try:
+                self._read(response)
+            finally:
+                response.close()  # Gives the connection back to the pool.
+            failed = False
+        finally:
+            self._measure(parts.hostname or parts.netloc, time.perf_counter() - start, failed)
+
+        return response
+
+    def get(self, url, params=None, **kwargs):
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request("POST", url, data=data, **kwargs)
+
+    def close(self):
+        """Close every kept alive connection, the next request to a host opens a new one."""
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions = collections.OrderedDict()
+
+        for session in sessions:
+            session.close()
+
+    def getStats(self):
+        """Return {host: (requests, errors, average milliseconds, maximum milliseconds)}."""
+        with self.lock:
+            return {host: (stats[REQUESTS], stats[ERRORS], stats[TOTAL] / stats[REQUESTS] * 1000, stats[MAX] * 1000)
+                    for host, stats in self.hosts.items()}
+
+    def resetStats(self):
+        with self.lock:
+            self.hosts = collections.OrderedDict()
+
+    def _getSession(self, origin):
+        evicted = []
+
+        with self.lock:
+            session = self.sessions.get(origin)
+
+            if session:
+                self.sessions.move_to_end(origin)
+            else:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[origin] = session
+
+                while len(self.sessions) > self.max_hosts:
+                    evicted.append(self.sessions.popitem(False)[1])
+
+            session.headers["User-Agent"] = self.user_agent
+
+        # Requests still running on an evicted session finish, their connection is not kept alive afterwards.
+        for old in evicted:
+            old.close()
+
+        return session
+
+    def _read(self, response):
+        """Read the body of response, unless it is larger than we allow."""
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > self.max_size:
+            raise ResponseTooLarge("Response of {} bytes exceeds the maximum of {} bytes."
+                                   .format(length, self.max_size))
+
+        body = bytearray()
+        for chunk in response.iter_content(CHUNK_SIZE):
+            body += chunk
+            if len(body) > self.max_size:
+                raise ResponseTooLarge("Response exceeds the maximum of {} bytes.".format(self.max_size))
+
+        # The body is read, the response behaves as if it was not streamed.
+        response._content = bytes(body)
+        response._content_consumed = True
+
+    def _measure(self, host, seconds, failed):
+        with self.lock:
+            stats = self.hosts.get(host)
+            if stats:
+                self.hosts.move_to_end(host)
+            else:
+                stats = self.hosts[host] = [0, 0, 0.0, 0.0]
+                while len(self.hosts) > self.max_hosts:
+                    self.hosts.popitem(False)
+
+            stats[REQUESTS] += 1
+            stats[TOTAL] += seconds
+            stats[MAX] = max(stats[MAX], seconds)
+            if failed:
+                stats[ERRORS] += 1
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def getClient():
+    """Return the HttpClient shared by every module and tool, with the defaults if configure() was not called."""
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HttpClient()
+
+    return _client
+
+
+def configure(timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), max_size=MAX_SIZE, user_agent=USER_AGENT):
+    """Change the settings of the shared HttpClient, kept alive connections stay open."""
+    client = getClient()
+    client.timeout = timeout
+    client.max_size = max_size
+    client.user_agent = user_agent
+    return client
+
+
+def get(url, params=None, **kwargs):
+    """Make a GET request with the shared HttpClient, see HttpClient.request()."""
+    return getClient().get(url, params, **kwargs)
+
+
+def post(url, data=None, **kwargs):
+    """Make a POST request with the shared HttpClient, see HttpClient.request()."""
+    return getClient().post(url, data, **kwargs)
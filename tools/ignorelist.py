@@ -20,65 +20,121 @@ AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
 LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
+
+ignorelist.py
+Decide whether events from a hostmask should be ignored.
+
+Every event is checked against the ignore list, so the list is compiled once: entries without wildcards are looked
+up in a set, the others are combined into a single regular expression. Results are kept in a bounded LRU cache keyed
+by hostmask, as the same few users tend to send most lines. Adding or removing entries recompiles the list.
+
+Entries ignored or unignored while the bot runs are not written to the configuration, they stay that way when the
+configured entries are reloaded on rehash, until the bot restarts.
 """
 
+import collections
 import re
 
+from tools import hostmask
+
+
+CACHE_SIZE = 2048  # Hostmasks we remember the result for, the least recently checked ones are dropped first.
+WILDCARD = 0  # Marks the cache keys of masks checked with isIgnoredWildcard().
+
 
 class IgnoreList:
-    def __init__(self, ignorelist):
-        if ignorelist:
-            self.ignorelist = ignorelist
-        else:
-            self.ignorelist = []
+    def __init__(self, ignorelist, cache_size=CACHE_SIZE):
+        self.cache_size = cache_size
+        self.added = []  # Entries ignore() added, they are kept when the configured entries are reloaded.
+        self.removed = set()  # Entries unignore() removed, likewise.
+
+        self.reload(ignorelist)
+
+    def reload(self, ignorelist):
+        """Replace the entries from the configuration, keeping the changes ignore() and unignore() made."""
+        # Entries are kept in lowercase, in a list of our own so the configuration is left as it was read.
+        entries = [entry.lower() for entry in ignorelist or [] if entry.lower() not in self.removed]
+        self.ignorelist = entries + [entry for entry in self.added if entry not in entries]
+        self._compile()
+
+    def _compile(self):
+        """Compile the entries, and start the cache over. Entries match case insensitively, * and ? are wildcards."""
+        exact = set()
+        patterns = []
+
+        for entry in self.ignorelist:
+            if "*" in entry or "?" in entry:
+                patterns.append(hostmask.toRegex(entry))
+            else:
+                exact.add(entry)
+
+        self.exact = frozenset(exact)
+        self.regex = re.compile(r"(?:{})\Z".format("|".join(patterns)), re.S) if patterns else None
+        # hostmask (lowercase): whether it is ignored, (WILDCARD, mask) for the results of isIgnoredWildcard().
+        self.cache = collections.OrderedDict()
 
     def isIgnored(self, target):
-        if target.lower() in self.ignorelist:
-            return True
+        target = target.lower()
 
-        for user in self.ignorelist:
-            if "*" in user:
-                userRegex = self.compileIgnore(user)
-                if userRegex.match(target):
-                    return True
+        ignored = self._cached(target)
+        if ignored is None:
+            ignored = target in self.exact or (self.regex is not None and self.regex.match(target) is not None)
+            self._remember(target, ignored)
 
-        return False
+        return ignored
 
     def isIgnoredWildcard(self, wctarget):
-        if "*" not in wctarget:
+        """Like isIgnored, but wctarget may have wildcards itself: it is ignored when it matches an entry, too."""
+        if "*" not in wctarget and "?" not in wctarget:
             return self.isIgnored(wctarget)
 
-        target = self.compileIgnore(wctarget)
+        key = (WILDCARD, wctarget.lower())
+        ignored = self._cached(key)
+
+        if ignored is None:
+            target = self.compileIgnore(wctarget)
+            ignored = any(target.match(user) for user in self.ignorelist) or self.isIgnored(wctarget)
+            self._remember(key, ignored)
 
-        for user in self.ignorelist:
-            if target.match(user):
-                return True
+        return ignored
 
-            if "*" in user:
-                userRegex = self.compileIgnore(user)
-                if userRegex.match(wctarget):
-                    return True
+    def _cached(self, key):
+        """Return the cached result for key, None if there is none."""
+        ignored = self.cache.get(key)
+        if ignored is not None:
+            self.cache.move_to_end(key)
+        return ignored
 
-        return False
+    def _remember(self, key, ignored):
+        self.cache[key] = ignored
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(False)
 
     def ignore(self, target):
-        if target.lower() in self.ignorelist:
+        target = target.lower()
+        if target in self.ignorelist:
             return False
 
-        self.ignorelist.append(target.lower())
+        self.ignorelist.append(target)
+        self.added.append(target)
+        self.removed.discard(target)
+        self._compile()
         return True
 
     def unignore(self, target):
-        if target.lower() in self.ignorelist:
-            self.ignorelist.remove(target.lower())
-            return True
+        target = target.lower()
+        if target not in self.ignorelist:
+            return False
 
-        return False
+        self.ignorelist.remove(target)
+        if target in self.added:
+            self.added.remove(target)
+        self.removed.add(target)
+        self._compile()
+        return True
 
     def getIgnoreList(self):
         return self.ignorelist
 
     def compileIgnore(self, target):
-        return re.compile(re.escape(target)
-                            .replace("\\*", ".*")
-                            .replace("\\?", "."), re.I)
+        return re.compile(hostmask.toRegex(target) + r"\Z", re.I | re.S)
@@ -22,45 +22,312 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 
 Logger class for the bot
+
+Logging never waits on the console or the disk: lines are handed to a single LogWriter thread that is shared by all
+loggers. It writes them in batches, keeps its log files open, and starts a new file every day or once a file grows
+past the configured size. Files are optionally compressed once they are closed, whether they were rotated or closed
+on rehash or shutdown. Call flush() to wait until everything logged so far is written, it happens on rehash and on
+shutdown.
+
+With events enabled, every IRC event is also recorded as one JSON object per line in <network>.events.<date>.jsonl,
+which benchmarks/replay.py can feed back to the bot.
+
+Messages have a level, those below the level of the logger (or the threshold of the module logging them) are
+dropped before their text is even formatted.
 """
 
-import time
+import atexit
+import gzip
+import json
 import os
+import queue
+import shutil
+import sys
+import threading
+import time
+
+
+BATCH_SIZE = 500  # The maximum amount of lines the writer handles before it flushes its files.
+FLUSH_TIMEOUT = 5  # Seconds flush() waits for the writer at most.
+
+WRITE = 0
+FLUSH = 1
+STOP = 2
+
+# Log levels, a Logger only logs messages of its level or above.
+VERBOSE = 10  # log_verbose(), notice_verbose()
+EVENT = 20  # event(), what happens on IRC.
+INFO = 30  # log(), debug()
+NOTICE = 40  # notice(), warning()
+ERROR = 50  # error()
+
+LEVELS = {"verbose": VERBOSE, "event": EVENT, "info": INFO, "notice": NOTICE, "warning": NOTICE, "error": ERROR}
+
+
+class LogWriter(threading.Thread):
+    def __init__(self, max_size=0, compress=False):
+        """
+        max_size: integer, bytes after which a log file is rotated, 0 to only rotate by date.
+        compress: boolean, gzip log files once they are closed.
+        """
+
+        super().__init__(name="LogWriter")
+        self.daemon = True
+
+        self.queue = queue.Queue()
+        self.max_size = max_size
+        self.compress = compress
+        self.files = {}  # (directory, name, extension): [path, file object]
+
+    def write(self, console, directory, name, line, dated=True, extension=".log"):
+        """
+        Queue a line, returns immediately.
+
+        console: string to print, or None.
+        directory: the log directory, or None to not write line to disk.
+        name: the name of the log file, without extension. The date is appended to it if dated is True.
+        """
+
+        self.queue.put((WRITE, console, directory, name, line, dated, extension))
+
+    def flush(self, close=False, timeout=FLUSH_TIMEOUT):
+        """Wait until everything queued so far is written, close the log files as well if close is True."""
+        if not self.is_alive():
+            return
+
+        done = threading.Event()
+        self.queue.put((FLUSH, done, close))
+        done.wait(timeout)
+
+    def stop(self):
+        if self.is_alive():
+            self.queue.put((STOP,))
+            self.join(FLUSH_TIMEOUT)
+
+    def run(self):
+        running = True
+
+        while running:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < BATCH_SIZE:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            console = []
+            lines = {}  # (directory, name, dated, extension): [lines]
+            requests = []
+
+            for item in batch:
+                if item[0] == WRITE:
+                    if item[1] is not None:
+                        console.append(item[1])
+                    if item[2]:
+                        lines.setdefault(item[2:4] + item[5:], []).append(item[4])
+                elif item[0] == FLUSH:
+                    requests.append(item)
+                else:
+                    running = False
+
+            try:
+                if console:
+                    sys.stdout.write("\n".join(console) + "\n")
+                    sys.stdout.flush()
+
+                date = time.strftime(".%Y-%m-%d")
+                for (directory, name, dated, extension), text in lines.items():
+                    self._writeFile(directory, name, date if dated else "", extension, text)
+
+                if any(item[2] for item in requests) or not running:
+                    self._closeFiles()
+            except Exception as e:
+                sys.stderr.write("LogWriter: failed to write {} lines: {}\n".format(len(batch), str(e)))
+
+            for item in requests:
+                item[1].set()
+
+    def _writeFile(self, directory, name, date, extension, lines):
+        key = (directory, name, extension)
+        path = os.path.join(directory, name + date + extension)
+
+        current = self.files.get(key)
+        if current and current[0] != path:  # The date changed.
+            self._close(key)
+            current = None
+
+        if not current:
+            current = self.files[key] = [path, open(path, "a")]
+
+        current[1].write("\n".join(lines) + "\n")
+        current[1].flush()
+
+        if self.max_size and current[1].tell() >= self.max_size:
+            self._close(key, True)
+
+    def _close(self, key, rotate=False):
+        """
+        Close the file of key, rename it out of the way first if rotate is True.
+
+        A file that is opened again after it was compressed (it is closed on every rehash) is added to the same .gz
+        file, gzip reads the members of it as one file.
+        """
+        path, f = self.files.pop(key)
+        f.close()
+
+        if rotate:
+            base, extension = os.path.splitext(path)
+            number = 1
+            while os.path.exists("{}.{}{}".format(base, number, extension)) or \
+                    os.path.exists("{}.{}{}.gz".format(base, number, extension)):
+                number += 1
+
+            rotated = "{}.{}{}".format(base, number, extension)
+            os.rename(path, rotated)
+            path = rotated
+        elif not self.compress or not os.path.isfile(path):
+            return
+
+        if self.compress:
+            with open(path, "rb") as source, gzip.open(path + ".gz", "ab") as target:
+                shutil.copyfileobj(source, target)
+            os.remove(path)
+
+    def _closeFiles(self):
+        for key in list(self.files):
+            self._close(key)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def getWriter():
+    """Return the LogWriter, it is started the first time something is logged."""
+    global _writer
+
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                writer = LogWriter()
+                writer.start()
+                atexit.register(writer.stop)
+                _writer = writer
+
+    return _writer
+
+
+def configure(max_size=0, compress=False):
+    """Set how log files are rotated, see LogWriter."""
+    writer = getWriter()
+    writer.max_size = max_size
+    writer.compress = compress
+
+
+def flush(close=False):
+    """Wait until everything that was logged has been written, see LogWriter.flush()."""
+    if _writer is not None:
+        _writer.flush(close)
+
+
+def getLevel(level):
+    """Return the level constant for level, which may be one already or the name of one. None if it is neither."""
+    if isinstance(level, str):
+        return LEVELS.get(level.lower())
+    if level in LEVELS.values():
+        return level
+    return None
 
 
 class Logger:
     def __init__(self, network_name, logDir=False, verbose=False,
-                 timestamp="%H:%M", logTimestamp="%Y-%m-%d %H:%M:%S", useColours=True):
+                 timestamp="%H:%M", logTimestamp="%Y-%m-%d %H:%M:%S", useColours=True, level=None, events=False):
+        """
+        level: the level messages need to be logged, one of the level constants or its name.
+               None lets verbose decide between VERBOSE and EVENT.
+        events: boolean, record IRC events as JSON lines as well (see record()), requires logDir.
+        """
+
         self.network_name = network_name
+        self.thresholds = {}  # source (module name): level, overriding self.level for that source.
+
+        self._writer = getWriter()
+        self.reconfigure(logDir, verbose, timestamp, logTimestamp, useColours, level, events)
+
+    def reconfigure(self, logDir=False, verbose=False, timestamp="%H:%M", logTimestamp="%Y-%m-%d %H:%M:%S",
+                    useColours=True, level=None, events=False):
+        """Change the settings of this logger, see __init__. Thresholds set for sources are kept."""
         self.logging = True if logDir else False
         self.logDir = logDir
-        self.verbose = verbose
         self.timestamp = timestamp
         self.logTimestamp = logTimestamp
+        self.events = bool(events) and self.logging
         self._setColours(useColours)
 
-    def log(self, text):
-        print("{} {} | {}".format(self.getTimestamp(), self.network_name, text))
-        self._write("[{}] {}".format(self.getLogTimestamp(), text))
+        self.configured_level = getLevel(level)
+        self.setVerbose(verbose)
+
+        self._stamp_second = None  # Timestamps are formatted once per second at most.
+        self._stamps = None
+
+    # Every method below takes the text as a template, followed by the arguments to format it with:
+    # logger.log_verbose("Joined {} ({} users)", channel, users) only formats the text if VERBOSE is logged.
+    # Text that is not followed by arguments is logged as it is.
+    # source is the name of the module logging the message, it is prefixed to the text and may have a threshold
+    # of its own.
+
+    def log(self, text, *args, source=None):
+        if self.isEnabledFor(INFO, source):
+            stamp, logstamp = self._getTimestamps()
+            text = self._text(text, args, source)
+            self._output("{} {} | {}".format(stamp, self.network_name, text), "[{}] {}".format(logstamp, text))
+
+    def warning(self, text, *args, source=None):
+        self.notice(text, *args, source=source)
+
+    def notice(self, text, *args, source=None):
+        if self.isEnabledFor(NOTICE, source):
+            stamp, logstamp = self._getTimestamps()
+            text = self._text(text, args, source)
+            self._output("{}{} {} | Notice: {}{}".format(self.col_notice_prefix, stamp, self.network_name, text,
+                                                         self.col_notice_suffix),
+                         "[{}] [NOTICE] {}".format(logstamp, text))
+
+    def error(self, text, *args, source=None):
+        if self.isEnabledFor(ERROR, source):
+            stamp, logstamp = self._getTimestamps()
+            text = self._text(text, args, source)
+            self._output("{}{} {} | Error: {}{}".format(self.col_error_prefix, stamp, self.network_name, text,
+                                                        self.col_error_suffix),
+                         "[{}] [ERROR] {}".format(logstamp, text))
+
+    def event(self, event, text, *args, source=None):
+        if self.isEnabledFor(EVENT, source):
+            stamp, logstamp = self._getTimestamps()
+            text = self._text(text, args, source)
+            self._output("{} {} | {} - {}".format(stamp, self.network_name, event, text),
+                         "[{}] [{}] {}".format(logstamp, event, text))
+
+    def record(self, event, nick, target, params, user=None, host=None, tags=None):
+        """
+        Record an IRC event in the structured event log, if it is enabled.
 
-    def warning(self, text):
-        self.notice(text)
+        Unlike event() nothing is printed, and the fields are kept apart so the line can be read back:
+        {"timestamp": 1425211200.0, "network": "Esper", "event": "PRIVMSG", "nick": "nick", "user": "~user",
+         "host": "host", "target": "#channel", "params": ["Hello!"]}
+        """
 
-    def notice(self, text):
-        print("{}{} {} | Notice: {}{}".format(self.col_notice_prefix, self.getTimestamp(), self.network_name, text,
-                                              self.col_notice_suffix))
-        self._write("[{}] [NOTICE] {}".format(self.getLogTimestamp(), text))
+        if not self.events:
+            return
 
-    def error(self, text):
-        print("{}{} {} | Error: {}{}".format(self.col_error_prefix, self.getTimestamp(), self.network_name, text,
-                                             self.col_error_suffix))
-        self._write("[{}] [ERROR] {}".format(self.getLogTimestamp(), text))
+        data = {"timestamp": round(time.time(), 3), "network": self.network_name, "event": event, "nick": nick,
+                "user": user, "host": host, "target": target, "params": params}
+        if tags:
+            data["tags"] = tags
 
-    def event(self, event, text):
-        print("{} {} | {} - {}".format(self.getTimestamp(), self.network_name, event, text))
-        self._write("[{}] [{}] {}".format(self.getLogTimestamp(), event, text))
+        self._writer.write(None, self.logDir, self.network_name + ".events", json.dumps(data), True, ".jsonl")
 
-    def debug(self, text):
+    def debug(self, text, *args, source=None):
         """
         debug() should be used with care, if you need to log something, use log_verbose, if something went wrong
         that normally shouldn't, use debug()
@@ -68,34 +335,76 @@ class Logger:
         in short, if the user should see the message, use debug(), if it's rather irrelevant, use log_verbose
         """
 
-        print("{}{} {} | Debug: {}{}".format(self.col_debug_prefix, self.getTimestamp(), self.network_name, text,
-                                             self.col_debug_suffix))
-        self._write("[{}] [DEBUG] {}".format(self.getLogTimestamp(), text))
-
-    def log_verbose(self, text):
-        if self.verbose:
-            print("{} {} | {}".format(self.getTimestamp(), self.network_name, text))
-            self._write("[{}] [VERBOSE] {}".format(self.getLogTimestamp(), text))
+        if self.isEnabledFor(INFO, source):
+            stamp, logstamp = self._getTimestamps()
+            text = self._text(text, args, source)
+            self._output("{}{} {} | Debug: {}{}".format(self.col_debug_prefix, stamp, self.network_name, text,
+                                                        self.col_debug_suffix),
+                         "[{}] [DEBUG] {}".format(logstamp, text))
+
+    def log_verbose(self, text, *args, source=None):
+        if self.isEnabledFor(VERBOSE, source):
+            stamp, logstamp = self._getTimestamps()
+            text = self._text(text, args, source)
+            self._output("{} {} | {}".format(stamp, self.network_name, text),
+                         "[{}] [VERBOSE] {}".format(logstamp, text))
+
+    def notice_verbose(self, text, *args, source=None):
+        if self.isEnabledFor(VERBOSE, source):
+            stamp, logstamp = self._getTimestamps()
+            text = self._text(text, args, source)
+            self._output("{} {} | Notice: {}".format(stamp, self.network_name, text),
+                         "[{}] [VERBOSE] [NOTICE] {}".format(logstamp, text))
+
+    def isEnabledFor(self, level, source=None):
+        """Return True if messages of level (from source) are logged."""
+        if source is not None and source in self.thresholds:
+            return level >= self.thresholds[source]
+        return level >= self.level
+
+    def setThreshold(self, source, level):
+        """Log messages from source from level on, regardless of the level of this logger. None removes it."""
+        level = getLevel(level)
+
+        if level is None:
+            self.thresholds.pop(source, None)
+        else:
+            self.thresholds[source] = level
 
-    def notice_verbose(self, text):
-        if self.verbose:
-            print("{} {} | Notice: {}".format(self.getTimestamp(), self.network_name, text))
-            self._write("[{}] [VERBOSE] [NOTICE] {}".format(self.getLogTimestamp(), text))
+    def flush(self, close=False):
+        """Wait until everything logged so far has been written."""
+        self._writer.flush(close)
 
     def setVerbose(self, verbose):
         self.verbose = verbose
 
+        if verbose:
+            self.level = VERBOSE
+        else:
+            self.level = self.configured_level if self.configured_level is not None else EVENT
+
     def setTimestamp(self, timestamp):
         self.timestamp = timestamp
+        self._stamp_second = None
 
     def getTimestamp(self):
-        return time.strftime(self.timestamp)
+        return self._getTimestamps()[0]
 
     def setLogTimestamp(self, timestamp):
         self.logTimestamp = timestamp
+        self._stamp_second = None
 
     def getLogTimestamp(self):
-        return time.strftime(self.logTimestamp)
+        return self._getTimestamps()[1]
+
+    def _getTimestamps(self):
+        now = int(time.time())
+
+        if now != self._stamp_second:
+            self._stamps = (time.strftime(self.timestamp), time.strftime(self.logTimestamp))
+            self._stamp_second = now
+
+        return self._stamps
 
     def _setColours(self, useColours=True):
         if useColours:
@@ -123,21 +432,24 @@ class Logger:
         self.col_debug_prefix = ""
         self.col_debug_suffix = ""
 
+    def _text(self, text, args, source):
+        if args:
+            text = text.format(*args)
+        if source is not None:
+            text = "({}) {}".format(source, text)
+        return text
+
+    def _output(self, console, line):
+        self._writer.write(console, self.logDir if self.logging else None, self.network_name, line)
+
     def _write(self, message, file=None):
         """Log content to disk."""
         if not self.logging:
             return
         if not file:
-            file = self.network_name + time.strftime(".%Y-%m-%d") + ".log"
-        if not file.endswith(".log"):
-            file = file + ".log"
-
-        logfile = os.path.join(self.logDir, file)
-
-        if not os.path.isfile(logfile):
-            f = open(logfile, "w")
-        else:
-            f = open(logfile, "a")
+            self._writer.write(None, self.logDir, self.network_name, message)
+            return
+        if file.endswith(".log"):
+            file = file[:-len(".log")]
 
-        f.write(message + "\n")
-        f.close()
+        self._writer.write(None, self.logDir, file, message, False)
@@ -25,7 +25,8 @@ paste.py by Zarthus,
 Licensed under MIT
 """
 
-import requests
+from tools import httpclient
+
 import json
 
 
@@ -67,7 +68,7 @@ class Paste:
         returnurl = ""
 
         try:
-            r = requests.post(url, data=json.dumps(payload))
+            r = httpclient.post(url, json.dumps(payload))
 
             if r.ok and "html_url" in r.json():
                 returnurl = r.json()["html_url"]
@@ -109,7 +110,7 @@ class Paste:
         returnurl = ""
 
         try:
-            r = requests.post(url, data=json.dumps(payload))
+            r = httpclient.post(url, json.dumps(payload))
 
             if r.ok and "html_url" in r.json():
                 returnurl = r.json()["html_url"]
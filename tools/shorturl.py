@@ -25,7 +25,8 @@ shorturl.py by Zarthus,
 Licensed under MIT
 """
 
-import requests
+from tools import httpclient
+
 import json
 
 
@@ -61,7 +62,7 @@ class ShortUrl:
 
         shorturl = ""
         try:
-            r = requests.post(googl, data=json.dumps(payload), headers=header)
+            r = httpclient.post(googl, json.dumps(payload), headers=header)
 
             if r.ok and "id" in r.json():
                 shorturl = r.json()["id"]
@@ -95,7 +96,7 @@ class ShortUrl:
         shorturl = ""
 
         try:
-            r = requests.get(isgd, params=payload)
+            r = httpclient.get(isgd, payload)
 
             if r.ok and "shorturl" in r.json():
                 shorturl = r.json()["shorturl"]
@@ -137,7 +138,7 @@ class ShortUrl:
         shorturl = ""
 
         try:
-            r = requests.get(scenesat, params=payload)
+            r = httpclient.get(scenesat, payload)
 
             if r.ok and "shorturl" in r.json():
                 shorturl = r.json()["shorturl"]
@@ -26,8 +26,8 @@ UrlTools: Interact and manipulate URLs
 
 import html
 import bs4
-import urllib.request
 
+from tools import httpclient
 from tools import shorturl
 from tools import urlparse
 
@@ -68,7 +68,9 @@ class UrlTools:
             return None
 
         try:
-            soup = bs4.BeautifulSoup(urllib.request.urlopen(url))
+            r = httpclient.get(url)
+            r.raise_for_status()
+            soup = bs4.BeautifulSoup(r.content)
         except Exception as e:
             return "Failed to parse '{}' with error '{}'".format(url, str(e)) if not ret_false else False
 